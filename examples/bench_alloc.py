@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Count the memory blocks allocated per line by ``dispatch()`` with
+tracemalloc. This is what is kept until the callbacks run (matches, handles,
+values).
+
+``before`` convert all the groups of each match to a dict of
+:class:`~irc3.utils.IrcString` (the old behavior). ``after`` use
+:class:`~irc3.utils.IrcMatch`.
+
+Usage::
+
+    $ python examples/bench_alloc.py
+"""
+from bench_dispatch import LINES
+from bench_dispatch import get_bot
+from irc3.compat import asyncio
+from irc3 import utils
+import tracemalloc
+
+
+def eager_dispatch(bot, data, iotype='in', client=None):
+    str = utils.IrcString
+    call_soon = bot.loop.call_soon
+    for match, events in bot.registry.get_event_matches(data, iotype):
+        match = match.groupdict()
+        for key, value in match.items():
+            if value is not None:
+                match[key] = str(value)
+        if match.get("tags", True) is None:
+            del match["tags"]
+        for e in events:
+            call_soon(e.async_callback, match)
+
+
+def measure(bot, dispatch, number=100):
+    loop = bot.loop
+
+    def drain():
+        loop.call_soon(loop.stop)
+        loop.run_forever()
+
+    def run():
+        for i in range(number):
+            for line in LINES:
+                dispatch(line)
+
+    run()
+    drain()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    run()
+    pending = tracemalloc.take_snapshot()
+    drain()
+    tracemalloc.stop()
+    lines = number * len(LINES)
+    stats = pending.compare_to(before, 'filename')
+    blocks = sum(s.count_diff for s in stats) / lines
+    size = sum(s.size_diff for s in stats) / lines
+    return blocks, size
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    bot = get_bot()
+    bot.loop = loop
+    bot.create_task = loop.create_task
+    print('%-8s %14s %14s' % ('', 'blocks/line', 'bytes/line'))
+    for name, dispatch in (
+            ('before', lambda line: eager_dispatch(bot, line)),
+            ('after', bot.dispatch)):
+        blocks, size = measure(bot, dispatch)
+        print('%-8s %14.1f %14.1f' % (name, blocks, size))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
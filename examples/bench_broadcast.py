@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Measure the fan-out of a ``PRIVMSG`` to a channel by ``irc3d``: from the
+broadcast of the line sent by a client until the bytes are buffered by all
+the other members of the channel.
+
+``before`` writes the line to each member with ``client.write()`` (an ``out``
+dispatch and an encode per member). ``after`` use
+:meth:`~irc3d.IrcServer.write_many`. Each case run with no ``out`` event
+and with a catch-all ``out`` event (like :mod:`irc3.plugins.log`).
+
+Usage::
+
+    $ python examples/bench_broadcast.py
+"""
+from irc3.compat import asyncio
+import irc3d
+import timeit
+
+
+class Transport:
+
+    def __init__(self, i):
+        self.peername = ('127.0.0.1', i)
+
+    def get_extra_info(self, name):
+        return self.peername
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def before(self, client=None, clients=None, **kwargs):
+    clients = [self.get_client(c) for c in clients]
+    for c in clients:
+        c.write(kwargs['broadcast'])
+
+
+def server_factory(loop, size):
+    server = irc3d.IrcServer(loop=loop, level=1000,
+                             includes=['irc3d.plugins.core'])
+    channel = server.channels['#irc3']
+    for i in range(size):
+        client = irc3d.IrcClient()
+        client.factory = server
+        client.connection_made(Transport(i))
+        client.data.update(username='u%s' % i, realname='u%s' % i)
+        client.nick = 'client%s' % i
+        client.channels.add('#irc3')
+        server.nicks[client.nick] = client
+        channel.add(client.nick)
+    return server, client
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    number = 20
+    print('%-6s %12s %12s %12s %12s' % (
+        'size', 'before', 'after', 'before/out', 'after/out'))
+    for size in (10, 100, 1000, 2000, 5000):
+        server, client = server_factory(loop, size)
+        plugin = server.get_plugin(
+            'irc3d.plugins.userlist.ServerUserlist')
+        broadcast = plugin.broadcast
+        clients = server.channels['#irc3'].difference({client.nick})
+        line = ':%s PRIVMSG #irc3 :Hello world!' % client.mask
+
+        def run():
+            plugin.broadcast(client=client, clients=clients, broadcast=line)
+            for c in server.clients.values():
+                c.write_buffer = []
+                c.write_size = 0
+
+        results = []
+        for out in (False, True):
+            if out:
+                server.attach_events(irc3d.event(
+                    r'^(?P<raw>.*)', lambda **kw: None, iotype='out'))
+            for func in (before.__get__(plugin), broadcast):
+                plugin.broadcast = func
+                results.append(min(timeit.repeat(
+                    run, number=number, repeat=10)) / number)
+        # run scheduled flushes
+        loop.run_until_complete(asyncio.sleep(0))
+        print('%-6s %10.0fus %10.0fus %10.0fus %10.0fus' % (
+            size, *[r * 1e6 for r in results]))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
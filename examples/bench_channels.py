@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Measure the memory used by the channels of
+:mod:`irc3.plugins.userlist` on a synthetic network: 200 channels of 500
+users (100k memberships). 20k users are on 5 channels. 2% of the members are
+ops and 10% are voiced.
+
+``set`` is the previous ``Channel``: a ``set`` of nicks and a set of nicks per
+prefix. ``compact`` is :class:`~irc3.plugins.userlist.Channel`. Nicks are new
+strings for each membership, like when they are parsed from IRC lines. Then
+the network is loaded in a bot with ``RPL_NAMREPLY`` lines.
+
+Usage::
+
+    $ python examples/bench_channels.py
+"""
+from irc3.plugins.userlist import Channel
+from irc3.testing import IrcBot
+from collections import defaultdict
+from irc3 import utils
+import tracemalloc
+import functools
+import time
+
+CHANNELS = 200
+MEMBERS = 500
+USERS = 20000
+
+
+class SetChannel(set):
+
+    def __init__(self):
+        set.__init__(self)
+        self.modes = defaultdict(set)
+        self.topic = None
+
+    def add(self, item, modes=''):
+        set.add(self, item)
+        for mode in modes:
+            self.modes[mode].add(item)
+
+
+def network():
+    for c in range(CHANNELS):
+        members = []
+        for m in range(MEMBERS):
+            i = (c * MEMBERS + m) % USERS
+            prefix = '@' if i % 50 == 0 else '+' if i % 10 == 1 else ''
+            members.append((prefix, 'user%d' % i))
+        yield '#chan%d' % c, members
+
+
+def load(factory):
+    channels = {}
+    for name, members in network():
+        channel = channels[name] = factory()
+        for prefix, nick in members:
+            channel.add(nick, modes=prefix)
+    return channels
+
+
+def load_compact():
+    users = utils.IrcDict()
+    channels = load(functools.partial(Channel, users))
+    assert len(users) == USERS
+    assert len(users['user0'].channels) == MEMBERS * CHANNELS // USERS
+    return channels
+
+
+def load_bot():
+    bot = IrcBot(nick='irc3')
+    bot.include('irc3.plugins.userlist')
+    for name, members in network():
+        for i in range(0, MEMBERS, 50):
+            nicks = ' '.join(p + n for p, n in members[i:i + 50])
+            bot.dispatch(':srv 353 irc3 = %s :%s' % (name, nicks))
+    return bot
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    duration = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    result = func(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return duration, size, result
+
+
+def main():
+    memberships = CHANNELS * MEMBERS
+    print('%-10s %10s %12s %10s' % ('', 'time', 'memory', 'B/member'))
+    cases = [
+        ('set', load, SetChannel),
+        ('compact', load_compact),
+        ('bot', load_bot),
+    ]
+    for case in cases:
+        duration, size, result = measure(*case[1:])
+        print('%-10s %8.0fms %10.1fMB %10.0f' % (
+            case[0], duration * 1e3, size / 1024 ** 2, size / memberships))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Measure the commands of ``irc3d`` (:mod:`irc3d.plugins.command`) from
+``on_command`` until the reply is buffered.
+
+``before`` build the docopt parser for each line (like
+``docopt.docopt()``). ``after`` use the parser cached by
+:func:`~irc3.plugins.command.get_parser`.
+
+Usage::
+
+    $ python examples/bench_commands.py
+"""
+from irc3.plugins.command import get_parser
+from irc3.compat import asyncio
+import irc3d
+import timeit
+
+
+class Transport:
+
+    def __init__(self, i):
+        self.peername = ('127.0.0.1', i)
+
+    def get_extra_info(self, name):
+        return self.peername
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def server_factory(loop):
+    server = irc3d.IrcServer(loop=loop, level=1000,
+                             includes=['irc3d.plugins.core'])
+    clients = []
+    for i in range(2):
+        client = irc3d.IrcClient()
+        client.factory = server
+        client.connection_made(Transport(i))
+        client.data.update(username='u%s' % i, realname='u%s' % i)
+        client.nick = 'client%s' % i
+        server.nicks[client.nick] = client
+        clients.append(client)
+    return server, clients
+
+
+CASES = [
+    ('PING', ':irc.com'),
+    ('JOIN', '#irc3'),
+    ('PRIVMSG', 'client1 :Hello world!'),
+    ('NOTICE', '#irc3 :Hello world!'),
+    ('ISON', 'client0 client1 client2'),
+    ('WHOIS', 'client1'),
+]
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    server, (client, other) = server_factory(loop)
+    plugin = server.get_plugin('irc3d.plugins.command.ServerCommands')
+    number = 2000
+    print('%-10s %10s %10s' % ('', 'before', 'after'))
+    for cmd, data in CASES:
+
+        def after():
+            plugin.on_command(cmd, client=client, data=data)
+            client.write_buffer = []
+            client.write_size = 0
+            other.write_buffer = []
+            other.write_size = 0
+
+        def before():
+            get_parser.cache_clear()
+            after()
+
+        results = []
+        for func in (before, after):
+            results.append(min(timeit.repeat(
+                func, number=number, repeat=10)) / number)
+        print('%-10s %8.1fus %8.1fus' % (cmd, *[r * 1e6 for r in results]))
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Compare the number of regexps tried per line (and the time spent) by the
+old linear scan of ``registry.events_re`` and the command-keyed index.
+
+Usage::
+
+    $ python examples/bench_dispatch.py
+"""
+from irc3.testing import IrcBot
+from irc3 import base
+from irc3 import rfc
+import timeit
+import irc3
+
+LINES = [
+    ':gawel!u@host PRIVMSG #irc3 :hello world',
+    ':gawel!u@host PRIVMSG #irc3 :!echo foo',
+    ':gawel!u@host NOTICE nono :\x01VERSION\x01',
+    ':gawel!u@host JOIN #irc3',
+    ':gawel!u@host QUIT :bye',
+    ':gawel!u@host MODE #irc3 +o nono',
+    ':srv 353 nono = #irc3 :nono @gawel +foo',
+    ':srv 372 nono :- message of the day',
+    'PING :srv',
+]
+
+
+def noop(**kwargs):
+    pass
+
+
+def get_bot():
+    bot = IrcBot(nick='nono')
+    bot.include(
+        'irc3.plugins.core',
+        'irc3.plugins.userlist',
+        'irc3.plugins.command',
+        'irc3.plugins.ctcp',
+        'irc3.plugins.autojoins',
+    )
+    # emulate a bot with a lot of plugins
+    events = []
+    for name in dir(rfc):
+        value = getattr(rfc, name)
+        if getattr(value, 're', None) and len(events) < 150:
+            events.append(irc3.event(value, noop))
+    bot.attach_events(*events)
+    return bot
+
+
+def linear(registry, data, iotype='in'):
+    events = registry.events[iotype]
+    for regexp, cregexp in registry.events_re[iotype]:
+        match = cregexp(data)
+        if match is not None:
+            yield match, events[regexp]
+
+
+def main():
+    bot = get_bot()
+    reg = bot.registry
+    total = len(reg.events_re['in'])
+    buckets, wildcard = reg.get_index('in')
+    print('%d events, %d buckets, %d wildcard' % (
+        total, len(buckets), len(wildcard)))
+    print('')
+    print('%-48s %8s %8s' % ('line', 'before', 'after'))
+    for line in LINES:
+        cmd = base._re_command(line).group(1)
+        tried = len(buckets.get(cmd, wildcard))
+        print('%-48r %8d %8d' % (line[:46], total, tried))
+    print('')
+    number = 2000
+    before = timeit.timeit(
+        lambda: [list(linear(reg, line)) for line in LINES], number=number)
+    after = timeit.timeit(
+        lambda: [list(reg.get_event_matches(line)) for line in LINES],
+        number=number)
+    lines = number * len(LINES)
+    print('before: %.2fus/line' % (before / lines * 1e6))
+    print('after:  %.2fus/line' % (after / lines * 1e6))
+
+
+if __name__ == '__main__':
+    main()
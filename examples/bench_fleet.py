@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Create N bots (like ``examples/benches.py``) with and without a
+:class:`~irc3.fleet.Fleet`. Show the time and the memory per bot. Memory is
+measured with tracemalloc in a second run.
+
+Bots get a fake transport. A few lines are dispatched to each bot so the
+events indexes are built.
+
+Usage::
+
+    $ python examples/bench_fleet.py [N]
+"""
+from irc3.compat import asyncio
+from irc3.fleet import Fleet
+import tracemalloc
+import irc3
+import time
+import sys
+
+CONFIG = dict(
+    includes=['irc3.plugins.core', 'irc3.plugins.ctcp',
+              'irc3.plugins.userlist', 'irc3.plugins.command'],
+    asynchronous=False)
+
+LINES = [
+    'PING :irc.com',
+    ':gawel!u@h PRIVMSG #irc3 :Hello',
+    ':gawel!u@h JOIN #irc3',
+]
+
+
+class Transport:
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def create(loop, amount, fleet=None):
+    bots = []
+    for i in range(amount):
+        nick = 'malkovitch%s' % i
+        if fleet is not None:
+            bot = fleet.add(nick, nick=nick)
+        else:
+            bot = irc3.IrcBot(loop=loop, nick=nick, **CONFIG)
+        bot.protocol = protocol = irc3.IrcConnection()
+        protocol.factory = bot
+        protocol.encoding = bot.encoding
+        protocol.connection_made(Transport())
+        for line in LINES:
+            bot.dispatch(line)
+        bots.append(bot)
+    return bots
+
+
+def measure(loop, amount, use_fleet):
+    results = []
+    for trace in (False, True):
+        fleet = Fleet(CONFIG, loop=loop) if use_fleet else None
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        bots = create(loop, amount, fleet=fleet)
+        results.append(time.perf_counter() - start)
+        if trace:
+            results[-1] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+        loop.run_until_complete(asyncio.sleep(0))
+        del bots
+    return results
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    loop = asyncio.new_event_loop()
+    # warm up imports and regexps caches
+    create(loop, 1)
+    print('%-10s %8s %10s %10s' % ('', 'bots', 'time/bot', 'mem/bot'))
+    for n in (amount // 10, amount):
+        for name in ('no fleet', 'fleet'):
+            duration, size = measure(loop, n, name == 'fleet')
+            print('%-10s %8d %8.2fms %8.1fKB' % (
+                name, n, duration / n * 1e3, size / n / 1024))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Measure the framing of received data: from the chunks read on the socket
+to the list of decoded lines.
+
+``baseline`` is the code used by ``IrcConnection`` before
+:class:`~irc3.utils.LineFramer` (decode the chunk, split on ``\\r\\n`` and
+keep the tail in a deque). Chunks of 1400 bytes (a tcp segment) and of 64KB
+(a burst read) are framed. ``buffered`` includes the copy of the chunk in the
+buffer, done by ``recv_into()`` in a real protocol.
+
+Usage::
+
+    $ python examples/bench_framer.py
+"""
+from collections import deque
+from irc3 import utils
+import timeit
+
+LINE = b':gawel!user@host PRIVMSG #irc3 :hello world, this is a line\r\n'
+LINES = 20000
+
+
+class Baseline:
+
+    def __init__(self):
+        self.queue = deque()
+
+    def feed(self, data, decode=utils._decode):
+        data = decode(data)
+        if self.queue:
+            data = self.queue.popleft() + data
+        lines = data.split('\r\n')
+        self.queue.append(lines.pop(-1))
+        return lines
+
+
+def chunks(size):
+    data = LINE * LINES
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class Buffered(utils.BufferedLineFramer):
+    """Write the chunks in the buffer like ``recv_into()`` does"""
+
+    __slots__ = ()
+
+    def __init__(self):
+        # always room for a 64KB chunk
+        super().__init__(size=1 << 18, min_free=65536)
+
+    def feed(self, data):
+        size = len(data)
+        self.get_buffer()[:size] = data
+        return self.buffer_updated(size)
+
+
+def bench(factory, data):
+    def run():
+        feed = factory().feed
+        for chunk in data:
+            feed(chunk)
+    return min(timeit.repeat(run, number=5, repeat=5)) / 5 / LINES
+
+
+def main():
+    print('%-8s %12s %12s %12s' % ('chunk', 'baseline', 'framer',
+                                   'buffered'))
+    for size in (1400, 65536):
+        data = chunks(size)
+        results = [bench(f, data) for f in (
+            Baseline, utils.LineFramer, Buffered)]
+        print('%-8s %10.0fns %10.0fns %10.0fns' % (
+            size, *[r * 1e9 for r in results]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Compare the per-pattern loop with merged regexps (``merged_events =
+true``):
+
+- ``plugins``: time per line for a bot with a lot of plugins (see
+  ``bench_dispatch.py``). Most events are indexed by command
+
+- ``wildcards``: time per line with 100 events which may match any command
+
+- ``whois``: cost of attaching / detaching temporary events like
+  :mod:`irc3.asynchronous` does on each WHOIS
+
+Usage::
+
+    $ python examples/bench_merged.py
+"""
+from bench_dispatch import LINES
+from bench_dispatch import get_bot
+from bench_dispatch import noop
+from irc3.plugins.asynchronious import Whois
+from irc3.testing import IrcBot
+import itertools
+import timeit
+import irc3
+
+WILDCARD = (r'(?i)^(@(?P<tags>\S+) )?:(?P<mask>\S+) privmsg{0} '
+            r'(?P<target>\S+) :(?P<data>.*)')
+
+
+def matches(reg):
+    for line in LINES:
+        for match, events in reg.get_event_matches(line):
+            match.groupdict()
+
+
+def whois(bot, nicks):
+    nick = next(nicks)
+    events = [irc3.event(e['match'].format(nick=nick), noop)
+              for e in Whois.events]
+    bot.attach_events(*events, insert=True)
+    bot.dispatch(':srv 311 nono %s u h * :real name' % nick)
+    bot.dispatch(':srv 318 nono %s :End' % nick)
+    bot.detach_events(*events)
+
+
+def main():
+    number = 2000
+    lines = number * len(LINES)
+    print('%-8s %12s %12s %12s' % ('', 'plugins', 'wildcards', 'whois'))
+    for merged in (False, True):
+        bot = get_bot()
+        bot.registry.merged = merged
+        plugins = timeit.timeit(lambda: matches(bot.registry), number=number)
+
+        wbot = IrcBot(nick='nono', merged_events=merged)
+        wbot.attach_events(*[irc3.event(WILDCARD.format(i), noop)
+                             for i in range(100)])
+        wildcards = timeit.timeit(lambda: matches(wbot.registry),
+                                  number=number)
+
+        nicks = itertools.cycle(['gawel%d' % i for i in range(50)])
+        churn = timeit.timeit(lambda: whois(bot, nicks),
+                              number=number // 10)
+        print('%-8s %10.2fus %10.2fus %10.2fus' % (
+            merged and 'merged' or 'loop',
+            plugins / lines * 1e6,
+            wildcards / lines * 1e6,
+            churn / (number // 10) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Compare the throughput (lines/s) of :class:`~irc3.IrcConnection` and
+:class:`~irc3.IrcBufferedConnection` over a local tcp connection.
+
+Usage::
+
+    $ python examples/bench_protocol.py
+"""
+from irc3.compat import asyncio
+import irc3
+import time
+
+LINE = b':gawel!user@host PRIVMSG #irc3 :hello world, this is a line\r\n'
+LINES = 200000
+
+
+class Factory:
+
+    def __init__(self, loop):
+        self.count = 0
+        self.done = loop.create_future()
+
+    def dispatch(self, line):
+        self.count += 1
+        if self.count == LINES:
+            self.done.set_result(time.perf_counter())
+
+
+async def run(loop, connection):
+    factory = Factory(loop)
+    protocol = type(connection.__name__, (connection,), dict(
+        factory=factory, encoding='utf8',
+        connection_lost=lambda self, exc: None))
+    server = await loop.create_server(protocol, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    data = LINE * 1000
+    start = time.perf_counter()
+    for i in range(LINES // 1000):
+        writer.write(data)
+        await writer.drain()
+    end = await factory.done
+    writer.close()
+    server.close()
+    await server.wait_closed()
+    return LINES / (end - start)
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    for connection in (irc3.IrcConnection, irc3.IrcBufferedConnection):
+        results = [loop.run_until_complete(run(loop, connection))
+                   for i in range(3)]
+        print('%-24s %10d lines/s' % (connection.__name__, max(results)))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
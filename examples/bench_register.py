@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Measure the time to ``server_ready`` (``bot.registration_delay``) against
+a fake local server which answers after ``RTT`` seconds.
+
+Cases are: no capability, two capabilities and two capabilities + SASL. Each
+bot connects twice. On reconnection, the capabilities are requested with
+``CAP LS``.
+
+Usage::
+
+    $ python examples/bench_register.py
+"""
+from irc3.compat import asyncio
+import irc3
+
+RTT = .05
+
+CAPS = 'multi-prefix sasl draft/multiline=max-bytes=4096 away-notify'
+
+
+class Server:
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.registered = set()
+        self.negotiating = False
+
+    async def reply(self, *lines):
+        await asyncio.sleep(RTT)
+        self.writer.write(b''.join(
+            line.encode('utf8') + b'\r\n' for line in lines))
+
+    async def run(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            line = line.decode('utf8').strip()
+            cmd, _, args = line.partition(' ')
+            replies = []
+            if line.startswith('CAP LS'):
+                self.negotiating = True
+                replies.append(':srv CAP * LS :' + CAPS)
+            elif line.startswith('CAP REQ'):
+                replies.append(':srv CAP * ACK ' + args[4:])
+            elif line == 'CAP END':
+                self.negotiating = False
+            elif line == 'AUTHENTICATE PLAIN':
+                replies.append('AUTHENTICATE +')
+            elif cmd == 'AUTHENTICATE':
+                replies.append(':srv 903 irc3 :SASL authentication successful')
+            elif cmd in ('NICK', 'USER'):
+                self.registered.add(cmd)
+            if len(self.registered) == 2 and not self.negotiating:
+                self.registered.add('done')
+                replies.extend([':srv 001 irc3 :Welcome',
+                                ':srv 376 irc3 :End of /MOTD command.'])
+            if replies:
+                asyncio.ensure_future(self.reply(*replies))
+
+
+async def register(bot):
+    bot.registration_delay = None
+    bot.create_connection()
+    while bot.registration_delay is None:
+        await asyncio.sleep(.001)
+    bot.protocol.close()
+    return bot.registration_delay
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def handler(reader, writer):
+        await Server(reader, writer).run()
+
+    server = loop.run_until_complete(
+        asyncio.start_server(handler, '127.0.0.1', 0))
+    port = server.sockets[0].getsockname()[1]
+    for name, config in [
+            ('no caps', {}),
+            ('caps', dict(capabilities='multi-prefix draft/multiline')),
+            ('caps+sasl', dict(capabilities='multi-prefix draft/multiline',
+                               sasl_username='irc3', sasl_password='pwd')),
+    ]:
+        bot = irc3.IrcBot(loop=loop, host='127.0.0.1', port=port,
+                          nick='irc3', level=1000,
+                          includes=['irc3.plugins.core'], **config)
+        for i in range(2):
+            delay = loop.run_until_complete(register(bot))
+            print('%-22s %6.1fms %4.1f RTT' % (
+                name + (' (reconnect)' if i else ''), delay * 1e3,
+                delay / RTT))
+        bot.awaiting_queue.cancel()
+    server.close()
+    loop.run_until_complete(asyncio.sleep(.1))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Measure the outgoing path: :meth:`~irc3.IrcBot.privmsg` (or ``mode``)
+until the bytes are buffered by the connection.
+
+The bot is not asynchronous so lines are written without queuing. The
+transport only counts the bytes. Each case run with no ``out`` event, with a
+catch-all ``out`` event (like :mod:`irc3.plugins.log`) and with the same
+event and ``defer_out_events = true``.
+
+Usage::
+
+    $ python examples/bench_send.py
+"""
+from irc3.compat import asyncio
+import irc3
+import timeit
+
+
+class Transport:
+
+    size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def close(self):
+        pass
+
+
+def bot_factory(loop, **config):
+    bot = irc3.IrcBot(loop=loop, asynchronous=False, level=1000, **config)
+    bot.protocol = protocol = irc3.IrcConnection()
+    protocol.factory = bot
+    protocol.encoding = bot.encoding
+    protocol.connection_made(Transport())
+    return bot
+
+
+CASES = [
+    ('privmsg/short', lambda bot: bot.privmsg('#irc3', 'Hello world!')),
+    ('privmsg/long', lambda bot: bot.privmsg(
+        '#irc3', 'lorem ipsum dolor sit amet ' * 50)),
+    ('privmsg/utf8', lambda bot: bot.privmsg(
+        '#irc3', 'déjà vu à la française ' * 5)),
+    ('ctcp', lambda bot: bot.ctcp('gawel', 'VERSION')),
+    ('mode', lambda bot: bot.mode('#irc3', '+o', 'gawel')),
+]
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    bots = [bot_factory(loop), bot_factory(loop),
+            bot_factory(loop, defer_out_events=True)]
+    for bot in bots[1:]:
+        bot.attach_events(irc3.event(r'^(?P<raw>.*)', lambda **kw: None,
+                                     iotype='out'))
+    number = 2000
+    print('%-16s %10s %10s %10s' % ('', 'no event', 'catch-all', 'deferred'))
+    for name, func in CASES:
+        results = []
+        for bot in bots:
+            results.append(min(timeit.repeat(
+                lambda: func(bot), number=number, repeat=50)) / number)
+            bot.protocol.flush()
+            # run scheduled callbacks
+            loop.run_until_complete(asyncio.sleep(0))
+        print('%-16s %8.2fus %8.2fus %8.2fus' % (
+            name, *[r * 1e6 for r in results]))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
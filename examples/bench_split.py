@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Compare :func:`~irc3.utils.split_message` with the previous
+implementation (``before``) which decoded the chunk again for each byte
+removed.
+
+Texts are 16KB of ascii, latin-1 (encoded as utf8 and latin-1) and 4 bytes
+chars (emoji), split in 400 bytes chunks. ``nospace`` texts have no space at
+all. ``stream`` use :func:`~irc3.utils.split_stream` with 100 chars pieces.
+
+Usage::
+
+    $ python examples/bench_split.py
+"""
+from irc3 import utils
+import timeit
+
+SPACE = ' '
+
+
+def old_split_message(message, max_bytes, encoding, prefix=''):
+    prefix_bytes = len(prefix.encode(encoding))
+    max_bytes -= prefix_bytes
+    byte_message = message.encode(encoding)
+    message_bytes = len(byte_message)
+    start = 0
+    while start < message_bytes:
+        end = min(start + max_bytes, message_bytes)
+        chunk = byte_message[start:end]
+        while True:
+            valid = True
+            try:
+                chunk_str = chunk.decode(encoding, errors='strict')
+            except UnicodeDecodeError:
+                valid = False
+            valid = valid and (
+                end == message_bytes or chunk_str[-1] == SPACE or SPACE
+                not in chunk_str
+            )
+            if valid:
+                break
+            chunk = chunk[:-1]
+            end -= 1
+        if start == 0:
+            clean = chunk_str.rstrip(SPACE)
+        else:
+            clean = chunk_str.strip(SPACE)
+        if clean:
+            yield clean
+        start = end
+
+
+def text(word, size=16384):
+    return (word * (size // len(word.encode('utf8')) + 1))
+
+
+TEXTS = [
+    ('ascii', 'utf8', text('lorem ipsum dolor sit amet ')),
+    ('latin-1/utf8', 'utf8', text('déjà vu à la française ')),
+    ('latin-1', 'latin-1', text('déjà vu à la française ')),
+    ('emoji', 'utf8', text('\U0001f600\U0001f389\U0001f680 ')),
+    ('ascii/nospace', 'utf8', text('loremipsum')),
+    ('emoji/nospace', 'utf8', text('\U0001f600\U0001f389\U0001f680')),
+]
+
+
+def main():
+    number = 200
+    print('%-16s %12s %12s %12s' % ('', 'before', 'after', 'stream'))
+    for name, encoding, message in TEXTS:
+        assert list(old_split_message(message, 400, encoding)) == \
+            list(utils.split_message(message, 400, encoding))
+        pieces = [message[i:i + 100] for i in range(0, len(message), 100)]
+        results = []
+        for func in (
+                lambda: list(old_split_message(message, 400, encoding)),
+                lambda: list(utils.split_message(message, 400, encoding)),
+                lambda: list(utils.split_stream(pieces, 400, encoding))):
+            results.append(timeit.timeit(func, number=number) / number)
+        print('%-16s %10.1fus %10.1fus %10.1fus' % (
+            name, *[r * 1e6 for r in results]))
+
+
+if __name__ == '__main__':
+    main()
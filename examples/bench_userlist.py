@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Measure :mod:`irc3.plugins.userlist` on QUIT, PART and NICK when the bot
+sits in many channels. A user is on 2 channels. Each channel has 10 users.
+
+Usage::
+
+    $ python examples/bench_userlist.py
+"""
+from irc3.testing import IrcBot
+import timeit
+
+
+def bot_factory(size):
+    bot = IrcBot(nick='irc3')
+    bot.include('irc3.plugins.core', 'irc3.plugins.userlist')
+    for i in range(size):
+        nicks = ' '.join('user%s' % ((i * 10 + j) // 2) for j in range(10))
+        bot.dispatch(':srv 353 irc3 = #chan%s :%s' % (i, nicks))
+    return bot
+
+
+CASES = [
+    ('QUIT', [':gawel!u@h JOIN #chan1', ':gawel!u@h JOIN #chan2',
+              ':gawel!u@h QUIT :bye']),
+    ('PART', [':gawel!u@h JOIN #chan1', ':gawel!u@h PART #chan1']),
+    ('NICK', [':gawel!u@h JOIN #chan1', ':gawel!u@h NICK gawel_',
+              ':gawel_!u@h NICK gawel']),
+]
+
+
+def main():
+    number = 1000
+    sizes = (10, 100, 1000, 5000)
+    print('%-6s' % 'chans' + ''.join('%10s' % c for c, l in CASES))
+    for size in sizes:
+        bot = bot_factory(size)
+        results = []
+        for case, lines in CASES:
+
+            def run():
+                for line in lines:
+                    bot.dispatch(line)
+
+            results.append(min(timeit.repeat(
+                run, number=number, repeat=5)) / number)
+        print('%-6s' % size + ''.join('%8.1fus' % (r * 1e6) for r in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Measure the messages delivered per second by ``irc3d`` run with
+:mod:`irc3d.workers` for 1, 2 and 4 workers.
+
+Clients are spread in channels of 10 users. Each client sends ``PRIVMSG`` to
+its channel. Clients are run by some load processes. The time is measured
+from the first ``PRIVMSG`` until all clients received all messages.
+
+Usage::
+
+    $ python examples/bench_workers.py [CLIENTS] [MESSAGES]
+"""
+from irc3.compat import asyncio
+from irc3d import workers
+import multiprocessing
+import socket
+import time
+import sys
+
+CHANNEL_SIZE = 10
+
+
+def serve(port, amount):
+    config = dict(servername='irc.com', host='127.0.0.1', port=port,
+                  level=1000, includes=['irc3d.plugins.core'])
+    workers.run(config, amount)
+
+
+async def client(i, port, messages, joined, start):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(('NICK n{0}\r\nUSER u{0} h s :r{0}\r\n'
+                  'JOIN #c{1}\r\n').format(i, i // CHANNEL_SIZE).encode())
+    while b' 366 ' not in await reader.readline():
+        pass
+    joined()
+    await start.wait()
+    expected = (CHANNEL_SIZE - 1) * messages
+    line = 'PRIVMSG #c{0} :Hello world\r\n'.format(i // CHANNEL_SIZE)
+    writer.write(line.encode() * messages)
+    while expected:
+        if b' PRIVMSG ' in await reader.readline():
+            expected -= 1
+    writer.close()
+
+
+def load(clients, port, messages, barrier, results):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    start = asyncio.Event()
+    pending = [len(clients)]
+
+    def joined():
+        pending[0] -= 1
+        if not pending[0]:
+            # wait for the other load processes and the bus
+            barrier.wait()
+            time.sleep(.5)
+            barrier.wait()
+            results.put(time.perf_counter())
+            start.set()
+
+    tasks = [client(i, port, messages, joined, start) for i in clients]
+    loop.run_until_complete(asyncio.gather(*tasks))
+    results.put(time.perf_counter())
+
+
+def bench(amount, clients, messages, loaders=4):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = multiprocessing.Process(target=serve, args=(port, amount))
+    server.start()
+    time.sleep(1)
+    barrier = multiprocessing.Barrier(loaders)
+    results = multiprocessing.Queue()
+    procs = []
+    for i in range(loaders):
+        procs.append(multiprocessing.Process(
+            target=load, args=(range(i, clients, loaders), port, messages,
+                               barrier, results)))
+    for p in procs:
+        p.start()
+    times = [results.get() for i in range(loaders * 2)]
+    for p in procs:
+        p.join()
+    server.terminate()
+    server.join()
+    return min(times), max(times)
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    delivered = clients * messages * (CHANNEL_SIZE - 1)
+    print('%-8s %10s %12s %12s' % ('workers', 'time', 'sent/s', 'recv/s'))
+    for amount in (1, 2, 4):
+        start, end = bench(amount, clients, messages)
+        duration = end - start
+        print('%-8s %8.2fs %12.0f %12.0f' % (
+            amount, duration, clients * messages / duration,
+            delivered / duration))
+
+
+if __name__ == '__main__':
+    main()
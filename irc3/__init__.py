@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 from urllib.request import urlopen
 from ipaddress import ip_address
-from collections import deque
 from .dcc import DCCManager
 from .dcc import DCCChat
 from .dec import dcc_event
@@ -11,20 +10,27 @@ from .dec import plugin
 from . import config
 from . import utils
 from . import rfc
+from . import message
 from . import base
+from .sendq import SendQueue
+from .sendq import TokenBucket
+from .reconnect import Reconnect
+from .reconnect import parse_servers
+from .fleet import Fleet
 from .compat import asyncio
-from .compat import Queue
+import itertools
 import venusian
 import time
 
 
-class IrcConnection(asyncio.Protocol):
+class IrcConnection(base.BufferedWriter, asyncio.Protocol):
     """asyncio protocol to handle an irc connection"""
 
     def connection_made(self, transport):
         self.transport = transport
         self.closed = False
-        self.queue = deque()
+        self.framer = utils.LineFramer()
+        self.init_writer()
 
     def decode(self, data):
         """Decode data with bot's encoding"""
@@ -32,46 +38,75 @@ class IrcConnection(asyncio.Protocol):
         return data.decode(encoding, 'ignore')
 
     def data_received(self, data):
-        data = self.decode(data)
-        if self.queue:
-            data = self.queue.popleft() + data
-        lines = data.split('\r\n')
-        self.queue.append(lines.pop(-1))
-        for line in lines:
-            self.factory.dispatch(line)
-
-    def write(self, data):
-        if data is not None:
+        dispatch = self.factory.dispatch
+        for line in self.framer.feed(data, self.decode):
+            dispatch(line)
+
+    def write(self, data, encoded=None):
+        """Write a line. ``encoded`` is the line already encoded and ending
+        with CRLF"""
+        if encoded is not None:
+            self.buffer_write(encoded)
+        elif data is not None:
             data = data.encode(self.encoding)
             if not data.endswith(b'\r\n'):
                 data = data + b'\r\n'
-            self.transport.write(data)
+            self.buffer_write(data)
+
+    def pause_writing(self):
+        super(IrcConnection, self).pause_writing()
+        queue = getattr(self.factory, 'queue', None)
+        if queue is not None:
+            queue.pause()
+
+    def resume_writing(self):
+        super(IrcConnection, self).resume_writing()
+        queue = getattr(self.factory, 'queue', None)
+        if queue is not None:
+            queue.resume()
 
     def connection_lost(self, exc):
         self.factory.log.critical('connection lost (%s): %r',
                                   id(self.transport),
                                   exc)
+        self.stop_writer()
         self.factory.notify('connection_lost')
         if not self.closed:
             self.close()
-            # wait a few before reconnect
-            self.factory.loop.call_later(
-                2, self.factory.create_connection)
+            self.factory.schedule_reconnect()
 
     def close(self):
         if not self.closed:
             self.factory.log.critical('closing old transport (%r)',
                                       id(self.transport))
             try:
+                self.flush(force=True)
                 self.transport.close()
             finally:
                 self.closed = True
 
 
+class IrcBufferedConnection(IrcConnection, asyncio.BufferedProtocol):
+    """Same as :class:`IrcConnection` but data is read into a preallocated
+    buffer. Use ``connection = irc3.IrcBufferedConnection`` in your config"""
+
+    def connection_made(self, transport):
+        super(IrcBufferedConnection, self).connection_made(transport)
+        self.framer = utils.BufferedLineFramer()
+
+    def get_buffer(self, sizehint):
+        return self.framer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        dispatch = self.factory.dispatch
+        for line in self.framer.buffer_updated(nbytes, self.decode):
+            dispatch(line)
+
+
 class IrcBot(base.IrcObject):
     """An IRC bot"""
 
-    _pep8 = [dcc_event, event, extend, plugin, rfc, config]
+    _pep8 = [dcc_event, event, extend, plugin, rfc, message, config]
     venusian = venusian
     venusian_categories = [
         'irc3',
@@ -96,6 +131,14 @@ class IrcBot(base.IrcObject):
         flood_burst=4,
         flood_rate=1,
         flood_rate_delay=1,
+        flood_line_bytes=0,
+        send_queue_size=0,
+        send_queue_policy='block',
+        send_queue_merge=False,
+        capabilities=[],
+        reconnect_delay=2,
+        reconnect_max_delay=300,
+        reconnect_stable=60,
         ctcp=dict(
             version='irc3 {version} - {url}',
             userinfo='{realname}',
@@ -128,11 +171,44 @@ class IrcBot(base.IrcObject):
                 self.log.fatal('realname = %(userinfo)s', self.config)
             import sys
             sys.exit(-1)
-        self.queue = None
+        self.queue = self.bucket = None
         if self.config.asynchronous:
-            self.queue = Queue(loop=self.loop)
+            self.queue = SendQueue(
+                self.loop,
+                maxsize=self.config.send_queue_size,
+                policy=self.config.send_queue_policy,
+                merge=self.config.send_queue_merge,
+                max_length=self.config.max_length,
+                encoding=self.encoding,
+                log=self.log)
+            if self.config.flood_burst:
+                self.bucket = TokenBucket(
+                    rate=float(self.config.flood_rate) / float(
+                        self.config.flood_rate_delay),
+                    burst=self.config.flood_burst,
+                    clock=self.loop.time,
+                    line_bytes=self.config.flood_line_bytes,
+                    encoding=self.encoding)
             self.awaiting_queue = self.create_task(self.process_queue())
         self._ip = self._dcc = None
+        # capabilities acknowledged by the server / sent in CAP LS
+        self.caps = set()
+        self.server_caps = {}
+        # nick!user@host as seen by the server (see split_message)
+        self.hostmask = None
+        # servers and reconnection delays (see irc3.reconnect)
+        servers = parse_servers(self.config.get('servers'), self.config.port)
+        self.reconnection = Reconnect(
+            servers or [(self.config.host, self.config.port)],
+            delay=self.config.reconnect_delay,
+            max_delay=self.config.reconnect_max_delay,
+            stable=self.config.reconnect_stable,
+            time=self.loop.time)
+        if servers:
+            self.config['host'], self.config['port'] = servers[0]
+        # seconds between the connection and server_ready (see core plugin)
+        self.registration_delay = None
+        self.batch_ids = itertools.count(1)
         # auto include the sasl plugin if needed
         if 'sasl_username' in self.config and \
            'irc3.plugins.sasl' not in self.registry.includes:
@@ -161,87 +237,210 @@ class IrcBot(base.IrcObject):
             transport, protocol = f.result()
         except Exception as e:
             self.log.exception(e)
-            self.loop.call_later(3, self.create_connection)
+            self.schedule_reconnect()
         else:
             self.log.debug('Connected')
             self.protocol = protocol
-            self.protocol.queue = deque()
             self.protocol.factory = self
             self.protocol.encoding = self.encoding
-            if self.config.get('password'):
-                self._send('PASS {password}'.format(**self.config))
             self.notify('connection_ready')
-            self.send((
-                'USER {username} {mode} * :{realname}\r\n'
-                'NICK {nick}\r\n'
-            ).format(**self.config))
+            self.send(self.registration())
             self.notify('connection_made')
 
+    def schedule_reconnect(self):
+        """Reconnect later, maybe to another server. See
+        :mod:`irc3.reconnect`"""
+        server = self.reconnection.failed()
+        self.config['host'], self.config['port'] = server.host, server.port
+        delay = self.reconnection.schedule(self.loop, self.create_connection)
+        self.log.info('Reconnecting to %s:%s in %.1fs',
+                      server.host, server.port, delay)
+
+    def get_caps(self):
+        """Return the capabilities to request: the ``capabilities`` option
+        and the ``capabilities`` of the plugins::
+
+            >>> bot = IrcBot(capabilities='draft/multiline')
+            >>> sorted(bot.get_caps())
+            ['draft/multiline']
+        """
+        caps = set(utils.as_list(self.config.capabilities))
+        for p in self.registry.plugins.values():
+            caps.update(getattr(p, 'capabilities', ()))
+        return caps
+
+    def registration(self):
+        """Return the registration lines. They are sent in a single write,
+        after the ``CAP`` lines sent by the core plugin on
+        ``connection_ready``::
+
+            >>> bot = IrcBot(nick='irc3', password='secret')
+            >>> for line in bot.registration().splitlines():
+            ...     print(line)
+            PASS secret
+            NICK irc3
+            USER irc3 0 * :Irc bot based on irc3 http://irc3.readthedocs.io
+        """
+        config = self.config
+        lines = []
+        if config.get('password'):
+            lines.append('PASS %s' % config.password)
+        lines.append('NICK %s' % config.nick)
+        lines.append('USER %s %s * :%s' % (
+            config.username, config.mode, config.realname))
+        return '\r\n'.join(lines)
+
     def send_line(self, data, nowait=False):
-        """send a line to the server. replace CR by spaces"""
-        data = data.replace('\n', ' ').replace('\r', ' ')
+        """send a line to the server. replace CR by spaces.
+
+        Return a future resolved with ``True`` when the line is sent or
+        ``False`` if the line was dropped (see :mod:`irc3.sendq`)"""
+        if '\n' in data or '\r' in data:
+            data = data.translate(utils.CRLF)
         f = self.loop.create_future()
         if self.queue is not None and nowait is False:
-            self.queue.put_nowait((f, data))
+            self.queue.put(f, data)
         else:
-            self.send(data.replace('\n', ' ').replace('\r', ' '))
+            self.send(data)
             f.set_result(True)
         return f
 
     async def process_queue(self):
-        flood_burst = self.config.flood_burst
-        delay = float(self.config.flood_rate_delay)
-        flood_rate = delay / float(self.config.flood_rate)
+        queue = self.queue
+        bucket = self.bucket
+        if bucket is None:
+            while True:
+                future, data, encoded = await queue.get()
+                if not future.done():
+                    future.set_result(True)
+                self._send_queued(data, encoded)
+                await asyncio.sleep(.001, loop=self.loop)
         while True:
-            if flood_burst == 0:
-                future, data = await self.queue.get()
+            await queue.wait()
+            cost = bucket.cost(queue.encoded())
+            wait = bucket.consume(cost)
+            if wait:
+                # a priority line may come while we wait. peek again
+                await asyncio.sleep(wait, loop=self.loop)
+                continue
+            future, data, encoded = queue.pop()
+            if not future.done():
                 future.set_result(True)
-                self.send(data)
-                await asyncio.sleep(.001, loop=self.loop)
-            else:
-                lines = []
-                for i in range(flood_burst):
-                    future, data = await self.queue.get()
-                    future.set_result(True)
-                    lines.append(data)
-                    if self.queue.empty():
-                        break
-                if lines:
-                    self.send('\r\n'.join(lines))
-                while not self.queue.empty():
-                    await asyncio.sleep(flood_rate, loop=self.loop)
-                    future, data = await self.queue.get()
-                    future.set_result(True)
-                    self.send(data)
+            self._send_queued(data, encoded)
 
     def send(self, data):
         """send data to the server"""
         self._send(data)
 
-    def _send(self, data):
-        self.protocol.write(data)
-        self.dispatch(data, iotype='out')
+    def _send_queued(self, data, encoded):
+        if getattr(self.send, '__func__', None) is IrcBot.send:
+            # write the bytes encoded by the queue
+            self._send(data, encoded)
+        else:
+            # send() is overridden
+            self.send(data)
+
+    def _send(self, data, encoded=None):
+        if encoded is None:
+            self.protocol.write(data)
+        else:
+            self.protocol.write(data, encoded)
+        self.dispatch_out(data)
 
     def privmsg(self, target, message, nowait=False):
         """send a privmsg to target"""
         if message:
             is_dcc = isinstance(target, DCCChat)
             prefix = '' if is_dcc else 'PRIVMSG %s :' % target
-            messages = utils.split_message(
-                message,
-                self.config.max_length,
-                self.encoding,
-                prefix=prefix,
-            )
+            if target and not is_dcc and 'draft/multiline' in self.caps:
+                return self.multiline('PRIVMSG', target, message,
+                                      nowait=nowait)
             if is_dcc:
-                for message in messages:
+                for message in self.split_message(message, relayed=False):
                     target.send_line(message)
             elif target:
-                f = None
-                for message in messages:
-                    f = self.send_line(prefix + message,
-                                       nowait=nowait)
-                return f
+                return self.send_message(prefix, message, nowait=nowait)
+
+    def send_message(self, prefix, message, suffix='', nowait=False):
+        """send ``message`` in as many lines as needed. Each line is
+        ``prefix + chunk + suffix``"""
+        if '\n' in message or '\r' in message:
+            message = message.translate(utils.CRLF)
+        f = None
+        for text in self.split_message(message, prefix=prefix + suffix):
+            f = self.send_line(prefix + text + suffix, nowait=nowait)
+        return f
+
+    def split_message(self, message, prefix='', relayed=True):
+        """Split a message in chunks which fit in a line starting with
+        ``prefix`` (like ``PRIVMSG #chan :``). When the bot's hostmask is
+        known, the ``:nick!user@host`` added by the server when relaying the
+        line is also taken into account::
+
+            >>> bot = IrcBot(max_length=45)
+            >>> list(bot.split_message('Hello world', prefix='PRIVMSG #c :'))
+            ['Hello world']
+            >>> bot.hostmask = 'irc3!~irc3@localhost'
+            >>> list(bot.split_message('Hello world', prefix='PRIVMSG #c :'))
+            ['Hello', 'world']
+        """
+        max_length = self.config.max_length
+        if relayed and self.hostmask:
+            # :mask PRIVMSG ...\r\n
+            max_length -= len(self.hostmask.encode(self.encoding)) + 4
+        return utils.split_message(message, max_length, self.encoding,
+                                   prefix=prefix)
+
+    def multiline(self, command, target, message, nowait=False):
+        """send a PRIVMSG / NOTICE as a ``draft/multiline`` batch. Each line
+        of the message is a line of the batch. Too long lines are split and
+        sent with the ``draft/multiline-concat`` tag"""
+        prefix = '%s %s :' % (command, target)
+        limits = dict(opt.partition('=')[::2] for opt in (
+            self.server_caps.get('draft/multiline') or '').split(','))
+        max_bytes = int(limits.get('max-bytes') or 4096)
+        max_lines = int(limits.get('max-lines') or 24)
+        batches = [[]]
+        size = 0
+        for line in message.replace('\r', '').split('\n'):
+            for i, text in enumerate(self.split_message(
+                    line, prefix=prefix + ' ')):
+                concat = i > 0
+                if concat:
+                    text = ' ' + text
+                length = len(text.encode(self.encoding)) + (not concat)
+                batch = batches[-1]
+                full = len(batch) >= max_lines
+                if batch and (full or size + length > max_bytes):
+                    batch = []
+                    batches.append(batch)
+                    size = 0
+                size += length
+                batch.append((concat, text))
+        f = None
+        for batch in batches:
+            if len(batch) == 1:
+                f = self.send_line(prefix + batch[0][1].lstrip(' '),
+                                   nowait=nowait)
+                continue
+            elif not batch:
+                continue
+            ref = 'irc3_%s' % next(self.batch_ids)
+            lines = ['BATCH +%s draft/multiline %s' % (ref, target)]
+            for concat, text in batch:
+                tags = 'batch=' + ref
+                if concat:
+                    tags += ';draft/multiline-concat'
+                lines.append('@%s %s%s' % (tags, prefix, text))
+            lines.append('BATCH -' + ref)
+            data = '\r\n'.join(lines)
+            f = self.loop.create_future()
+            if self.queue is not None and nowait is False:
+                self.queue.put(f, data)
+            else:
+                self.send(data)
+                f.set_result(True)
+        return f
 
     def action(self, target, message, nowait=False):
         return self.privmsg(target, '\x01ACTION %s\x01' % message,
@@ -252,50 +451,26 @@ class IrcBot(base.IrcObject):
         if message:
             is_dcc = isinstance(target, DCCChat)
             prefix = '' if is_dcc else 'NOTICE %s :' % target
-            messages = utils.split_message(
-                message,
-                self.config.max_length,
-                self.encoding,
-                prefix=prefix,
-            )
+            if target and not is_dcc and 'draft/multiline' in self.caps:
+                return self.multiline('NOTICE', target, message,
+                                      nowait=nowait)
             if is_dcc:
-                for message in messages:
+                for message in self.split_message(message, relayed=False):
                     target.send_line(message)
             elif target:
-                f = None
-                for message in messages:
-                    f = self.send_line(prefix + message,
-                                       nowait=nowait)
-                return f
+                return self.send_message(prefix, message, nowait=nowait)
 
     def ctcp(self, target, message, nowait=False):
         """send a ctcp to target"""
         if target and message:
-            messages = utils.split_message(
-                message,
-                self.config.max_length,
-                self.encoding,
-            )
-            f = None
-            for message in messages:
-                f = self.send_line('PRIVMSG %s :\x01%s\x01' % (target,
-                                                               message),
-                                   nowait=nowait)
-            return f
+            return self.send_message('PRIVMSG %s :\x01' % target, message,
+                                     suffix='\x01', nowait=nowait)
 
     def ctcp_reply(self, target, message, nowait=False):
         """send a ctcp reply to target"""
         if target and message:
-            messages = utils.split_message(
-                message,
-                self.config.max_length,
-                self.encoding,
-            )
-            f = None
-            for message in messages:
-                f = self.send_line('NOTICE %s :\x01%s\x01' % (target, message),
-                                   nowait=nowait)
-            return f
+            return self.send_message('NOTICE %s :\x01' % target, message,
+                                     suffix='\x01', nowait=nowait)
 
     def mode(self, target, *data):
         """set user or channel mode"""
@@ -425,12 +600,6 @@ class IrcBot(base.IrcObject):
 
 
 def run(argv=None):
-    bots = {}
-    bot = IrcBot.from_argv(argv, botnet=bots)
-    bots['bot'] = bot
-    for section in list(bot.config):
-        if section.startswith('bot_'):
-            config = bot.config.pop(section)
-            bots[section] = IrcBot.from_argv(argv, botnet=bots, **config)
-    bot.loop.run_forever()
-    return bots
+    fleet = Fleet.from_argv(argv, factory=IrcBot)
+    fleet.loop.run_forever()
+    return fleet.bots
@@ -8,18 +8,352 @@ import logging.config
 from importlib import metadata
 from . import utils
 from . import config
+from . import message
 from .compat import asyncio
 from .compat import reload_module
 from collections import defaultdict
+from collections import deque
+import functools
+import re
+from re import _parser as sre_parse
+from re import _constants as sre
 
 
 version = metadata.version('irc3')
 
+# extract the command (verb or numeric) of a line. tags and prefix are
+# optional
+_re_command = re.compile(r'(?:@\S*\s+)?(?::\S*\s+)?(\S*)').match
+
+_SPACE_CATEGORIES = (sre.CATEGORY_SPACE,)
+_NOT_SPACE_CATEGORIES = (sre.CATEGORY_NOT_SPACE,)
+
+
+def _is_space(op, av):
+    """True if the item match one or more whitespaces"""
+    if op is sre.LITERAL:
+        return av == 32
+    if op is sre.IN:
+        for o, a in av:
+            if o is sre.LITERAL and a == 32:
+                continue
+            if o is sre.CATEGORY and a in _SPACE_CATEGORIES:
+                continue
+            return False
+        return True
+    if op is sre.MAX_REPEAT and av[0] > 0:
+        return all(_is_space(o, a) for o, a in av[2])
+    return False
+
+
+def _no_space(items):
+    """True if items can't match a whitespace"""
+    for op, av in items:
+        if op is sre.LITERAL:
+            if chr(av).isspace():
+                return False
+        elif op is sre.IN:
+            for o, a in av:
+                if o is sre.CATEGORY and a in _NOT_SPACE_CATEGORIES:
+                    continue
+                if o is sre.LITERAL and not chr(a).isspace():
+                    continue
+                return False
+        elif op in (sre.MAX_REPEAT, sre.MIN_REPEAT):
+            if not _no_space(av[2]):
+                return False
+        elif op is sre.SUBPATTERN:
+            if not _no_space(av[3]):
+                return False
+        elif op is sre.BRANCH:
+            if not all(_no_space(i) for i in av[1]):
+                return False
+        else:
+            return False
+    return True
+
+
+def _starts_with_boundary(items):
+    """True if items must start with a whitespace or the end of line"""
+    if not items:
+        return False
+    op, av = items[0]
+    if op is sre.AT:
+        return av is sre.AT_END
+    if _is_space(op, av):
+        return True
+    if op in (sre.MAX_REPEAT, sre.MIN_REPEAT):
+        return av[0] > 0 and _starts_with_boundary(av[2])
+    if op is sre.SUBPATTERN:
+        return _starts_with_boundary(list(av[3]) + list(items[1:]))
+    if op is sre.BRANCH:
+        return all(_starts_with_boundary(list(i) + list(items[1:]))
+                   for i in av[1])
+    return False
+
+
+def _expand_literal(op, av, limit=32):
+    """return the set of strings matched by a literal item or None"""
+    if op is sre.LITERAL:
+        return {chr(av)}
+    if op is sre.IN:
+        values = set()
+        for o, a in av:
+            if o is sre.LITERAL:
+                values.add(chr(a))
+            elif o is sre.RANGE and a[1] - a[0] < limit:
+                values.update(chr(i) for i in range(a[0], a[1] + 1))
+            else:
+                return None
+        return values
+    if op is sre.SUBPATTERN:
+        if av[1] & re.IGNORECASE:
+            return None
+        return _expand_literals(av[3], limit=limit)
+    if op is sre.BRANCH:
+        values = set()
+        for items in av[1]:
+            expanded = _expand_literals(items, limit=limit)
+            if expanded is None:
+                return None
+            values.update(expanded)
+        return values
+    return None
+
+
+def _expand_literals(items, limit=32):
+    values = {''}
+    for op, av in items:
+        expanded = _expand_literal(op, av, limit=limit)
+        if expanded is None:
+            return None
+        values = {v + e for v in values for e in expanded}
+        if len(values) > limit:
+            return None
+    return values
+
+
+def _skip_prefix(items, start):
+    """skip a ``:prefix `` or ``@tags `` part. Return the position of the
+    next item or None if it's not a valid prefix"""
+    end = len(items)
+    i = start + 1
+    while i < end:
+        op, av = items[i]
+        if _is_space(op, av):
+            if not _no_space(items[start + 1:i]):
+                return None
+            return i + 1
+        i += 1
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _pattern_commands(pattern, flags=0):
+    r"""Return the commands (verbs / numerics) a pattern can match or None if
+    the pattern may match any command
+
+    .. code-block:: py
+
+        >>> sorted(_pattern_commands(
+        ...     r'^(@(?P<tags>\S+) )?:(?P<srv>\S+) (?P<retcode>(432|433)) '))
+        ['432', '433']
+        >>> sorted(_pattern_commands(r'^PING :?(?P<data>.*)'))
+        ['PING']
+        >>> _pattern_commands(r'^(?P<raw>.*)') is None
+        True
+        >>> sorted(_pattern_commands(r'(?i)^:\S+ 318 \S+ gawel '))
+        ['318']
+        >>> _pattern_commands(r'(?i)^PING :(?P<data>.*)') is None
+        True
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:  # pragma: no cover
+        return None
+    ignorecase = parsed.state.flags & re.IGNORECASE
+    items = list(parsed)
+    i = 0
+    if items and items[0] == (sre.AT, sre.AT_BEGINNING):
+        i += 1
+    # optional tags / prefix groups
+    while i < len(items):
+        op, av = items[i]
+        if op is sre.MAX_REPEAT and av[:2] == (0, 1) and \
+           len(av[2]) == 1 and av[2][0][0] is sre.SUBPATTERN:
+            sub = list(av[2][0][1][3])
+            if sub and sub[0] in ((sre.LITERAL, 64), (sre.LITERAL, 58)):
+                if _skip_prefix(sub, 0) != len(sub):
+                    return None
+                i += 1
+                continue
+        break
+    if i < len(items) and items[i] == (sre.LITERAL, 58):
+        i = _skip_prefix(items, i)
+        if i is None:
+            return None
+    # the command itself
+    commands = {''}
+    while i < len(items):
+        if _starts_with_boundary(items[i:]):
+            break
+        expanded = _expand_literal(*items[i])
+        if expanded is None:
+            return None
+        commands = {c + e for c in commands for e in expanded}
+        if len(commands) > 32:
+            return None
+        i += 1
+    else:
+        # match() only anchor the start of the line
+        return None
+    if '' in commands or any(c[0] in '@:' for c in commands):
+        return None
+    if ignorecase and any(c.lower() != c.upper() for c in commands):
+        return None
+    return frozenset(commands)
+
+
+def get_event_commands(cregexp):
+    """Return the commands a compiled event can match or None"""
+    pattern = getattr(cregexp, '__self__', None)
+    if not isinstance(pattern, re.Pattern) or \
+       not isinstance(pattern.pattern, str):
+        return None
+    return _pattern_commands(pattern.pattern, pattern.flags & ~re.UNICODE)
+
+
+# global inline flags
+_re_inline_flags = re.compile(r'^\(\?[aiLmsux]+\)')
+# verbose mode allow comments. don't try to parse them
+_re_verbose = re.compile(r'\(\?[aiLmsu-]*x')
+_SCOPED_FLAGS = (
+    (re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'))
+
+
+def _uncapture(pattern):
+    r"""Turn capturing groups into non capturing groups. Return None if the
+    pattern use backreferences
+
+    .. code-block:: py
+
+        >>> _uncapture(r'^(?P<a>\S+) ([(]x)')
+        '^(?:\\S+) (?:[(]x)'
+        >>> _uncapture(r'^(?P<a>\S+) (?P=a)') is None
+        True
+    """
+    out = []
+    i = 0
+    end = len(pattern)
+    while i < end:
+        c = pattern[i]
+        if c == '\\':
+            if pattern[i + 1:i + 2] in '123456789':
+                return None
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if c == '[':
+            # a ] right after [ or [^ is a literal
+            j = i + 1
+            if pattern[j:j + 1] == '^':
+                j += 1
+            if pattern[j:j + 1] == ']':
+                j += 1
+            while j < end and pattern[j] != ']':
+                j += 2 if pattern[j] == '\\' else 1
+            out.append(pattern[i:j + 1])
+            i = j + 1
+            continue
+        if c == '(':
+            if pattern.startswith('(?P<', i):
+                out.append('(?:')
+                i = pattern.index('>', i) + 1
+                continue
+            if pattern.startswith(('(?P=', '(?('), i):
+                return None
+            if pattern[i + 1:i + 2] != '?':
+                out.append('(?:')
+                i += 1
+                continue
+        out.append(c)
+        i += 1
+    return ''.join(out)
+
+
+def _mergeable(cregexp):
+    r"""Return the pattern of a compiled event without captures if it can be
+    merged or None. Global flags are turned into scoped flags:
+
+    .. code-block:: py
+
+        >>> _mergeable(re.compile(r'(?i)^:(?P<srv>\S+) 318 ').match)
+        '(?i:^:(?:\\S+) 318 )'
+    """
+    pattern = getattr(cregexp, '__self__', None)
+    if not isinstance(pattern, re.Pattern) or \
+       not isinstance(pattern.pattern, str):
+        return None
+    text = pattern.pattern
+    if _re_verbose.search(text):
+        return None
+    flags = pattern.flags & ~re.UNICODE
+    letters = ''
+    if flags:
+        for flag, letter in _SCOPED_FLAGS:
+            if flags & flag:
+                letters += letter
+                flags &= ~flag
+        if flags:
+            return None
+        text = _re_inline_flags.sub('', text)
+    text = _uncapture(text)
+    if text is None:
+        return None
+    if letters:
+        text = '(?%s:%s)' % (letters, text)
+    return text
+
+
+@functools.lru_cache(maxsize=1024)
+def _merge_patterns(patterns):
+    """Merge patterns into a single alternation without captures but an
+    empty group at the end of each pattern. The ``lastindex`` of a match is
+    the position of the first pattern which match (starting at 1). Patterns
+    which overlap are found by matching again from the next pattern. Return
+    None if patterns can't be merged:
+
+    .. code-block:: py
+
+        >>> match = _merge_patterns(('(?:x)y', 'x'))
+        >>> match('xz').lastindex
+        2
+    """
+    try:
+        merged = re.compile('|'.join('(?:%s)()' % p for p in patterns))
+    except re.error:  # pragma: no cover
+        return None
+    if merged.groups != len(patterns):  # pragma: no cover
+        return None
+    return merged.match
+
+
+class EventsList(list):
+    """A list of events. Can be weakly referenced so the lists shared by
+    the bots of a fleet are dropped when unused"""
+
+    __slots__ = ('__weakref__',)
+
 
 class Registry:
     """Store (and hide from api) plugins events and stuff"""
 
-    def __init__(self):
+    def __init__(self, merged=False, tables=None):
+        # use a single merged regexp per command instead of a regexp per
+        # event
+        self.merged = merged
+        # lists of events shared with other registries (see irc3.fleet)
+        self.tables = tables
         self.reset(reloading=False)
 
     def reset(self, reloading=True):
@@ -33,6 +367,17 @@ class Registry:
             'dcc_in': defaultdict(list),
             'dcc_out': defaultdict(list),
         }
+        # events_re bucketed by command. built on demand
+        self.indexes = {}
+        # merged regexps by command. built on demand
+        self.engines = {}
+        # structured events: command -> [(matcher, event)]
+        self.events_msg = {
+            'in': defaultdict(list),
+            'out': defaultdict(list),
+            'dcc_in': defaultdict(list),
+            'dcc_out': defaultdict(list),
+        }
 
         self.scanned = []
         self.includes = set()
@@ -43,12 +388,178 @@ class Registry:
             self.reloading = {}
             self.plugins = {}
 
+    def get_index(self, iotype='in'):
+        """Return a ``(buckets, wildcard)`` tuple. ``buckets`` is a dict of
+        command -> events_re which may match a line with this command.
+        ``wildcard`` contains events_re which can match any command. Both
+        keep the events_re order. Lists are shared with the registries using
+        the same ``tables``"""
+        index = self.indexes.get(iotype)
+        if index is None:
+            entries = self.events_re[iotype]
+            commands = [get_event_commands(c) for r, c in entries]
+            buckets = {}
+            for cmds in commands:
+                if cmds is not None:
+                    for cmd in cmds:
+                        buckets[cmd] = EventsList()
+            wildcard = EventsList()
+            for entry, cmds in zip(entries, commands):
+                if cmds is None:
+                    wildcard.append(entry)
+                    for bucket in buckets.values():
+                        bucket.append(entry)
+                else:
+                    for cmd in cmds:
+                        buckets[cmd].append(entry)
+            tables = self.tables
+            if tables is not None:
+                for cmd, bucket in buckets.items():
+                    buckets[cmd] = tables.setdefault(tuple(bucket), bucket)
+                wildcard = tables.setdefault(tuple(wildcard), wildcard)
+            index = self.indexes[iotype] = (buckets, wildcard)
+        return index
+
+    def has_events(self, iotype):
+        """True if some events (regexps or structured) use iotype"""
+        return bool(self.events_re[iotype] or self.events_msg[iotype])
+
+    def invalidate(self, iotype):
+        """Invalidate the index and merged regexps of iotype"""
+        self.indexes.pop(iotype, None)
+        self.engines.pop(iotype, None)
+
+    def get_engine(self, engines, cmd, entries, start):
+        """Return a ``(match, end)`` tuple for the mergeable
+        ``entries[start:end]`` or None if ``entries[start]`` can't be merged.
+        Merged regexps are cached by patterns so only the buckets which
+        changed are recompiled"""
+        key = (cmd, start)
+        if key in engines:
+            return engines[key]
+        patterns = []
+        for regexp, cregexp in entries[start:]:
+            pattern = _mergeable(cregexp)
+            if pattern is None:
+                break
+            patterns.append(pattern)
+        engine = None
+        if patterns:
+            match = _merge_patterns(tuple(patterns))
+            if match is not None:
+                engine = (match, start + len(patterns))
+        engines[key] = engine
+        return engine
+
     def get_event_matches(self, data, iotype='in'):
         events = self.events[iotype]
-        for regexp, cregexp in self.events_re[iotype]:
+        buckets, entries = self.get_index(iotype)
+        cmd = None
+        if buckets:
+            cmd = _re_command(data).group(1)
+            if cmd in buckets:
+                entries = buckets[cmd]
+            else:
+                cmd = None
+        if not self.merged:
+            for regexp, cregexp in entries:
+                match = cregexp(data)
+                if match is not None:
+                    yield match, events[regexp]
+            return
+        engines = self.engines.setdefault(iotype, {})
+        i = 0
+        end = len(entries)
+        while i < end:
+            engine = self.get_engine(engines, cmd, entries, i)
+            if engine is not None:
+                match, stop = engine
+                match = match(data)
+                if match is None:
+                    i = stop
+                    continue
+                # only the pattern which match is run again to get the
+                # groups
+                i += match.lastindex - 1
+            regexp, cregexp = entries[i]
             match = cregexp(data)
             if match is not None:
                 yield match, events[regexp]
+            i += 1
+
+
+class BufferedWriter:
+    """Protocol mixin. Lines written during a loop iteration are sent with a
+    single ``transport.write()`` at the end of the iteration or when more
+    than ``write_threshold`` bytes are buffered. Nothing is sent while the
+    transport asked us to pause writing. If more than ``write_limit`` bytes
+    are buffered while paused the peer is not reading: the buffer is dropped
+    and the connection is aborted"""
+
+    write_threshold = 16384
+    write_limit = 1048576
+    write_buffer = ()
+    write_size = 0
+    write_paused = False
+    flush_handle = None
+
+    def init_writer(self):
+        self.write_buffer = []
+        self.write_size = 0
+        self.write_paused = False
+        self.flush_handle = None
+
+    def buffer_write(self, data):
+        """Buffer some bytes"""
+        self.write_buffer.append(data)
+        self.write_size += len(data)
+        if self.write_paused:
+            if self.write_size > self.write_limit:
+                self.write_overflow()
+        elif self.write_size >= self.write_threshold:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = self.factory.loop.call_soon(self.flush)
+
+    def flush(self, force=False):
+        """Write buffered data to the transport"""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.write_buffer or (self.write_paused and not force):
+            return
+        if self.transport.is_closing():
+            self.write_buffer = []
+            self.write_size = 0
+            return
+        data = b''.join(self.write_buffer)
+        self.write_buffer = []
+        self.write_size = 0
+        self.transport.write(data)
+
+    def write_overflow(self):
+        """Drop the buffer and abort the connection"""
+        self.factory.log.critical('write buffer full (%s bytes): aborting %r',
+                                  self.write_size, id(self.transport))
+        self.write_buffer = []
+        self.write_size = 0
+        self.transport.abort()
+
+    def stop_writer(self):
+        """Cancel the pending flush and drop the buffer. Must be called when
+        the connection is lost"""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.write_buffer = []
+        self.write_size = 0
+
+    def pause_writing(self):
+        self.write_paused = True
+
+    def resume_writing(self):
+        self.write_paused = False
+        self.flush()
 
 
 class IrcObject:
@@ -69,12 +580,20 @@ class IrcObject:
         ssl_verify=False,
         encoding='utf8',
         loop=None,
+        dispatch_budget=0,
+        defer_out_events=False,
     )
 
     def __init__(self, *ini, **config):
         config['version'] = version
         self.config = utils.Config(dict(self.defaults, *ini, **config))
-        logging.config.dictConfig(self.logging_config)
+        # bots of a fleet share the config, the scanned modules and the
+        # events tables. see irc3.fleet
+        self.fleet = fleet = self.config.get('fleet')
+        if fleet is None or fleet.logging_config is not self.logging_config:
+            logging.config.dictConfig(self.logging_config)
+            if fleet is not None:
+                fleet.logging_config = self.logging_config
         if self.server:
             self.log = logging.getLogger('irc3d')
         else:
@@ -100,7 +619,19 @@ class IrcObject:
 
         self.create_task = self.loop.create_task
 
-        self.registry = Registry()
+        # batched callbacks. see call_batched()
+        self.dispatch_budget = int(self.config.dispatch_budget or 0)
+        self.callbacks = deque()
+        self.callbacks_scheduled = False
+
+        # outgoing lines. see dispatch_out()
+        self.defer_out_events = bool(self.config.defer_out_events)
+        self.out_lines = deque()
+        self.out_scheduled = False
+
+        self.registry = Registry(
+            merged=bool(self.config.get('merged_events')),
+            tables=fleet.tables if fleet is not None else None)
 
         self.include(*self.config.get('includes', []))
 
@@ -137,13 +668,27 @@ class IrcObject:
             events = self.registry.events[iotype]
             for i, (regexp, cregexp) in enumerate(events_re[iotype]):
                 e = events[regexp][0]
-                events_re[i] = (regexp, e.compile(self.config))
+                events_re[iotype][i] = (regexp, e.compile(self.config))
+            self.registry.invalidate(iotype)
+            for entries in self.registry.events_msg[iotype].values():
+                for i, (matcher, e) in enumerate(entries):
+                    entries[i] = (e.compile(self.config), e)
 
     def attach_events(self, *events, **kwargs):
         """Attach one or more events to the bot instance"""
         reg = self.registry
         insert = 'insert' in kwargs
         for e in events:
+            if getattr(e, 'structured', False):
+                entry = (e.compile(self.config), e)
+                for cmd in e.regexp.commands:
+                    entries = reg.events_msg[e.iotype][cmd]
+                    if insert:
+                        entries.insert(0, entry)
+                    else:
+                        entries.append(entry)
+                continue
+            reg.invalidate(e.iotype)
             cregexp = e.compile(self.config)
             regexp = getattr(e.regexp, 're', e.regexp)
             if regexp not in reg.events[e.iotype]:
@@ -164,6 +709,15 @@ class IrcObject:
         # remove from self.events
         all_events = reg.events
         for e in events:
+            if getattr(e, 'structured', False):
+                events_msg = reg.events_msg[e.iotype]
+                for cmd in e.regexp.commands:
+                    entries = [m for m in events_msg.get(cmd, ()) if m[1] != e]
+                    if entries:
+                        events_msg[cmd] = entries
+                    else:
+                        events_msg.pop(cmd, None)
+                continue
             regexp = getattr(e.regexp, 're', e.regexp)
             iotype = e.iotype
             if e in all_events[iotype].get(regexp, []):
@@ -177,6 +731,7 @@ class IrcObject:
         for iotype, regexps in delete.items():
             reg.events_re[iotype] = [r for r in reg.events_re[iotype]
                                      if r[0] not in regexps]
+            reg.invalidate(iotype)
 
     def include(self, *modules, **kwargs):
         reg = self.registry
@@ -206,7 +761,14 @@ class IrcObject:
                         if getattr(klass, self.plugin_category, False) is True:
                             self.get_plugin(klass)
                 reg.scanned.append((module.__name__, categories))
-                scanner.scan(module, categories=categories)
+                if self.fleet is not None and \
+                   not hasattr(module, '__path__'):
+                    # replay the callbacks found by the first bot
+                    callbacks = self.fleet.get_callbacks(module, categories)
+                    for callback, name, ob in callbacks:
+                        callback(scanner, name, ob)
+                else:
+                    scanner.scan(module, categories=categories)
 
     def reload(self, *modules):
         """Reload one or more plugins"""
@@ -232,6 +794,8 @@ class IrcObject:
             if module_name in modules:
                 module = utils.maybedotted(module_name)
                 reload_module(module)
+                if self.fleet is not None:
+                    self.fleet.forget(module_name)
             to_scan.append((module_name, categories))
 
         # rescan all modules
@@ -251,27 +815,100 @@ class IrcObject:
                 else:
                     meth()
 
-    def dispatch(self, data, iotype='in', client=None):
-        str = utils.IrcString
+    def call_batched(self, callback, *args):
+        """Like ``loop.call_soon()`` but callbacks are queued and run by a
+        single :meth:`drain_callbacks` call"""
+        self.callbacks.append((callback, args))
+        if not self.callbacks_scheduled:
+            self.callbacks_scheduled = True
+            self.loop.call_soon(self.drain_callbacks)
+
+    def drain_callbacks(self):
+        """Run queued callbacks in order. At most ``dispatch_budget``
+        callbacks are run per loop iteration so a burst of lines can't starve
+        the loop"""
+        callbacks = self.callbacks
+        for i in range(self.dispatch_budget):
+            if not callbacks:
+                break
+            callback, args = callbacks.popleft()
+            try:
+                callback(*args)
+            except Exception as exc:
+                self.loop.call_exception_handler({
+                    'message': 'Exception in callback %r' % (callback,),
+                    'exception': exc,
+                })
+        if callbacks:
+            self.loop.call_soon(self.drain_callbacks)
+        else:
+            self.callbacks_scheduled = False
+
+    def dispatch(self, data, iotype='in', client=None, clients=None):
+        IrcMatch = utils.IrcMatch
         create_task = self.create_task
-        call_soon = self.loop.call_soon
+        if self.dispatch_budget:
+            call_soon = self.call_batched
+        else:
+            call_soon = self.loop.call_soon
         for match, events in self.registry.get_event_matches(data, iotype):
-            match = match.groupdict()
-            for key, value in match.items():
-                if value is not None:
-                    match[key] = str(value)
-            # backwards compatibility fix for IRCv3.2 tag support:
-            # If no tags (None-value), exclude from dictionary
-            if match.get("tags", True) is None:
-                del match["tags"]
-            if client is not None:
-                # server / dcc chat
-                match['client'] = client
+            # values are converted when the callbacks are called. client is
+            # set for server / dcc chat
+            match = IrcMatch(match, client=client, shared=len(events) > 1,
+                             clients=clients)
             for e in events:
                 if e.iscoroutine is True:
                     create_task(e.callback(**match))
                 else:
                     call_soon(e.async_callback, match)
+        events_msg = self.registry.events_msg[iotype]
+        if events_msg and _re_command(data).group(1) in events_msg:
+            self.dispatch_message(message.Message.parse(data), iotype=iotype,
+                                  client=client, clients=clients)
+
+    def dispatch_out(self, data, iotype='out', client=None, clients=None):
+        """dispatch an outgoing line. Nothing is done when no event use
+        ``iotype``. With the ``defer_out_events`` option, lines are
+        dispatched by :meth:`drain_out` at the next loop iteration instead of
+        when they are written"""
+        if not self.registry.has_events(iotype):
+            return
+        if self.defer_out_events:
+            self.out_lines.append((data, iotype, client, clients))
+            if not self.out_scheduled:
+                self.out_scheduled = True
+                self.loop.call_soon(self.drain_out)
+        else:
+            self.dispatch(data, iotype=iotype, client=client, clients=clients)
+
+    def drain_out(self):
+        """dispatch the deferred outgoing lines"""
+        self.out_scheduled = False
+        lines = self.out_lines
+        while lines:
+            data, iotype, client, clients = lines.popleft()
+            self.dispatch(data, iotype=iotype, client=client, clients=clients)
+
+    def dispatch_message(self, msg, iotype='in', client=None, clients=None):
+        """dispatch a parsed :class:`~irc3.message.Message` to structured
+        events"""
+        create_task = self.create_task
+        if self.dispatch_budget:
+            call_soon = self.call_batched
+        else:
+            call_soon = self.loop.call_soon
+        for matcher, e in self.registry.events_msg[iotype].get(
+                msg.command, ()):
+            match = matcher(msg)
+            if match is not None:
+                if client is not None:
+                    match['client'] = client
+                if clients is not None:
+                    match['clients'] = clients
+                if e.iscoroutine is True:
+                    create_task(e.callback(**match))
+                else:
+                    call_soon(e.async_callback, match)
 
     def call_many(self, callback, args):
         """callback is run with each arg but run a call per second"""
@@ -329,6 +966,9 @@ class IrcObject:
             )
             if self.config.get('vhost'):
                 args["local_addr"] = (self.config.vhost, 0)
+            if self.server and self.config.get('reuse_port'):
+                # many processes can bind the port. see irc3d.workers
+                args['reuse_port'] = True
         t = asyncio.Task(factory(protocol, **args), loop=self.loop)
         t.add_done_callback(self.connection_made)
         return self.loop
@@ -357,13 +997,16 @@ class IrcObject:
     def from_config(cls, cfg, **kwargs):
         """return an instance configured with the ``cfg`` dict"""
         cfg = dict(cfg, **kwargs)
-        pythonpath = cfg.get('pythonpath', [])
+        pythonpath = list(cfg.get('pythonpath', []))
         if 'here' in cfg:
             pythonpath.append(cfg['here'])
         for path in pythonpath:
-            sys.path.append(os.path.expanduser(path))
+            path = os.path.expanduser(path)
+            if path not in sys.path:
+                sys.path.append(path)
         prog = cls.server and 'irc3d' or 'irc3'
-        if cfg.get('debug'):
+        if cfg.get('debug') and \
+           prog + '.debug' not in cls.venusian_categories:
             cls.venusian_categories.append(prog + '.debug')
         if cfg.get('interactive'):  # pragma: no cover
             import irc3.testing
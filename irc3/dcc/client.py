@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 import os
 import struct
-from collections import deque
 from functools import partial
 from irc3.compat import asyncio
+from irc3.utils import LineFramer
 
 
 class DCCBase(asyncio.Protocol):
@@ -73,7 +73,7 @@ class DCCChat(DCCBase):
         super(DCCChat, self).connection_made(transport)
         self.encoding = getattr(self.bot, 'encoding', 'ascii')
         self.set_timeout()
-        self.queue = deque()
+        self.framer = LineFramer()
 
     def decode(self, data):
         """Decode data with bot's encoding"""
@@ -82,13 +82,9 @@ class DCCChat(DCCBase):
     def data_received(self, data):
         """data received"""
         self.set_timeout()
-        data = self.decode(data)
-        if self.queue:
-            data = self.queue.popleft() + data
-        lines = data.replace('\r', '').split('\n')
-        self.queue.append(lines.pop(-1))
-        for line in lines:
-            self.bot.dispatch(line, iotype='dcc_in', client=self)
+        for line in self.framer.feed(data, self.decode):
+            self.bot.dispatch(line.rstrip('\r'), iotype='dcc_in',
+                              client=self)
 
     def write(self, data):
         if data is not None:
@@ -99,7 +95,7 @@ class DCCChat(DCCBase):
 
     def send_line(self, message):
         self.write(message)
-        self.bot.dispatch(message, iotype='dcc_out', client=self)
+        self.bot.dispatch_out(message, iotype='dcc_out', client=self)
 
     def send(self, *messages):
         for message in messages:
@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 from irc3.utils import wraps_with_context
 from irc3.compat import asyncio
+import functools
 import venusian
 import re
 
 
+@functools.lru_cache(maxsize=4096)
+def _compile(regexp):
+    # bots using the same regexps share the same matchers
+    return re.compile(regexp).match
+
+
 def plugin(wrapped):
     """register a class as plugin"""
     setattr(wrapped, '__irc3_plugin__', True)
@@ -22,6 +29,9 @@ class event:
 
     The callback can be either a function or a plugin method
 
+    The regexp can also be a :class:`~irc3.message.match` instance. See
+    :mod:`irc3.message`
+
     If you specify the `iotype` parameter to `"out"` then the event will be
     triggered when the regexp match something **sent** by the bot.
 
@@ -42,10 +52,13 @@ class event:
             re_out = getattr(regexp, 're_out', None)
             if re_out is not None:
                 regexp = re_out
-        try:
-            re.compile(getattr(regexp, 're', regexp))
-        except Exception as e:
-            raise e.__class__(str(e) + ' in ' + getattr(regexp, 're', regexp))
+        self.structured = getattr(regexp, 'structured', False)
+        if not self.structured:
+            try:
+                re.compile(getattr(regexp, 're', regexp))
+            except Exception as e:
+                raise e.__class__(
+                    str(e) + ' in ' + getattr(regexp, 're', regexp))
         self.regexp = regexp
         self.iotype = iotype
         self.callback = callback
@@ -58,10 +71,12 @@ class event:
         return self.callback(**kwargs)
 
     def compile(self, config):
+        if self.structured:
+            return self.regexp.compile(config)
         regexp = getattr(self.regexp, 're', self.regexp)
         if config:
             regexp = regexp.format(**config)
-        return re.compile(regexp).match
+        return _compile(regexp)
 
     def __call__(self, func):
         def callback(context, name, ob):
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+from inspect import getmembers
+import venusian
+import weakref
+import copy
+__doc__ = '''
+==============================================
+:mod:`irc3.fleet` Many bots on one loop
+==============================================
+
+A :class:`Fleet` runs many bots on the same loop. The bots share what does
+not depend on a bot instance:
+
+- the config is parsed once. Each bot use a copy of the base config (and of
+  its sections and lists) updated with its own values
+
+- the logging config is applied once
+
+- plugin modules are scanned once. The venusian callbacks found are replayed
+  for each bot
+
+- the lists of events by command (see :meth:`~irc3.base.Registry.get_index`)
+  are shared by the bots which have the same events. A list is forgotten
+  when no bot use it anymore
+
+Plugins instances, events callbacks and connections are still per bot::
+
+    >>> from irc3.compat import asyncio
+    >>> from irc3 import IrcBot
+    >>> fleet = Fleet(dict(includes=['irc3.plugins.core'], level=1000),
+    ...               factory=IrcBot, loop=asyncio.new_event_loop())
+    >>> bot1 = fleet.add('bot1', nick='bot1')
+    >>> bot2 = fleet.add('bot2', nick='bot2')
+    >>> bot1.config.botnet is bot2.config.botnet is fleet.bots
+    True
+    >>> bot1.get_plugin('irc3.plugins.core.Core') is \\
+    ...     bot2.get_plugin('irc3.plugins.core.Core')
+    False
+
+``irc3`` use a fleet when the config file has some ``bot_*`` sections. Each
+section is a bot::
+
+    [bot]
+    nick = irc3
+    host = irc.libera.chat
+    includes =
+        irc3.plugins.core
+
+    [bot_2]
+    nick = irc3_2
+    host = irc.oftc.net
+
+API
+===
+
+.. autoclass:: Fleet
+   :members:
+
+'''
+
+
+def _copy_config(value):
+    """Copy the dicts and lists of a config value"""
+    if isinstance(value, dict):
+        value = copy.copy(value)
+        for k, v in value.items():
+            if isinstance(v, (dict, list)):
+                value[k] = _copy_config(v)
+    elif isinstance(value, list):
+        value = [_copy_config(v) for v in value]
+    return value
+
+
+class Fleet:
+    """A set of bots running on the same loop"""
+
+    def __init__(self, config=None, factory=None, loop=None):
+        if factory is None:
+            from irc3 import IrcBot as factory
+        self.factory = factory
+        self.config = dict(config or {})
+        self.loop = loop
+        self.bots = {}
+        # logging config applied by the first bot
+        self.logging_config = None
+        # (module name, categories) -> [(callback, name, ob)]
+        self.callbacks = {}
+        # shared lists of events. see Registry.get_index
+        self.tables = weakref.WeakValueDictionary()
+
+    def add(self, name, **config):
+        """Create a bot named ``name`` with the base config updated with
+        ``config``"""
+        config = dict(
+            ((k, _copy_config(v)) for k, v in self.config.items()), **config)
+        config.update(fleet=self, botnet=self.bots)
+        if self.loop is not None:
+            config['loop'] = self.loop
+        bot = self.factory.from_config(config)
+        if self.loop is None:
+            self.loop = bot.loop
+        self.bots[name] = bot
+        return bot
+
+    def get_callbacks(self, module, categories):
+        """Return the venusian callbacks of ``module`` as a list of
+        ``(callback, name, ob)``. The module is scanned once like
+        ``venusian.Scanner.scan()`` does"""
+        key = (module.__name__,
+               None if categories is None else tuple(categories))
+        callbacks = self.callbacks.get(key)
+        if callbacks is None:
+            callbacks = self.callbacks[key] = []
+            mod_name = module.__name__
+            for name, ob in getmembers(module):
+                try:
+                    attached = getattr(ob, venusian.ATTACH_ATTR)
+                    if not attached.attached_to(mod_name, name, ob):
+                        continue
+                except Exception:
+                    continue
+                keys = categories
+                if keys is None:
+                    keys = sorted(attached.keys())
+                for category in keys:
+                    for callback, cb_mod_name, liftid, scope in \
+                            attached.get(category, []):
+                        if cb_mod_name == mod_name:
+                            callbacks.append((callback, name, ob))
+        return callbacks
+
+    def forget(self, module_name):
+        """Forget the callbacks of a reloaded module"""
+        for key in list(self.callbacks):
+            if key[0] == module_name:
+                del self.callbacks[key]
+
+    def run(self, forever=True):
+        """Connect all bots"""
+        for bot in self.bots.values():
+            bot.create_connection()
+        if self.bots:
+            bot.add_signal_handlers()
+        if forever:
+            self.loop.run_forever()
+
+    @classmethod
+    def from_argv(cls, argv=None, factory=None):
+        """Parse the command line and config once. Return a fleet with a
+        ``bot`` and a bot per ``bot_*`` section. Bots are connected"""
+        fleet = cls(factory=factory)
+        bot = fleet.factory.from_argv(argv, fleet=fleet, botnet=fleet.bots)
+        fleet.loop = bot.loop
+        fleet.bots['bot'] = bot
+        sections = [(section, bot.config.pop(section))
+                    for section in list(bot.config)
+                    if section.startswith('bot_')]
+        fleet.config = dict(bot.config)
+        for section, config in sections:
+            fleet.add(section, **config).run(forever=False)
+        return fleet
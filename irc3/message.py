@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+from .utils import IrcString
+from .utils import as_mask
+from . import tags as tags_
+__doc__ = '''
+==============================================
+:mod:`irc3.message` Structured messages
+==============================================
+
+A line is parsed once into a :class:`Message`::
+
+    >>> msg = Message.parse('@aaa=bbb :gawel!u@h PRIVMSG #irc3 :Hello world')
+    >>> print(msg.command, msg.params)
+    PRIVMSG ['#irc3', 'Hello world']
+    >>> print(msg.mask.nick)
+    gawel
+    >>> print(msg.tags)
+    {'aaa': 'bbb'}
+
+Events can use a :class:`match` instead of a regexp. Those events do not use
+regexps at all. Positional parameters are bound to the given names::
+
+    >>> from irc3.testing import IrcBot
+    >>> from irc3 import event
+
+    >>> bot = IrcBot(nick='nono')
+    >>> def echo(mask=None, target=None, data=None, **kwargs):
+    ...     bot.privmsg(target, data)
+    >>> bot.attach_events(event(match('PRIVMSG', 'target', 'data',
+    ...                                target=lambda t: t.is_channel), echo))
+    >>> bot.test(':gawel!u@h PRIVMSG #irc3 :Hello world')
+    PRIVMSG #irc3 :Hello world
+    >>> bot.test(':gawel!u@h PRIVMSG nono :Hello world')
+
+String predicates are formatted with the bot's config and must be equal.
+Predicates with a ``match`` method (like compiled regexps) are also allowed::
+
+    >>> import re
+    >>> bot.attach_events(event(match('PRIVMSG', 'target', 'data',
+    ...                                target='{nick}',
+    ...                                data=re.compile('!')), echo))
+    >>> bot.test(':gawel!u@h PRIVMSG nono :!Hello world')
+    PRIVMSG nono :!Hello world
+
+If the last name ends with ``...`` then it gets all the remaining parameters
+joined by spaces::
+
+    >>> bot.attach_events(event(match('MODE', 'target', 'modes', 'data...'),
+    ...                         echo))
+    >>> bot.test(':gawel!u@h MODE #irc3 +ov gawel nono')
+    PRIVMSG #irc3 :gawel nono
+
+Callbacks get the named parameters, ``mask`` (the prefix), ``event`` (the
+command), ``tags`` (if any) and ``message`` (the :class:`Message` instance).
+
+Structured events are dispatched after regexp events.
+
+API
+===
+
+.. autoclass:: Message
+   :members:
+
+.. autoclass:: match
+'''
+
+
+class Message:
+    """A parsed irc line"""
+
+    __slots__ = ('raw', 'tagstring', 'prefix', 'command', 'params', '_tags')
+
+    def __init__(self, raw, command, params, prefix=None, tagstring=None):
+        self.raw = raw
+        self.command = command
+        self.params = params
+        self.prefix = prefix
+        self.tagstring = tagstring
+        self._tags = None
+
+    @classmethod
+    def parse(cls, line):
+        """Parse a line. Tags are only decoded when accessed:
+
+        .. code-block:: py
+
+            >>> msg = Message.parse('PING :irc.com')
+            >>> print(msg.command, msg.params, msg.prefix, msg.tags)
+            PING ['irc.com'] None {}
+            >>> msg = Message.parse(':srv 005 nono CHANTYPES=# :are supported')
+            >>> print(msg.prefix, msg.command, msg.params)
+            srv 005 ['nono', 'CHANTYPES=#', 'are supported']
+        """
+        raw = line
+        tagstring = prefix = None
+        if line[:1] == '@':
+            tagstring, _, line = line[1:].partition(' ')
+            line = line.lstrip(' ')
+        if line[:1] == ':':
+            prefix, _, line = line[1:].partition(' ')
+            line = line.lstrip(' ')
+        line, sep, trailing = line.partition(' :')
+        params = line.split()
+        if sep:
+            params.append(trailing)
+        command = params.pop(0) if params else ''
+        return cls(raw, command, params, prefix=prefix, tagstring=tagstring)
+
+    @property
+    def tags(self):
+        """tags as a dict. Invalid tags are ignored"""
+        if self._tags is None:
+            try:
+                self._tags = tags_.decode(self.tagstring)
+            except ValueError:
+                self._tags = {}
+        return self._tags
+
+    @property
+    def mask(self):
+        """the prefix as an :class:`~irc3.utils.IrcString`"""
+        if self.prefix is not None:
+            return as_mask(self.prefix)
+
+    def __repr__(self):
+        return '<Message %s %r>' % (self.command, self.params)
+
+
+class match:
+    """A structured matcher. Use it as an event's regexp::
+
+        @irc3.event(match('PRIVMSG', 'target', 'data'))
+        def on_privmsg(bot, mask=None, target=None, data=None, **kwargs):
+            pass
+
+    ``command`` can be a string or a tuple of strings (verbs or numerics).
+    """
+
+    structured = True
+
+    def __init__(self, command, *names, **predicates):
+        if isinstance(command, str):
+            command = (command,)
+        self.commands = tuple(str(c) for c in command)
+        self.names = names
+        self.predicates = predicates
+        self.name = '|'.join(self.commands)
+
+    def compile(self, config=None):
+        predicates = []
+        for key, value in self.predicates.items():
+            if isinstance(value, str):
+                if config:
+                    value = value.format(**config)
+                value = value.__eq__
+            elif hasattr(value, 'match'):
+                value = value.match
+            predicates.append((key, value))
+        names = list(self.names)
+        last = None
+        if names and names[-1].endswith('...'):
+            names[-1] = names[-1][:-3]
+            last = len(names) - 1
+
+        def matcher(msg):
+            params = msg.params
+            kwargs = {'event': IrcString(msg.command), 'message': msg}
+            if msg.prefix is not None:
+                kwargs['mask'] = as_mask(msg.prefix)
+            if msg.tagstring is not None:
+                kwargs['tags'] = IrcString(msg.tagstring)
+            for i, name in enumerate(names):
+                if i == last and len(params) > i:
+                    kwargs[name] = IrcString(' '.join(params[i:]))
+                elif i < len(params):
+                    kwargs[name] = IrcString(params[i])
+                else:
+                    kwargs[name] = None
+            for key, predicate in predicates:
+                value = kwargs.get(key)
+                if value is None or not predicate(value):
+                    return None
+            return kwargs
+        return matcher
+
+    def __repr__(self):
+        return '<match %s %r>' % (self.name, self.names)
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
+from irc3 import utils
 import functools
-import string
 import irc3
 __doc__ = '''
 ================================================
@@ -45,27 +45,12 @@ class Casefold:
         self.bot.casefold = functools.partial(self.casefold)
 
     # casemapping
-    @irc3.event(r'^:\S+ 005 \S+ .+CASEMAPPING.*')
-    def recalculate_casemaps(self):
-        casemapping = self.bot.config['server_config'].get('CASEMAPPING',
-                                                           'rfc1459')
-
-        if casemapping == 'rfc1459':
-            lower_chars = (
-                string.ascii_lowercase + ''.join(
-                    chr(i) for i in range(123, 127))
-            )
-            upper_chars = (
-                string.ascii_uppercase + ''.join(chr(i) for i in range(91, 95))
-            )
-
-        elif casemapping == 'ascii':
-            lower_chars = string.ascii_lowercase
-            upper_chars = string.ascii_uppercase
-
-        table_in = (ord(char) for char in upper_chars)
-        self._lower_trans = dict(zip(table_in, lower_chars))
-        return
+    @irc3.event(r'^:\S+ 005 \S+ .*CASEMAPPING=(?P<casemapping>\S+).*')
+    def recalculate_casemaps(self, casemapping=None):
+        if casemapping is None:
+            casemapping = self.bot.config['server_config'].get(
+                'CASEMAPPING', 'rfc1459')
+        self._lower_trans = utils.casemap_table(casemapping)
 
     def casefold(self, in_str):
         """Casefold the given string, with the current server's casemapping."""
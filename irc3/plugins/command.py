@@ -19,6 +19,8 @@ __doc__ = '''
 Introduce a ``@command`` decorator
 
 The decorator use `docopts <http://docopt.org/>`_ to parse command arguments.
+The usage of a command is parsed once (see :func:`get_parser`). Then only the
+arguments are parsed when the command is used.
 
 Usage
 =====
@@ -219,6 +221,74 @@ class mask_based_policy:
             'You are not allowed to use the %r command' % cmd_name)
 
 
+class Parser:
+    """A docopt parser built once from the ``%%`` lines of a command
+    docstring::
+
+        >>> parser = Parser('''Say hi
+        ...     %%hi [--loud] <nicks>...
+        ... ''')
+        >>> args = parser.parse(['hi', 'gawel', 'bob'], nick='irc3')
+        >>> args['<nicks>'], args['--loud']
+        (['gawel', 'bob'], False)
+        >>> parser.parse(['hi'], nick='irc3')
+        Traceback (most recent call last):
+        ...
+        docopt.DocoptExit: Usage:
+            irc3 hi [--loud] <nicks>...
+    """
+
+    # the program name used to build the pattern. the nick is only used in
+    # errors
+    prog = '%%'
+
+    def __init__(self, doc, options_first=False):
+        lines = [line.strip() for line in doc.strip().split('\n')]
+        self.lines = [line.strip('%%') for line in lines
+                      if line.startswith('%%')]
+        self.options_first = options_first
+        doc = self.format_usage(self.prog)
+        self.options = docopt.parse_defaults(doc)
+        pattern = docopt.parse_pattern(
+            docopt.formal_usage(docopt.printable_usage(doc)), self.options)
+        pattern_options = set(pattern.flat(docopt.Option))
+        for ao in pattern.flat(docopt.AnyOptions):
+            ao.children = list(set(self.options) - pattern_options)
+        self.pattern = pattern.fix()
+        # printable usages by nick
+        self.usages = {}
+
+    def format_usage(self, nick):
+        return 'Usage:\n    ' + '\n    '.join(
+            nick + ' ' + line for line in self.lines)
+
+    def parse(self, argv, nick='-'):
+        """Parse argv (the command name and its arguments). Return a dict
+        like ``docopt.docopt()`` or raise ``docopt.DocoptExit``"""
+        usage = self.usages.get(nick)
+        if usage is None:
+            usage = self.usages[nick] = docopt.printable_usage(
+                self.format_usage(nick))
+        docopt.DocoptExit.usage = usage
+        argv = docopt.parse_argv(
+            docopt.TokenStream(argv, docopt.DocoptExit),
+            list(self.options), self.options_first)
+        matched, left, collected = self.pattern.match(argv)
+        if matched and left == []:
+            # default values of repeated arguments are shared by the pattern
+            return docopt.Dict(
+                (a.name, list(a.value) if type(a.value) is list else a.value)
+                for a in (self.pattern.flat() + collected))
+        raise docopt.DocoptExit()
+
+
+@functools.lru_cache(maxsize=1024)
+def get_parser(doc, options_first=False):
+    """Return the :class:`Parser` of a docstring. Parsers are shared by all
+    the commands (and bots) with the same docstring"""
+    return Parser(doc, options_first=options_first)
+
+
 def attach_command(func, depth=2, **predicates):
     commands = predicates.pop('commands',
                               'irc3.plugins.command.Commands')
@@ -322,11 +392,8 @@ class Commands(dict):
     def do_command(self, predicates, meth, client, target, data=None, **kw):
         nick = self.context.nick or '-'
         to = client.nick if target == nick else target
-        doc = meth.__doc__ or ''
-        doc = [line.strip() for line in doc.strip().split('\n')]
-        doc = [nick + ' ' + line.strip('%%')
-               for line in doc if line.startswith('%%')]
-        doc = 'Usage:' + '\n    ' + '\n    '.join(doc)
+        parser = get_parser(meth.__doc__ or '',
+                            predicates.get('options_first', False))
         if data:
             if not isinstance(data, str):  # pragma: no cover
                 encoding = self.context.encoding
@@ -338,12 +405,9 @@ class Commands(dict):
             if not predicates.get('quiet', False):
                 self.context.privmsg(to, 'Invalid arguments: {}.'.format(e))
             return
-        docopt_args = dict(help=False)
-        if "options_first" in predicates:
-            docopt_args.update(options_first=predicates["options_first"])
         cmd_name = predicates.get('name', meth.__name__)
         try:
-            args = docopt.docopt(doc, [cmd_name] + data, **docopt_args)
+            args = parser.parse([cmd_name] + data, nick=nick)
         except docopt.DocoptExit as exc:
             if not predicates.get('quiet', False):
                 args = {'cmd': cmd_name, 'args': data,
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from irc3 import event
+from irc3 import utils
 from irc3 import rfc
 __doc__ = '''
 ==============================================
@@ -8,6 +9,20 @@ __doc__ = '''
 
 Core events
 
+Capabilities negotiation
+------------------------
+
+When the bot or its plugins want some capabilities (see
+:meth:`irc3.IrcBot.get_caps`), ``CAP LS 302`` is sent with the registration
+lines. The wanted capabilities supported by the server are requested with a
+single ``CAP REQ``. On reconnection, the capabilities supported by the
+previous server are requested with ``CAP LS`` without waiting for the list.
+``CAP END`` is sent once the server replied and the plugins which hold the
+negotiation (like :mod:`irc3.plugins.sasl`) are done.
+
+The seconds between the connection and the ``server_ready`` event are stored
+in ``bot.registration_delay``.
+
 .. autoclass:: Core
    :members:
 
@@ -29,17 +44,55 @@ class Core:
         self.max_lag = int(self.bot.config.get('max_lag'))
         self.reconn_handle = None
         self.ping_handle = None
+        self.ping_at = None
         self.nick_handle = None
+        # capabilities negotiation
+        self.negotiating = False
+        self.listed = False
+        self.notified = False
+        self.pending = 0
+        self.requested_caps = set()
+        self.pipelined_caps = set()
+        self.rejected_caps = set()
+        self.cap_holds = set()
         self.before_connect_events = [
             event(rfc.CONNECTED, self.connected),
+            event(r"^:\S+ 004 \S+ (?P<srv>\S+) (?P<version>\S+).*",
+                  self.set_version),
             event(r"^:\S+ 005 \S+ (?P<data>.+) :\S+.*",
                   self.set_config),
         ]
 
+    def connection_ready(self):
+        """Send ``CAP LS 302`` before the registration lines when some
+        capabilities are wanted. Also request the ones supported by the
+        previous server"""
+        caps = self.bot.get_caps()
+        self.negotiating = bool(caps)
+        self.listed = self.notified = False
+        self.pending = 0
+        self.requested_caps = set()
+        self.rejected_caps = set()
+        self.cap_holds.clear()
+        if caps:
+            lines = ['CAP LS 302']
+            caps &= set(self.bot.server_caps)
+            self.pipelined_caps = caps
+            if caps:
+                self.pending += 1
+                self.requested_caps.update(caps)
+                lines.append('CAP REQ :' + ' '.join(sorted(caps)))
+            self.bot.send('\r\n'.join(lines))
+
     def connection_made(self, client=None):
         # handle server config
         config = self.bot.defaults['server_config'].copy()
         self.bot.config['server_config'] = config
+        self.bot.config['server_version'] = None
+        self.bot.caps.clear()
+        self.bot.hostmask = None
+        self.bot.server_caps.clear()
+        self.bot.registration_delay = None
         self.bot.detach_events(*self.before_connect_events)
         self.bot.attach_events(insert=True, *self.before_connect_events)
 
@@ -50,6 +103,15 @@ class Core:
     def connected(self, **kwargs):
         """triger the server_ready event"""
         self.bot.log.info('Server config: %r', self.bot.server_config)
+        self.negotiating = False
+        self.bot.reconnection.ready()
+        self.bot.registration_delay = delay = \
+            self.bot.loop.time() - self.connection_made_at
+        self.bot.log.info('Registered in %.3fs', delay)
+
+        # merge lines using TARGMAX
+        if self.bot.queue is not None:
+            self.bot.queue.set_targmax(self.bot.server_config)
 
         # recompile when I'm sure of my nickname
         self.bot.config['nick'] = kwargs['me']
@@ -72,22 +134,27 @@ class Core:
 
     @event(rfc.PONG)
     def pong(self, event='PONG', data='', **kw):  # pragma: no cover
-        """P0NG/PING"""
+        """P0NG/PING. The lag is given to :mod:`irc3.reconnect`"""
         self.bot.log.debug('%s ping-pong (%s)', event, data)
+        now = self.bot.loop.time()
+        if event == 'PONG' and self.ping_at is not None and \
+           now >= self.ping_at:
+            self.bot.reconnection.pong(now - self.ping_at)
         if self.reconn_handle is not None:
             self.reconn_handle.cancel()
         self.reconn_handle = self.bot.loop.call_later(self.timeout,
                                                       self.reconnect)
         if self.ping_handle is not None:
             self.ping_handle.cancel()
+        self.ping_at = now + self.timeout - self.max_lag
         self.ping_handle = self.bot.loop.call_later(
-            self.timeout - self.max_lag, self.bot.send,
-            'PING :%s' % int(self.bot.loop.time()))
+            self.timeout - self.max_lag, self.bot.send, 'PING :%s' % int(now))
 
     @event(rfc.PING)
     def ping(self, data):
-        """PING reply"""
-        self.bot.send('PONG :' + data)
+        """PING reply. Queued ahead of the other lines (see
+        :mod:`irc3.sendq`)"""
+        self.bot.send_line('PONG :' + data)
         self.pong(event='PING', data=data)
 
     @event(rfc.NEW_NICK)
@@ -96,6 +163,40 @@ class Core:
         if self.bot.nick == nick.nick:
             self.bot.config['nick'] = new_nick
             self.bot.recompile()
+            if self.bot.hostmask is not None:
+                self.set_hostmask(new_nick, self.bot.hostmask.username,
+                                  self.bot.hostmask.hostname)
+
+    def set_hostmask(self, nick, username, host):
+        self.bot.hostmask = utils.IrcString(
+            '%s!%s@%s' % (nick, username, host))
+
+    @event(r'^:\S+ 001 (?P<me>\S+) :.* (?P<mask>[^ !]+![^ @]+@\S+)$')
+    def welcome(self, me=None, mask=None, **kw):
+        """Get the bot's hostmask from RPL_WELCOME"""
+        if mask.nick == me:
+            self.set_hostmask(me, mask.username, mask.hostname)
+
+    @event(r'^:\S+ 396 (?P<me>\S+) (?P<host>\S+) :.*')
+    def hosthidden(self, me=None, host=None, **kw):
+        """Update the bot's hostmask on RPL_HOSTHIDDEN"""
+        mask = self.bot.hostmask
+        if mask is not None:
+            username, _, host = host.rpartition('@')
+            self.set_hostmask(me, username or mask.username, host)
+
+    @event(r'^(@(?P<tags>\S+) )?:(?P<mask>\S+) '
+           r'CHGHOST (?P<username>\S+) (?P<host>\S+)')
+    def chghost(self, mask=None, username=None, host=None, **kw):
+        """Update the bot's hostmask on CHGHOST"""
+        if mask.nick == self.bot.nick:
+            self.set_hostmask(mask.nick, username, host)
+
+    @event(rfc.JOIN)
+    def join(self, mask=None, **kw):
+        """Get the bot's hostmask from its own JOIN"""
+        if mask.nick == self.bot.nick and mask != self.bot.hostmask:
+            self.set_hostmask(mask.nick, mask.username, mask.hostname)
 
     @event(rfc.ERR_NICK)
     def badnick(self, me=None, nick=None, **kw):
@@ -106,6 +207,86 @@ class Core:
         self.nick_handle = self.bot.loop.call_later(
             30, self.bot.set_nick, self.bot.original_nick)
 
+    @event(r'^(@(?P<tags>\S+) )?:\S+ CAP \S+ '
+           r'(?P<subcommand>LS|ACK|NAK|NEW|DEL)(?P<more> \*)? :(?P<data>.*)')
+    def cap(self, subcommand=None, more=None, data=None, **kwargs):
+        """Store server capabilities (``bot.server_caps``) and the
+        acknowledged ones (``bot.caps``). Request the wanted ones"""
+        for cap in data.split():
+            if subcommand in ('LS', 'NEW'):
+                cap, _, value = cap.partition('=')
+                self.bot.server_caps[cap] = value or None
+            elif subcommand == 'DEL':
+                self.bot.server_caps.pop(cap, None)
+                self.bot.caps.discard(cap)
+            elif subcommand == 'NAK':
+                continue
+            elif cap.startswith('-'):
+                self.bot.caps.discard(cap[1:])
+            else:
+                self.bot.caps.add(cap)
+        if subcommand in ('ACK', 'NAK') and self.pending:
+            self.pending -= 1
+        if subcommand == 'NAK':
+            self.bot.log.warning('Capabilities rejected: %s', data)
+            caps = set(data.split())
+            self.requested_caps -= caps
+            if caps != self.pipelined_caps:
+                self.rejected_caps |= caps
+            self.pipelined_caps = set()
+        if not self.negotiating:
+            if subcommand == 'NEW':
+                self.request_caps()
+        elif subcommand == 'LS' and not more:
+            self.listed = True
+            self.request_caps()
+        elif subcommand == 'NAK' and self.listed:
+            # the REQ sent with CAP LS may fail if the server changed. retry
+            # with the listed caps
+            self.request_caps()
+        elif subcommand in ('ACK', 'NAK'):
+            self.cap_end()
+
+    def request_caps(self):
+        """Request the wanted capabilities supported by the server with a
+        single ``CAP REQ``"""
+        caps = self.bot.get_caps() & set(self.bot.server_caps)
+        caps -= self.bot.caps | self.requested_caps | self.rejected_caps
+        if caps:
+            self.pending += 1
+            self.requested_caps.update(caps)
+            self.bot.send_line('CAP REQ :' + ' '.join(sorted(caps)),
+                               nowait=True)
+        else:
+            self.cap_end()
+
+    def hold(self, name):
+        """Do not send ``CAP END`` until :meth:`release` is called with the
+        same name"""
+        self.cap_holds.add(name)
+
+    def release(self, name):
+        """Release a :meth:`hold` and send ``CAP END`` if possible"""
+        self.cap_holds.discard(name)
+        self.cap_end()
+
+    def cap_end(self):
+        """Send ``CAP END`` when the server replied to all ``CAP REQ`` and
+        nothing hold the negotiation. Plugins get a ``caps_negotiated``
+        notification before"""
+        if not self.negotiating or self.pending or not self.listed:
+            return
+        if not self.notified:
+            self.notified = True
+            self.bot.notify('caps_negotiated')
+        if not self.cap_holds:
+            self.negotiating = False
+            self.bot.send_line('CAP END', nowait=True)
+
+    def set_version(self, version=None, **kwargs):
+        """Store server version (rfc rpl 004)"""
+        self.bot.config['server_version'] = version
+
     def set_config(self, data=None, **kwargs):
         """Store server config"""
         config = self.bot.config['server_config']
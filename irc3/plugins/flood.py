@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import irc3
+__doc__ = '''
+================================================
+:mod:`irc3.plugins.flood` Adaptive flood control
+================================================
+
+Tune the flood control (see :mod:`irc3.sendq`) for the server the bot is
+connected to.
+
+When the server is ready, the ircd family is guessed from the start of the
+version sent in the 004 reply (and some 005 tokens) and the matching preset is
+used. Then:
+
+- the rate is divided by 2 when the server says we are too fast (263
+  ``RPL_TRYAGAIN``, 439 ``ERR_TARGETTOOFAST`` or an ``Excess Flood`` error)
+
+- the rate is raised by 10% every ``probe_interval`` seconds if the lines
+  sent since the last probe waited in the queue more than the time to refill
+  a token (so the flood control was the bottleneck) and the server did not
+  complain. Up to ``max_factor`` times the preset's rate
+
+..
+    >>> from irc3.testing import IrcBot
+    >>> from irc3.testing import ini2config
+
+Usage::
+
+    >>> config = ini2config("""
+    ... [bot]
+    ... includes =
+    ...     irc3.plugins.flood
+    ... [irc3.plugins.flood]
+    ... # force a preset. default to auto
+    ... preset = auto
+    ... probe_interval = 60
+    ... max_factor = 2
+    ... min_factor = .25
+    ... """)
+    >>> bot = IrcBot(**config)
+
+Presets are ``burst`` (lines), ``rate`` (lines per second) and ``line_bytes``
+(see ``flood_line_bytes``). You can add or override presets in the config::
+
+    [irc3.plugins.flood]
+    ircu = burst=5 rate=.5 line_bytes=240
+
+The ``default`` preset use the bot's ``flood_*`` options.
+
+.. autoclass:: Flood
+   :members:
+
+'''
+
+
+@irc3.plugin
+class Flood:
+    """Adaptive flood control. The current state is available as
+    ``bot.flood``"""
+
+    requires = [
+        'irc3.plugins.core',
+    ]
+
+    presets = {
+        # 2 seconds + 1 second per 120 bytes. 10 seconds burst
+        'ircu': dict(burst=5, rate=.5, line_bytes=240),
+        # hybrid, ratbox, charybdis, solanum
+        'hybrid': dict(burst=5, rate=1.),
+        'unreal': dict(burst=5, rate=1., line_bytes=360),
+        'inspircd': dict(burst=5, rate=1.),
+        'ngircd': dict(burst=3, rate=1.),
+        'bahamut': dict(burst=5, rate=1.),
+    }
+
+    # prefixes of the 004 version
+    families = (
+        ('u2.', 'ircu'),
+        ('snircd', 'ircu'),
+        ('hybrid', 'hybrid'),
+        ('ircd-hybrid', 'hybrid'),
+        ('ratbox', 'hybrid'),
+        ('ircd-ratbox', 'hybrid'),
+        ('charybdis', 'hybrid'),
+        ('solanum', 'hybrid'),
+        ('unreal', 'unreal'),
+        ('inspircd', 'inspircd'),
+        ('ngircd', 'ngircd'),
+        ('bahamut', 'bahamut'),
+    )
+
+    # 005 tokens
+    tokens = (
+        ('ETRACE', 'hybrid'),
+        ('NAMESX', 'unreal'),
+    )
+
+    def __init__(self, bot):
+        self.bot = bot
+        bot.flood = self
+        config = dict(bot.config.get(__name__, {}))
+        self.preset = config.pop('preset', 'auto')
+        self.probe_interval = float(config.pop('probe_interval', 60))
+        self.max_factor = float(config.pop('max_factor', 2))
+        self.min_factor = float(config.pop('min_factor', .25))
+        self.presets = dict(self.presets, default=dict(
+            burst=bot.config.flood_burst,
+            rate=float(bot.config.flood_rate) / float(
+                bot.config.flood_rate_delay),
+            line_bytes=bot.config.flood_line_bytes,
+        ))
+        for name, value in config.items():
+            if isinstance(value, str) and '=' in value:
+                self.presets[name] = dict(
+                    (k, float(v)) for k, v in
+                    (opt.split('=', 1) for opt in value.split()))
+        self.family = 'default'
+        self.factor = 1.
+        self.waited = 0.
+        self.sent = 0
+        self.throttled_at = None
+        self.handle = None
+
+    @property
+    def bucket(self):
+        return self.bot.bucket
+
+    def guess_family(self):
+        """Guess the ircd family from 004 and 005 replies"""
+        version = (self.bot.config.get('server_version') or '').lower()
+        for prefix, family in self.families:
+            if version.startswith(prefix):
+                return family
+        server_config = self.bot.server_config
+        for token, family in self.tokens:
+            if token in server_config:
+                return family
+        return 'default'
+
+    def apply(self):
+        """Update the bucket with the current preset and factor"""
+        bucket = self.bucket
+        if bucket is None:
+            return
+        preset = self.presets[self.family]
+        bucket.rate = preset['rate'] * self.factor
+        bucket.burst = max(1., preset['burst'] * min(self.factor, 1.))
+        bucket.line_bytes = float(preset.get('line_bytes') or 0)
+        bucket.tokens = min(bucket.tokens, bucket.burst)
+        self.bot.log.debug(
+            'Flood control (%s x%.2f): burst=%s rate=%.2f/s',
+            self.family, self.factor, bucket.burst, bucket.rate)
+
+    def server_ready(self):
+        if self.preset == 'auto':
+            self.family = self.guess_family()
+        else:
+            self.family = self.preset
+        self.apply()
+        self.schedule()
+
+    def connection_lost(self):  # pragma: no cover
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def schedule(self):
+        if self.handle is not None:
+            self.handle.cancel()
+        self.handle = self.bot.loop.call_later(self.probe_interval,
+                                               self.probe)
+
+    def probe(self):
+        """Raise the rate if the lines sent since the last probe waited in
+        the queue longer than a token takes to refill and the server did not
+        throttle us"""
+        queue = self.bot.queue
+        bucket = self.bucket
+        now = self.bot.loop.time()
+        if queue is not None and bucket is not None:
+            waited, sent = queue.wait_total, queue.sent
+            if self.factor < self.max_factor and sent > self.sent:
+                wait = (waited - self.waited) / (sent - self.sent)
+                quiet = self.throttled_at is None or \
+                    now - self.throttled_at >= self.probe_interval
+                if quiet and wait * bucket.rate > 1:
+                    self.factor = min(self.max_factor, self.factor * 1.1)
+                    self.apply()
+            self.waited, self.sent = waited, sent
+        self.schedule()
+
+    @irc3.event(r'^:\S+ (?P<event>263|439) (?P<me>\S+) .*')
+    def throttled(self, event=None, **kwargs):
+        """Divide the rate by 2"""
+        self.bot.log.warning('Throttled by the server (%s)', event)
+        self.throttled_at = self.bot.loop.time()
+        self.factor = max(self.min_factor, self.factor / 2)
+        self.apply()
+        if self.bucket is not None:
+            self.bucket.tokens = 0.
+
+    @irc3.event(r'^ERROR :(?P<data>.*Excess Flood.*)')
+    def excess_flood(self, data=None, **kwargs):
+        self.throttled(event='ERROR')
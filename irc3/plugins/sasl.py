@@ -7,7 +7,9 @@ __doc__ = '''
 :mod:`irc3.plugins.sasl` SASL authentification
 ===================================================
 
-Allow to use sasl authentification
+Allow to use sasl authentification. The ``sasl`` capability is requested
+with the other capabilities (see :mod:`irc3.plugins.core`) and the
+authentication hold ``CAP END`` until the server replied
 
 ..
     >>> from irc3.testing import IrcBot
@@ -28,28 +30,29 @@ Usage::
 @irc3.plugin
 class Sasl:
 
+    requires = [
+        'irc3.plugins.core',
+    ]
+
+    capabilities = ['sasl']
+
     def __init__(self, bot):
         self.bot = bot
         self.events = [
-            irc3.event(r'^:\S+ CAP \S+ LS :(?P<data>.*)', self.cap_ls),
-            irc3.event(r'^:\S+ CAP \S+ ACK :.*sasl.*', self.cap_ack),
             irc3.event(r'AUTHENTICATE +', self.authenticate),
-            irc3.event(r'^:\S+ 903 \S+ :SASL authentication successful',
-                       self.cap_end),
+            irc3.event(r'^:\S+ (?P<event>90[2-7]) \S+ :(?P<data>.*)',
+                       self.done),
         ]
 
-    def connection_ready(self, *args, **kwargs):
-        self.bot.send('CAP LS\r\n')
-        self.bot.attach_events(*self.events)
-
-    def cap_ls(self, data=None, **kwargs):
-        if 'sasl' in data.lower():
-            self.bot.send_line('CAP REQ :sasl')
-        else:
-            self.cap_end()
+    @property
+    def core(self):
+        return self.bot.get_plugin(utils.maybedotted('irc3.plugins.core.Core'))
 
-    def cap_ack(self, **kwargs):
-        self.bot.send_line('AUTHENTICATE PLAIN')
+    def caps_negotiated(self):
+        if 'sasl' in self.bot.caps:
+            self.core.hold('sasl')
+            self.bot.attach_events(*self.events)
+            self.bot.send_line('AUTHENTICATE PLAIN', nowait=True)
 
     def authenticate(self, **kwargs):
         auth = ('{sasl_username}\0'
@@ -57,10 +60,12 @@ class Sasl:
                 '{sasl_password}').format(**self.bot.config)
         auth = base64.encodebytes(auth.encode('utf8'))
         auth = auth.decode('utf8').rstrip('\n')
-        self.bot.send_line('AUTHENTICATE ' + auth)
+        self.bot.send_line('AUTHENTICATE ' + auth, nowait=True)
 
-    def cap_end(self, **kwargs):
-        self.bot.send_line('CAP END')
-        core = self.bot.get_plugin(utils.maybedotted('irc3.plugins.core.Core'))
-        core.pong(event='PING')
+    def done(self, event=None, data=None, **kwargs):
+        if event != '903':
+            self.bot.log.warning('SASL authentication failed: %s', data)
         self.bot.detach_events(*self.events)
+        core = self.core
+        core.release('sasl')
+        core.pong(event='PING')
@@ -4,7 +4,9 @@ from irc3 import utils
 from irc3 import rfc
 from irc3.dec import event
 from irc3.utils import IrcString
-from collections import defaultdict
+from collections.abc import MutableSet
+from collections.abc import Mapping
+import functools
 __doc__ = '''
 ==============================================
 :mod:`irc3.plugins.userlist` User list plugin
@@ -31,15 +33,110 @@ Usage::
     >>> print(list(bot.channels['#chan'].modes['@'])[0])
     gawel
 
+Nicks and channels are casefolded using the server's ``CASEMAPPING``::
+
+    >>> 'GAWEL' in bot.nicks, '#CHAN' in bot.channels
+    (True, True)
+
 Api
 ===
 
 .. autoclass:: Channel
 
+.. autoclass:: User
+
 '''
 
+# prefix -> bit used in Channel.members. Each Userlist use a copy where the
+# other prefixes found in the 005 PREFIX token get the next bits. Unknown
+# prefixes are ignored
+PREFIXES = {p: 1 << i for i, p in enumerate('~&@%+')}
+
+
+class User:
+    """A nick known by some channels. Records are shared by all the channels
+    of the :class:`Userlist`. So a nick is stored once and renaming a user
+    only change the record"""
+
+    __slots__ = ('nick', 'channels')
+
+    def __init__(self, nick):
+        self.nick = nick
+        self.channels = []
+
+    def __repr__(self):
+        return '<User %s>' % self.nick
+
+
+class Modes(MutableSet):
+    """The nicks of a channel which have a prefix. Nicks must be on the
+    channel to get a prefix: adding a nick which is not a member does
+    nothing"""
+
+    __slots__ = ('channel', 'bit')
+
+    def __init__(self, channel, bit):
+        self.channel = channel
+        self.bit = bit
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __contains__(self, nick):
+        user = self.channel.get_user(nick)
+        return user is not None and \
+            bool(self.channel.members.get(user, 0) & self.bit)
+
+    def __iter__(self):
+        bit = self.bit
+        return (u.nick for u, bits in self.channel.members.items()
+                if bits & bit)
+
+    def __len__(self):
+        bit = self.bit
+        return sum(1 for bits in self.channel.members.values() if bits & bit)
+
+    def add(self, nick):
+        members = self.channel.members
+        user = self.channel.get_user(nick)
+        if user in members:
+            members[user] |= self.bit
+
+    def discard(self, nick):
+        members = self.channel.members
+        user = self.channel.get_user(nick)
+        if user in members:
+            members[user] &= ~self.bit
+
+    def __repr__(self):
+        return repr(set(self))
+
+
+class ChannelModes(Mapping):
+    """prefix -> :class:`Modes`. Like a ``defaultdict(set)``. An unknown
+    prefix gives an empty view"""
+
+    __slots__ = ('channel',)
 
-class Channel(set):
+    def __init__(self, channel):
+        self.channel = channel
+
+    def __getitem__(self, prefix):
+        return Modes(self.channel, self.channel.prefixes.get(prefix, 0))
+
+    def __iter__(self):
+        used = 0
+        for bits in self.channel.members.values():
+            used |= bits
+        return (p for p, bit in list(self.channel.prefixes.items())
+                if used & bit)
+
+    def __len__(self):
+        return sum(1 for p in self)
+
+
+class Channel(MutableSet):
     """A set like object which contains nicknames that are on the channel and
     user modes:
 
@@ -56,26 +153,97 @@ class Channel(set):
         False
         >>> 'gawel' in channel.modes['@']
         False
+
+    Members are :class:`User` records taken from ``users`` (a casefolded
+    mapping of nick -> record shared by channels) with a bitmask of their
+    prefixes. Bits are taken from ``prefixes`` (a prefix -> bit mapping
+    shared by channels):
+
+    .. code-block:: python
+
+        >>> channel.add('Gawel[]', modes='+')
+        >>> channel.members
+        {<User Gawel[]>: 16}
+        >>> channel.users['gawel{}'].channels == [channel]
+        True
     """
 
-    def __init__(self):
-        set.__init__(self)
-        self.modes = defaultdict(set)
+    __slots__ = ('users', 'prefixes', 'members', 'topic')
+
+    def __init__(self, users=None, prefixes=PREFIXES):
+        if users is None:
+            users = utils.IrcDict()
+        self.users = users
+        self.prefixes = prefixes
+        # User -> prefixes bitmask
+        self.members = {}
         self.topic = None
 
-    def add(self, item, modes=''):
-        set.add(self, item)
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    @property
+    def modes(self):
+        return ChannelModes(self)
+
+    def get_user(self, nick):
+        if isinstance(nick, str):
+            return self.users.get(nick)
+
+    def __contains__(self, nick):
+        return self.get_user(nick) in self.members
+
+    def __iter__(self):
+        return (u.nick for u in self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, nick, modes=''):
+        users = self.users
+        user = users.get(nick)
+        if user is None:
+            user = users[nick] = User(nick)
+        bits = self.members.get(user)
+        if bits is None:
+            user.channels.append(self)
+            bits = 0
+        prefixes = self.prefixes
         for mode in modes:
-            self.modes[mode].add(item)
+            bits |= prefixes.get(mode, 0)
+        self.members[user] = bits
+
+    def discard(self, nick):
+        user = self.get_user(nick)
+        if user in self.members:
+            del self.members[user]
+            self.leave(user)
 
-    def remove(self, item):
-        try:
-            set.remove(self, item)
-        except KeyError:
-            pass
-        for items in self.modes.values():
-            if item in items:
-                items.remove(item)
+    remove = discard
+
+    def leave(self, user):
+        channels = user.channels
+        for i, channel in enumerate(channels):
+            if channel is self:
+                del channels[i]
+                break
+        if not channels:
+            self.users.pop(user.nick, None)
+
+    def clear(self):
+        members, self.members = self.members, {}
+        for user in members:
+            self.leave(user)
+
+    def difference(self, *others):
+        return set(self).difference(*others)
+
+    def union(self, *others):
+        return set(self).union(*others)
+
+    def intersection(self, *others):
+        return set(self).intersection(*others)
 
     def __repr__(self):
         return repr(sorted(self))
@@ -88,10 +256,36 @@ class Userlist:
         self.context = context
         self.connection_lost()
 
+    @event(r'^:\S+ 005 \S+ .*CASEMAPPING=(?P<casemapping>\S+).*')
+    def recalculate_casemap(self, casemapping=None):
+        if casemapping is None:
+            casemapping = self.context.server_config.get(
+                'CASEMAPPING', 'rfc1459')
+        self.casemap = utils.casemapper(casemapping)
+
+    @event(r'^:\S+ 005 \S+ (.* )?PREFIX=\([^)]*\)(?P<prefixes>\S*).*')
+    def register_prefixes(self, prefixes=None):
+        """Give a bit to the prefixes sent by the server"""
+        bits = self.prefixes
+        for prefix in prefixes:
+            if prefix not in bits:
+                bits[prefix] = 1 << len(bits)
+
+    def casefold(self, value):
+        """Casefold a nick or a channel using the server's CASEMAPPING"""
+        return self.casemap(value)
+
     def connection_lost(self, client=None):
-        self.channels = defaultdict(Channel)
+        self.recalculate_casemap()
+        # nick -> User. The users of all channels
+        self.users = utils.IrcDict(self.casefold)
+        # prefix -> bit. The prefixes of this server
+        self.prefixes = dict(PREFIXES)
+        self.channels = utils.IrcDict(
+            self.casefold,
+            functools.partial(Channel, self.users, self.prefixes))
         self.context.channels = self.channels
-        self.nicks = {}
+        self.nicks = utils.IrcDict(self.casefold)
         self.context.nicks = self.nicks
 
     def broadcast(self, *args, **kwargs):
@@ -116,13 +310,19 @@ class Userlist:
 
     def part(self, nick, mask=None, channel=None, client=None, **kwargs):
         if nick == self.context.nick:
-            self.channels.pop(channel, None)
+            channel = self.channels.pop(channel, None)
+            if channel is not None:
+                members = list(channel)
+                channel.clear()
+                # forget nicks which are no longer on a known channel
+                for member in members:
+                    if member not in self.users:
+                        self.nicks.pop(member, None)
         else:
             channel = self.channels[channel]
             self.broadcast(client=client, clients=channel, **kwargs)
             channel.remove(nick)
-            if client is None and all(
-                    nick not in c for c in self.channels.values()):
+            if client is None and nick not in self.users:
                 self.nicks.pop(nick, None)
 
     def quit(self, nick, mask, channel=None, client=None, **kwargs):
@@ -130,10 +330,10 @@ class Userlist:
             self.connection_lost()
         else:
             clients = set()
-            for channel in self.channels.values():
-                if nick in channel:
-                    clients.update(channel)
-                    channel.remove(nick)
+            user = self.users.get(nick)
+            for channel in list(user.channels) if user else ():
+                clients.update(channel)
+                channel.remove(nick)
             self.broadcast(client=client, clients=clients, **kwargs)
             self.nicks.pop(nick, None)
 
@@ -143,16 +343,19 @@ class Userlist:
         if client is None:
             self.nicks[new_nick] = new_nick + '!' + nick.host
             nick = nick.nick
+        else:
+            self.nicks[new_nick] = client
         clients = {new_nick}
-        for channel in self.channels.values():
-            if nick in channel:
-                for nicknames in channel.modes.values():
-                    if nick in nicknames:
-                        nicknames.add(new_nick)
-                channel.remove(nick)
+        user = self.users.pop(nick, None)
+        if user is not None:
+            # channels share the record
+            user.nick = new_nick
+            self.users[new_nick] = user
+            for channel in user.channels:
                 clients.update(channel)
-                channel.add(new_nick)
-        self.nicks.pop(nick, None)
+        if self.casefold(nick) != self.casefold(new_nick):
+            # nicks[new_nick] is nicks[nick] if only the case changed
+            self.nicks.pop(nick, None)
         self.broadcast(client=client, clients=clients, **kwargs)
 
     @event(rfc.RPL_NAMREPLY)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+from . import utils
+import random
+import time
+__doc__ = '''
+==============================================
+:mod:`irc3.reconnect` Reconnections
+==============================================
+
+When the connection is lost, can't be made or when the server does not reply
+to our PINGs (see :mod:`irc3.plugins.core`), the bot reconnects after a
+random delay between ``0`` and
+``min(reconnect_max_delay, reconnect_delay * 2 ** attempts)`` (exponential
+backoff with full jitter). A lot of bots disconnected by a server restart do
+not reconnect at the same time. ``attempts`` is reset when the server is
+ready::
+
+    >>> delays = Reconnect([('irc.com', 6667)], delay=2, max_delay=10,
+    ...                    rand=lambda: 1.)
+    >>> [delays.next_delay() for i in range(5)]
+    [2.0, 4.0, 8.0, 10.0, 10.0]
+
+Failover
+========
+
+The ``servers`` option is a list of ``host[:port]``. Each server has a health
+score. It is divided by 2 when the server fails and reset to 1 when the bot is
+registered. The bot reconnects to the server with the best score. The lag
+measured by the core plugin's PING is used when scores are equal::
+
+    >>> now = [0]
+    >>> reconnect = Reconnect(parse_servers('irc.com irc2.com:7000', 6697),
+    ...                       time=lambda: now[0])
+    >>> reconnect.server
+    <Server irc.com:6697 score=1.00>
+    >>> reconnect.failed()
+    <Server irc2.com:7000 score=1.00>
+    >>> reconnect.failed()
+    <Server irc.com:6697 score=0.50>
+
+A server only fails when the bot can't register or when the connection is
+lost less than ``reconnect_stable`` seconds after the registration. The
+loss of a stable connection does not change the score::
+
+    >>> reconnect.ready()
+    >>> now[0] = 3600
+    >>> reconnect.failed()
+    <Server irc.com:6697 score=1.00>
+
+Config::
+
+    [bot]
+    servers =
+        irc.example.com:6697
+        irc2.example.com:6697
+    # backoff base and max delay in seconds
+    reconnect_delay = 2
+    reconnect_max_delay = 300
+    # seconds after which a connection is stable
+    reconnect_stable = 60
+
+API
+===
+
+.. autofunction:: parse_servers
+
+.. autoclass:: Reconnect
+   :members:
+
+'''
+
+
+class Server:
+    """A server and its health"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = int(port)
+        self.score = 1.
+        self.failures = 0
+        self.lag = None
+
+    def __repr__(self):
+        return '<Server %s:%s score=%.2f>' % (self.host, self.port, self.score)
+
+
+def parse_servers(value, port=6667):
+    """Parse a list of ``host[:port]``::
+
+        >>> parse_servers('irc.com:7000 [::1]:6697 irc2.com ::1', 6667)
+        [('irc.com', 7000), ('::1', 6697), ('irc2.com', 6667), ('::1', 6667)]
+    """
+    servers = []
+    for value in utils.as_list(value):
+        if value.startswith('['):
+            host, _, value = value[1:].partition(']')
+            servers.append((host, int(value[1:] or port)))
+        elif value.count(':') == 1:
+            host, value = value.split(':')
+            servers.append((host, int(value)))
+        else:
+            servers.append((value, port))
+    return servers
+
+
+class Reconnect:
+    """Reconnection delays and servers health"""
+
+    def __init__(self, servers, delay=2., max_delay=300., rand=random.random,
+                 stable=60., time=time.monotonic):
+        self.servers = [Server(host, port) for host, port in servers]
+        self.server = self.servers[0]
+        self.delay = float(delay)
+        self.max_delay = float(max_delay)
+        self.rand = rand
+        self.stable = float(stable)
+        self.time = time
+        self.attempts = 0
+        # time of the registration on the current server
+        self.ready_at = None
+        self.handle = None
+
+    def next_delay(self):
+        """Return the delay before the next attempt"""
+        ceiling = self.delay * 2 ** min(self.attempts, 32)
+        self.attempts += 1
+        return self.rand() * min(self.max_delay, ceiling)
+
+    def failed(self):
+        """The connection to the current server is lost or can't be made.
+        Return the server to use"""
+        server = self.server
+        ready_at, self.ready_at = self.ready_at, None
+        if ready_at is not None and self.time() - ready_at >= self.stable:
+            # a stable connection was lost. the server is healthy
+            return server
+        server.failures += 1
+        server.score /= 2
+        self.server = max(
+            self.servers, key=lambda s: (s.score, -(s.lag or 0)))
+        return self.server
+
+    def ready(self):
+        """The bot is registered on the current server"""
+        self.attempts = 0
+        self.server.score = 1.
+        self.ready_at = self.time()
+
+    def pong(self, lag):
+        """Store the lag of the current server"""
+        self.server.lag = lag
+
+    def schedule(self, loop, callback):
+        """Call ``callback`` after :meth:`next_delay`. Return the delay"""
+        self.cancel()
+        delay = self.next_delay()
+        self.handle = loop.call_later(delay, callback)
+        return delay
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
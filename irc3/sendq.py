@@ -0,0 +1,569 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from collections import deque
+import itertools
+import logging
+__doc__ = '''
+==============================================
+:mod:`irc3.sendq` Outgoing queue
+==============================================
+
+Lines sent with :meth:`~irc3.IrcBot.send_line` (and so with
+:meth:`~irc3.IrcBot.privmsg`, :meth:`~irc3.IrcBot.notice`...) are queued
+in a :class:`SendQueue` and sent at the flood rate. The next line to send is
+encoded once: the bytes are used to compute its cost and are written as is.
+
+Scheduling
+==========
+
+Lines are sent in this order:
+
+- ``PONG`` lines go first. The core plugin queues its replies to the
+  server's ``PING``
+
+- other lines are served round-robin by target. A channel flooded by a
+  plugin does not delay the replies to other channels or users. The target
+  of ``JOIN``, ``PART``, ``MODE``, ``KICK`` and ``TOPIC`` is their channel so
+  they stay ordered with the messages sent to it. Lines without a target
+  (``NICK``, ``WHO``...) share a single slot and are never sent after a
+  newer line::
+
+    >>> from irc3.compat import asyncio
+    >>> loop = asyncio.new_event_loop()
+    >>> queue = SendQueue(loop)
+    >>> for line in ('PRIVMSG #a :1', 'PRIVMSG #a :2', 'PRIVMSG #b :1',
+    ...              'JOIN #c', 'PONG :irc.com'):
+    ...     queue.put(loop.create_future(), line)
+    >>> while queue:
+    ...     print(queue.pop()[1])
+    PONG :irc.com
+    PRIVMSG #a :1
+    PRIVMSG #b :1
+    JOIN #c
+    PRIVMSG #a :2
+
+The flood rate is enforced with a :class:`TokenBucket`. It holds
+``flood_burst`` lines and refills at ``flood_rate`` lines per
+``flood_rate_delay`` seconds. If ``flood_line_bytes`` is set, a line costs
+``1 + bytes / flood_line_bytes`` so long lines cost more. This is how ircu and
+hybrid compute the penalty of a client. For ircu (2 seconds + 1 second
+per 120 bytes, up to 10 seconds)::
+
+    flood_burst = 5
+    flood_rate = 1
+    flood_rate_delay = 2
+    flood_line_bytes = 240
+
+Merging
+=======
+
+With ``send_queue_merge = true``, queued PRIVMSG / NOTICE with the same text
+are sent as a single line with a comma separated list of targets. Only the
+next line of each target is merged so the lines sent to a target stay in
+order. The server's ``TARGMAX`` (or ``MAXTARGETS``) is respected. Nothing is
+merged if the server does not send one of them::
+
+    >>> queue = SendQueue(loop, merge=True)
+    >>> queue.set_targmax({'TARGMAX': 'PRIVMSG:3'})
+    >>> for target in ('#a', '#b', 'gawel', '#c', '#d'):
+    ...     queue.put(loop.create_future(), 'PRIVMSG %s :News!' % target)
+    >>> queue.put(loop.create_future(), 'NOTICE #a :News!')
+    >>> while queue:
+    ...     print(queue.pop()[1])
+    PRIVMSG #a,#b,gawel :News!
+    PRIVMSG #c,#d :News!
+    NOTICE #a :News!
+
+Overflow
+========
+
+The queue can be bounded with the ``send_queue_size`` option.
+``send_queue_policy`` tells what to do with new lines when the queue is full:
+
+- ``block``: coroutines wait for some room with
+  ``await bot.queue.wait_for_room()`` before sending. ``send_line()`` can not
+  block: a line sent while the queue is full is dropped and a warning is
+  logged
+
+- ``drop_oldest``: drop the oldest queued line
+
+- ``drop_newest``: drop the new line
+
+- ``coalesce``: drop the oldest queued line to the same target. If there is
+  none, drop the oldest line of the target with the most queued lines. If
+  no queued lines have a target, drop the new line
+
+Priority lines are never dropped. The future of a dropped line is resolved
+with ``False``::
+
+    >>> queue = SendQueue(loop, maxsize=2, policy='coalesce')
+    >>> f1 = loop.create_future()
+    >>> queue.put(f1, 'PRIVMSG #irc3 :line1')
+    >>> queue.put(loop.create_future(), 'PRIVMSG #irc3 :line2')
+    >>> queue.put(loop.create_future(), 'PRIVMSG #irc3 :line3')
+    >>> f1.result()
+    False
+    >>> [line for f, line in queue.items()]
+    ['PRIVMSG #irc3 :line2', 'PRIVMSG #irc3 :line3']
+
+Nothing is sent while the transport asked the protocol to pause writing.
+
+:meth:`SendQueue.stats` returns the queue metrics::
+
+    >>> stats = queue.stats()
+    >>> print(stats['depth'], stats['max_depth'], stats['dropped'])
+    2 2 1
+    >>> loop.close()
+
+API
+===
+
+.. autoclass:: SendQueue
+   :members:
+
+.. autoclass:: TokenBucket
+   :members:
+'''
+
+CHAT_COMMANDS = frozenset(['PRIVMSG', 'NOTICE'])
+CHANNEL_COMMANDS = frozenset(['JOIN', 'PART', 'MODE', 'KICK', 'TOPIC'])
+PRIORITY_COMMANDS = frozenset(['PONG'])
+
+
+def split_line(data):
+    """Return the command and the target of a PRIVMSG / NOTICE line, of a
+    ``draft/multiline`` batch or of a command on a single channel::
+
+        >>> split_line('PRIVMSG #irc3 :Hello')
+        ('PRIVMSG', '#irc3')
+        >>> split_line('MODE #irc3 +o gawel')
+        ('MODE', '#irc3')
+        >>> split_line('JOIN #irc3,#python')
+        ('JOIN', None)
+        >>> split_line('@+typing=active TAGMSG #irc3')
+        ('TAGMSG', None)
+        >>> split_line('pong :irc.com')
+        ('PONG', None)
+        >>> split_line('BATCH +1 draft/multiline #irc3')
+        ('BATCH', '#irc3')
+    """
+    if data[:1] == '@':
+        data = data.partition(' ')[2]
+    command, _, data = data.partition(' ')
+    command = command.upper()
+    if command in CHAT_COMMANDS:
+        return command, data.partition(' ')[0] or None
+    elif command in CHANNEL_COMMANDS:
+        target = data.partition(' ')[0]
+        if target and ',' not in target:
+            return command, target
+    elif command == 'BATCH':
+        params = data.partition('\r\n')[0].split(' ')
+        if len(params) > 2:
+            return command, params[2]
+    return command, None
+
+
+def parse_targmax(server_config):
+    """Return the max number of targets of PRIVMSG / NOTICE from 005's
+    ``TARGMAX`` or ``MAXTARGETS``::
+
+        >>> parse_targmax({'TARGMAX': 'NAMES:1,PRIVMSG:4,NOTICE:'})
+        {'PRIVMSG': 4, 'NOTICE': 512}
+        >>> parse_targmax({'MAXTARGETS': '3'})
+        {'PRIVMSG': 3, 'NOTICE': 3}
+        >>> parse_targmax({})
+        {}
+    """
+    targmax = {}
+    value = server_config.get('TARGMAX')
+    if isinstance(value, str):
+        for opt in value.split(','):
+            command, _, limit = opt.partition(':')
+            command = command.upper()
+            if command in CHAT_COMMANDS:
+                targmax[command] = int(limit) if limit.isdigit() else 512
+    else:
+        value = server_config.get('MAXTARGETS')
+        if isinstance(value, str) and value.isdigit():
+            for command in CHAT_COMMANDS:
+                targmax[command] = int(value)
+    return {k: v for k, v in sorted(targmax.items(), reverse=True) if v > 1}
+
+
+class TokenBucket:
+    """Hold up to ``burst`` tokens. Refill at ``rate`` tokens per second.
+    ``clock`` is a callable returning the current time (``loop.time``)::
+
+        >>> now = [0]
+        >>> bucket = TokenBucket(rate=.5, burst=2, clock=lambda: now[0])
+        >>> bucket.consume(bucket.cost('PRIVMSG #irc3 :Hello'))
+        0.0
+        >>> bucket.consume(1)
+        0.0
+        >>> bucket.delay(1)
+        2.0
+        >>> now[0] = 2
+        >>> bucket.consume(1)
+        0.0
+
+    With ``line_bytes``, a line costs ``1 + bytes / line_bytes`` tokens. A line
+    costing more than ``burst`` can be sent when the bucket is full. The
+    bucket is then in debt::
+
+        >>> bucket = TokenBucket(rate=1, burst=2, clock=lambda: now[0],
+        ...                      line_bytes=11)
+        >>> bucket.cost('PRIVMSG #irc3 :Hello')
+        3.0
+        >>> bucket.cost(b'PRIVMSG #irc3 :Hello\\r\\n')
+        3.0
+        >>> bucket.consume(3)
+        0.0
+        >>> bucket.delay(1)
+        2.0
+    """
+
+    def __init__(self, rate, burst, clock, line_bytes=0, encoding='utf8'):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.line_bytes = float(line_bytes or 0)
+        self.encoding = encoding
+        self.tokens = self.burst
+        self.time = clock()
+
+    def cost(self, data):
+        """Return the cost of a line (or of a few lines joined by CRLF).
+        ``data`` can also be the encoded line(s) ending with CRLF"""
+        if isinstance(data, bytes):
+            lines = float(data.count(b'\n'))
+            size = len(data)
+        else:
+            lines = data.count('\n') + 1.
+            size = None
+        if self.line_bytes:
+            if size is None:
+                size = len(data.encode(self.encoding, 'ignore')) + 2
+            return lines + size / self.line_bytes
+        return lines
+
+    def refill(self):
+        now = self.clock()
+        tokens = self.tokens + (now - self.time) * self.rate
+        self.tokens = tokens if tokens < self.burst else self.burst
+        self.time = now
+
+    def delay(self, cost):
+        """Return the time to wait before ``cost`` tokens are available"""
+        self.refill()
+        if cost > self.burst:
+            cost = self.burst
+        if self.tokens >= cost:
+            return 0.
+        return (cost - self.tokens) / self.rate
+
+    def consume(self, cost):
+        """Take ``cost`` tokens if available. Return :meth:`delay` so ``0``
+        means the tokens were taken"""
+        delay = self.delay(cost)
+        if not delay:
+            self.tokens -= cost
+        return delay
+
+
+class SendQueue:
+    """A bounded queue of ``(future, line)``"""
+
+    policies = ('block', 'drop_oldest', 'drop_newest', 'coalesce')
+
+    def __init__(self, loop, maxsize=0, policy='block', merge=False,
+                 max_length=512, encoding='utf8', log=None):
+        if policy not in self.policies:
+            raise ValueError('Invalid send_queue_policy: %r' % policy)
+        self.loop = loop
+        self.log = log or logging.getLogger('irc3.sendq')
+        self.maxsize = int(maxsize)
+        self.policy = policy
+        self.merge = merge
+        self.max_length = int(max_length)
+        self.encoding = encoding
+        self.targmax = {}
+        self.payloads = {}
+        self.merged = 0
+        self.priority = deque()
+        self.lanes = OrderedDict()
+        self.selected = None
+        self.size = 0
+        self.counter = itertools.count()
+        self.paused = False
+        self.getter = None
+        self.room = deque()
+        self.max_depth = 0
+        self.dropped = 0
+        self.overflow = False
+        self.sent = 0
+        self.wait_last = 0.
+        self.wait_max = 0.
+        self.wait_total = 0.
+
+    def __len__(self):
+        return self.size
+
+    def empty(self):
+        return not self.size
+
+    def full(self):
+        return self.maxsize > 0 and self.size >= self.maxsize
+
+    def entries(self):
+        entries = list(self.priority)
+        for lane in self.lanes.values():
+            entries.extend(lane)
+        return sorted(entries)
+
+    def items(self):
+        """Queued ``(future, line)`` in arrival order"""
+        return [(entry[1], entry[2]) for entry in self.entries()]
+
+    def set_targmax(self, server_config):
+        """Enable the merge of lines with the same text (if ``merge`` is
+        true) using the 005 server config"""
+        if self.merge:
+            self.targmax = parse_targmax(server_config)
+
+    def put(self, future, data):
+        """Queue a line. Apply the overflow policy if the queue is full"""
+        self.selected = None
+        command, target = split_line(data)
+        key = None
+        if command in self.targmax and target and data[:1] != '@' and \
+           '\n' not in data:
+            key = (command, data.split(' ', 2)[2])
+        entry = (next(self.counter), future, data, target,
+                 self.loop.time(), key)
+        if command in PRIORITY_COMMANDS:
+            self.priority.append(entry)
+        else:
+            if self.full():
+                policy = self.policy
+                if policy == 'block':
+                    if not self.overflow:
+                        self.overflow = True
+                        self.log.warning(
+                            'send queue full (%s lines). Dropping new lines',
+                            self.size)
+                    self.drop(future)
+                    return
+                elif policy == 'drop_newest':
+                    self.drop(future)
+                    return
+                elif policy in ('drop_oldest', 'coalesce'):
+                    if not self.drop_lane(policy, target):
+                        self.drop(future)
+                        return
+            lane = self.lanes.get(target)
+            if lane is None:
+                lane = self.lanes[target] = deque()
+            lane.append(entry)
+            if key is not None:
+                payloads = self.payloads.get(key)
+                if payloads is None:
+                    payloads = self.payloads[key] = []
+                payloads.append(entry)
+        self.size += 1
+        if self.size > self.max_depth:
+            self.max_depth = self.size
+        self.wakeup()
+
+    def drop_lane(self, policy, target):
+        lanes = self.lanes
+        if not lanes:
+            return False
+        self.selected = None
+        if policy == 'drop_oldest':
+            target = min(lanes, key=lambda t: lanes[t][0])
+        elif target is None or target not in lanes:
+            targets = [t for t in lanes if t is not None]
+            if not targets:
+                return False
+            target = max(targets, key=lambda t: len(lanes[t]))
+        lane = lanes[target]
+        entry = lane.popleft()
+        self.drop(entry[1])
+        if not lane:
+            del lanes[target]
+        if entry[5] is not None:
+            self.unindex(entry)
+        self.size -= 1
+        return True
+
+    def unindex(self, entry):
+        payloads = self.payloads[entry[5]]
+        payloads.remove(entry)
+        if not payloads:
+            del self.payloads[entry[5]]
+
+    def drop(self, future):
+        self.dropped += 1
+        if not future.done():
+            future.set_result(False)
+
+    def next_lane(self):
+        """Return the target of the next lane to serve. Lanes with a line
+        older than the first line without target come first"""
+        lanes = self.lanes
+        lane = lanes.get(None)
+        if lane is None:
+            return next(iter(lanes))
+        barrier = lane[0][0]
+        for target, lane in lanes.items():
+            if lane[0][0] <= barrier:
+                return target
+
+    def select(self):
+        """Return the next entry to send, its lane's target, the entries
+        merged with it (``None`` for a priority line), the line to send and
+        the encoded line"""
+        selected = self.selected
+        if selected is None:
+            if self.priority:
+                entry = self.priority[0]
+                target, others, data = None, None, entry[2]
+            else:
+                target = self.next_lane()
+                entry = self.lanes[target][0]
+                others, data = (), entry[2]
+                if entry[5] is not None and len(self.payloads[entry[5]]) > 1:
+                    others, data = self.merge_entries(entry)
+            encoded = data.encode(self.encoding) + b'\r\n'
+            selected = self.selected = (entry, target, others, data, encoded)
+        return selected
+
+    def peek(self):
+        """Return the next line to send"""
+        if self.size:
+            return self.select()[3]
+
+    def encoded(self):
+        """Return the next line to send encoded and ending with CRLF"""
+        if self.size:
+            return self.select()[4]
+
+    def pop(self):
+        """Remove and return the next ``(future, line, encoded)`` to send"""
+        entry, target, others, data, encoded = self.select()
+        self.selected = None
+        if others is None:
+            self.priority.popleft()
+        else:
+            lanes = self.lanes
+            lane = lanes[target]
+            lane.popleft()
+            if lane:
+                lanes.move_to_end(target)
+            else:
+                del lanes[target]
+            if entry[5] is not None:
+                self.unindex(entry)
+            for other in others:
+                lane = lanes[other[3]]
+                lane.popleft()
+                if not lane:
+                    del lanes[other[3]]
+                self.unindex(other)
+                self.size -= 1
+                self.merged += 1
+                if not other[1].done():
+                    other[1].set_result(True)
+        self.size -= 1
+        wait = self.loop.time() - entry[4]
+        self.wait_last = wait
+        self.wait_total += wait
+        if wait > self.wait_max:
+            self.wait_max = wait
+        self.sent += 1
+        if self.overflow and not self.full():
+            self.overflow = False
+        while self.room and not self.full():
+            f = self.room.popleft()
+            if not f.done():
+                f.set_result(True)
+        return entry[1], data, encoded
+
+    def merge_entries(self, entry):
+        """Return the queued lines with the same command and text as
+        ``entry`` which can be sent with it and the line with a comma
+        separated list of targets. Only the first line of a lane which is
+        older than the first line without target can be merged"""
+        command, payload = entry[5]
+        targets = [entry[3]]
+        others = []
+        size = len(entry[2].encode(self.encoding)) + 2
+        limit = self.targmax[command]
+        lanes = self.lanes
+        barrier = lanes.get(None)
+        barrier = barrier[0][0] if barrier is not None else None
+        for other in self.payloads[entry[5]]:
+            if len(targets) >= limit:
+                break
+            target = other[3]
+            if target in targets or lanes[target][0] is not other:
+                continue
+            if barrier is not None and other[0] > barrier:
+                break
+            length = len(target.encode(self.encoding)) + 1
+            if size + length > self.max_length:
+                break
+            size += length
+            targets.append(target)
+            others.append(other)
+        return others, '%s %s %s' % (command, ','.join(targets), payload)
+
+    async def wait(self):
+        """Wait until a line can be sent"""
+        while self.paused or not self.size:
+            self.getter = self.loop.create_future()
+            await self.getter
+
+    async def get(self):
+        """Wait for a line. Return ``(future, line, encoded)``"""
+        await self.wait()
+        return self.pop()
+
+    async def wait_for_room(self):
+        """Wait until the queue is not full"""
+        while self.full():
+            f = self.loop.create_future()
+            self.room.append(f)
+            await f
+
+    def wakeup(self):
+        getter = self.getter
+        if getter is not None and not self.paused and not getter.done():
+            getter.set_result(True)
+
+    def pause(self):
+        """Stop sending lines"""
+        self.paused = True
+
+    def resume(self):
+        """Resume sending lines"""
+        self.paused = False
+        self.wakeup()
+
+    def stats(self):
+        """Return a dict with the current ``depth``, ``max_depth``, number of
+        lines ``sent``, ``dropped`` and ``merged`` and ``wait_last``,
+        ``wait_max``,
+        ``wait_avg`` (time spent in the queue, in seconds)"""
+        return dict(
+            depth=self.size,
+            max_depth=self.max_depth,
+            sent=self.sent,
+            dropped=self.dropped,
+            merged=self.merged,
+            paused=self.paused,
+            wait_last=self.wait_last,
+            wait_max=self.wait_max,
+            wait_avg=self.sent and self.wait_total / self.sent or 0.,
+        )
@@ -171,9 +171,10 @@ class IrcClient(irc3d.IrcClient):
         self.data['data_received'] = time.time()
         return self.factory.dispatch(data, client=self)
 
-    def write(self, data):
-        super(IrcClient, self).write(data)
-        self.sent.extend(data.split('\r\n'))
+    def buffer_write(self, data):
+        super(IrcClient, self).buffer_write(data)
+        data = data.decode(self.encoding)
+        self.sent.extend(data[:-2].split('\r\n'))
 
     def reset(self, data=False):
         self.sent = []
@@ -200,6 +201,7 @@ class IrcServer(irc3d.IrcServer):
             client.factory = self
             transport = MagicMock()
             transport.get_extra_info.return_value = ('127.0.0.1', i)
+            transport.is_closing.return_value = False
             client.connection_made(transport)
             nick = 'client%s' % i
             client.data.update(nick=nick)
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 from unicodedata import normalize
+from collections.abc import Mapping
 from .compat import asyncio
 from . import tags
 import configparser
+import codecs
 import importlib
+import string
 import functools
 import logging
 import os
@@ -22,7 +25,20 @@ def slugify(value):
 
 
 class IrcString(str):
-    """Argument wrapper"""
+    """Argument wrapper. The ``nick!user@host`` split is done once and
+    cached"""
+
+    def _split(self):
+        # only called when the string contains a !
+        try:
+            return self._mask
+        except AttributeError:
+            nick, host = self.split('!', 1)
+            username = hostname = None
+            if '@' in host:
+                username, hostname = host.split('@', 1)
+            self._mask = (nick, host, username, hostname)
+            return self._mask
 
     @property
     def nick(self):
@@ -40,7 +56,7 @@ class IrcString(str):
             True
         """
         if '!' in self:
-            return self.split('!', 1)[0]
+            return self._split()[0]
         if not self.is_channel and not self.is_server:
             return self
 
@@ -60,7 +76,7 @@ class IrcString(str):
     @property
     def host(self):
         if '!' in self:
-            return self.split('!', 1)[1]
+            return self._split()[1]
 
     @property
     def username(self):
@@ -75,8 +91,8 @@ class IrcString(str):
             >>> IrcString('irc.freenode.net').username is None
             True
         """
-        if self.host and '@' in self.host:
-            return self.host.split('@', 1)[0]
+        if '!' in self:
+            return self._split()[2]
 
     @property
     def hostname(self):
@@ -91,8 +107,8 @@ class IrcString(str):
             >>> IrcString('irc.freenode.net').hostname is None
             True
         """
-        if self.host and '@' in self.host:
-            return self.host.split('@', 1)[1]
+        if '!' in self:
+            return self._split()[3]
 
     @property
     def is_user(self):
@@ -155,64 +171,428 @@ class IrcString(str):
         return self._tagdict
 
 
+@functools.lru_cache(maxsize=1024)
+def _group_names(pattern, tags=True):
+    names = tuple(pattern.groupindex)
+    if not tags:
+        names = tuple(n for n in names if n != 'tags')
+    return names
+
+
+class IrcMatch(Mapping):
+    r"""A read only mapping of the named groups of a regexp match. Values are
+    only wrapped in :class:`IrcString` when accessed. ``tags`` is omitted when
+    the group did not match:
+
+    .. code-block:: py
+
+        >>> regexp = re.compile(r'(@(?P<tags>\S+) )?:(?P<mask>\S+) JOIN')
+        >>> match = IrcMatch(regexp.match(':foo!u@h JOIN #irc3'))
+        >>> list(match)
+        ['mask']
+        >>> print(match['mask'].nick)
+        foo
+
+    When ``shared`` is true, values are cached so all the events bound to a
+    regexp use the same :class:`IrcString`. ``client`` and ``clients`` are
+    added when they are set.
+    """
+
+    __slots__ = ('match', 'names', 'client', 'clients', 'values')
+
+    def __init__(self, match, client=None, shared=False, clients=None):
+        self.match = match
+        pattern = match.re
+        self.names = _group_names(pattern)
+        if 'tags' in self.names and match.group('tags') is None:
+            self.names = _group_names(pattern, tags=False)
+        self.client = client
+        self.clients = clients
+        self.values = {} if shared else None
+
+    def __getitem__(self, key):
+        if key == 'client' and self.client is not None:
+            return self.client
+        if key == 'clients' and self.clients is not None:
+            return self.clients
+        values = self.values
+        if values is not None and key in values:
+            return values[key]
+        if key not in self.names:
+            raise KeyError(key)
+        value = self.match.group(key)
+        if value is not None:
+            if key == 'mask':
+                value = as_mask(value)
+            else:
+                value = IrcString(value)
+        if values is not None:
+            values[key] = value
+        return value
+
+    def __iter__(self):
+        yield from self.names
+        if self.client is not None:
+            yield 'client'
+        if self.clients is not None:
+            yield 'clients'
+
+    def __len__(self):
+        extra = (self.client is not None) + (self.clients is not None)
+        return len(self.names) + extra
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+# IRCv3 tags (8191 bytes including the @ and the trailing space) + a rfc1459
+# line
+MAX_LINE_LENGTH = 8191 + 512
+
+
+def _decode(data):
+    return data.decode('utf8', 'ignore')
+
+
+class LineFramer:
+    r"""Split a stream of bytes into lines. Lines end with ``\r\n`` or
+    ``\n``. Only the partial line is kept (in a :class:`bytearray`) between two
+    calls. Lines longer than ``max_length`` are dropped:
+
+    .. code-block:: python
+
+        >>> framer = LineFramer(max_length=10)
+        >>> framer.feed(b'PING :a\r\nPING :b\nPI')
+        ['PING :a', 'PING :b']
+        >>> framer.feed(b'NG :c\r\n' + b'x' * 20)
+        ['PING :c']
+        >>> framer.feed(b'xx\r\nPING :d\r\n')
+        ['PING :d']
+
+    Complete lines are decoded at once with ``decode`` which get a
+    :class:`bytes` or a :class:`bytearray`. A multibyte char split between
+    two chunks is decoded correctly:
+
+    .. code-block:: python
+
+        >>> data = 'PING :é\r\n'.encode('utf8')
+        >>> framer.feed(data[:7]), framer.feed(data[7:])
+        ([], ['PING :é'])
+    """
+
+    __slots__ = ('buffer', 'max_length', 'dropping')
+
+    def __init__(self, max_length=MAX_LINE_LENGTH):
+        self.buffer = bytearray()
+        self.max_length = max_length
+        # True while we skip the end of a line which is too long
+        self.dropping = False
+
+    def feed(self, data, decode=_decode):
+        """Add data to the buffer. Return the decoded complete lines"""
+        buf = self.buffer
+        if buf:
+            buf += data
+            data = buf
+        end = data.rfind(b'\n') + 1
+        if end:
+            if end > self.max_length or self.dropping:
+                lines = self.frame(data, 0, end, decode)
+            else:
+                # no line can be too long. same as frame() without a call
+                lines = decode(data[:end].replace(b'\r', b'')).split('\n')
+                lines.pop()
+            if data is buf:
+                del buf[:end]
+            else:
+                buf += data[end:]
+        else:
+            lines = []
+            if data is not buf:
+                buf += data
+        if len(buf) > self.max_length:
+            del buf[:]
+            self.dropping = True
+        return lines
+
+    def frame(self, data, start, end, decode):
+        r"""Split and decode the complete lines of ``data[start:end]``.
+        Lengths are checked on bytes, before decoding:
+
+        .. code-block:: python
+
+            >>> framer = LineFramer(max_length=4)
+            >>> framer.feed('é\r\néé\r\néééé\r\n'.encode('utf8'))
+            ['é', 'éé']
+
+        The check does not copy the data: the last ``\n`` of each
+        ``max_length`` window is searched so most chunks are checked with a
+        few ``rfind()``. The lines are then decoded at once and split. ``\r``
+        are removed:
+
+        .. code-block:: python
+
+            >>> framer.feed(b'a\r\nb\nc\rd\r\n')
+            ['a', 'b', 'cd']
+        """
+        if self.dropping:
+            # the end of a line which is too long
+            self.dropping = False
+            start = data.find(b'\n', start, end) + 1
+        max_length = self.max_length
+        pos = start
+        while end - pos > max_length:
+            pos = data.rfind(b'\n', pos, pos + max_length + 1) + 1
+            if not pos:
+                return self.frame_lines(data, start, end, decode)
+        if start or end != len(data):
+            data = data[start:end]
+        # IRC lines can't contain \r: remove them all at once and split on \n
+        lines = decode(data.replace(b'\r', b'')).split('\n')
+        lines.pop()
+        return lines
+
+    def frame_lines(self, data, start, end, decode):
+        """Decode lines one by one and drop the lines which are too long"""
+        lines = []
+        max_length = self.max_length
+        while start < end:
+            nl = data.find(b'\n', start, end)
+            stop = nl - 1 if nl > start and data[nl - 1] == 13 else nl
+            if stop - start <= max_length:
+                lines.append(decode(data[start:stop].replace(b'\r', b'')))
+            start = nl + 1
+        return lines
+
+
+class BufferedLineFramer(LineFramer):
+    r"""A :class:`LineFramer` for :class:`asyncio.BufferedProtocol`. Data is
+    read into a preallocated buffer and lines are framed in place. The
+    partial line is moved to the start of the buffer when there is less than
+    ``min_free`` bytes left:
+
+    .. code-block:: python
+
+        >>> framer = BufferedLineFramer(size=32, min_free=8)
+        >>> def read(data):
+        ...     buf = framer.get_buffer(-1)
+        ...     buf[:len(data)] = data
+        ...     return framer.buffer_updated(len(data))
+        >>> read(b'PING :a\r\nPING :')
+        ['PING :a']
+        >>> read(b'b\r\nPING :c\r\nPI')
+        ['PING :b', 'PING :c']
+        >>> len(framer.get_buffer(-1))
+        30
+        >>> read(b'NG :d\n')
+        ['PING :d']
+    """
+
+    __slots__ = ('view', 'start', 'end', 'min_free')
+
+    def __init__(self, size=65536, min_free=4096,
+                 max_length=MAX_LINE_LENGTH):
+        super().__init__(max_length=min(max_length, size - min_free))
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = self.end = 0
+        self.min_free = min_free
+
+    def get_buffer(self, sizehint=-1):
+        """Return a writable memoryview of the free part of the buffer"""
+        if len(self.buffer) - self.end < self.min_free:
+            start, end = self.start, self.end
+            self.buffer[:end - start] = self.view[start:end].tobytes()
+            self.start = 0
+            self.end = end - start
+        return self.view[self.end:]
+
+    def buffer_updated(self, nbytes, decode=_decode):
+        """``nbytes`` bytes were written. Return the decoded complete
+        lines"""
+        start = self.start
+        end = self.end = self.end + nbytes
+        buf = self.buffer
+        stop = buf.rfind(b'\n', start, end) + 1
+        if stop:
+            if stop - start > self.max_length or self.dropping:
+                lines = self.frame(buf, start, stop, decode)
+            else:
+                lines = decode(buf[start:stop].replace(b'\r', b'')).split('\n')
+                lines.pop()
+            start = self.start = stop
+        else:
+            lines = []
+        if start == end:
+            self.start = self.end = 0
+        elif end - start > self.max_length:
+            self.start = self.end = 0
+            self.dropping = True
+        return lines
+
+    def feed(self, data, decode=_decode):
+        """Same as :meth:`LineFramer.feed`"""
+        lines = []
+        view = memoryview(data)
+        while view:
+            buf = self.get_buffer()
+            size = min(len(buf), len(view))
+            buf[:size] = view[:size]
+            lines.extend(self.buffer_updated(size, decode))
+            view = view[size:]
+        return lines
+
+
 SPACE = ' '
 
 
+@functools.lru_cache(maxsize=32)
+def _is_utf8(encoding):
+    return codecs.lookup(encoding).name == 'utf-8'
+
+
+@functools.lru_cache(maxsize=32)
+def _max_char_bytes(encoding):
+    # max bytes per char. None when unknown
+    if _is_utf8(encoding):
+        return 4
+    return None
+
+
+def _split_end(data, start, end, encoding):
+    """Return the end of the chunk starting at ``start``: after the last
+    space or on the last char boundary before ``end``"""
+    space = data.rfind(b' ', start, end)
+    if _is_utf8(encoding):
+        if space != -1:
+            return space + 1
+        # skip continuation bytes
+        while end > start and data[end] & 0xC0 == 0x80:
+            end -= 1
+    else:
+        if space != -1:
+            end = space + 1
+        while end > start:
+            try:
+                data[start:end].decode(encoding, errors='strict')
+            except UnicodeDecodeError:
+                end -= 1
+            else:
+                break
+    return end
+
+
 def split_message(message, max_bytes, encoding, prefix=''):
     """Split long messages based on byte length, ensuring chunks
     do not exceed max_bytes when encoded. Break up words when necessary.
+
+    .. code-block:: py
+
+        >>> list(split_message('Hello world', 8, 'utf8'))
+        ['Hello', 'world']
+        >>> list(split_message('Hello world', 13, 'utf8', prefix='x :'))
+        ['Hello', 'world']
     """
     if max_bytes <= 0:
         raise ValueError("max_bytes must be positive")
 
+    char_bytes = _max_char_bytes(encoding)
+    if char_bytes and (len(prefix) + len(message)) * char_bytes < max_bytes:
+        # can't be too long. no need to encode
+        clean = message.rstrip(SPACE)
+        if clean:
+            yield clean
+        return
+
     prefix_bytes = len(prefix.encode(encoding))
     max_bytes -= prefix_bytes
     if max_bytes <= 0:
         raise ValueError(f"{max_bytes=} too small for prefix")
 
-    byte_message = message.encode(encoding)
-    message_bytes = len(byte_message)
+    data = message.encode(encoding)
+    size = len(data)
+    if size <= max_bytes:
+        # Keep leading spaces.
+        clean = message.rstrip(SPACE)
+        if clean:
+            yield clean
+        return
 
     start = 0
-
-    while start < message_bytes:
-        end = min(start + max_bytes, message_bytes)
-        chunk = byte_message[start:end]
-
-        while True:
-            valid = True
-
-            # Ensure the chunk doesn't end mid-character.
-            try:
-                chunk_str = chunk.decode(encoding, errors='strict')
-            except UnicodeDecodeError:
-                valid = False
-
-            valid = valid and (
-                end == message_bytes or chunk_str[-1] == SPACE or SPACE
-                not in chunk_str
-            )
-
-            if valid:
-                break
-
-            chunk = chunk[:-1]
-            end -= 1
-
+    while start < size:
+        end = start + max_bytes
+        if end >= size:
+            end = size
+        else:
+            end = _split_end(data, start, end, encoding)
             if end == start:
                 raise ValueError(f"cannot fit chunk in {max_bytes=}")
-
+        chunk = data[start:end].decode(encoding)
         if start == 0:
             # Keep leading spaces.
-            clean = chunk_str.rstrip(SPACE)
+            clean = chunk.rstrip(SPACE)
         else:
-            clean = chunk_str.strip(SPACE)
+            clean = chunk.strip(SPACE)
         if clean:
             yield clean
-
         start = end
 
 
+CRLF = str.maketrans('\r\n', '  ')
+
+
+def split_stream(messages, max_bytes, encoding, prefix=''):
+    """Same as :func:`split_message` but take an iterable of strings. The
+    result is the same as ``split_message(''.join(messages), ...)`` but
+    chunks are yielded as soon as possible:
+
+    .. code-block:: py
+
+        >>> list(split_stream(['Hello wo', 'rld, ', 'bye'], 8, 'utf8'))
+        ['Hello', 'world,', 'bye']
+    """
+    if max_bytes <= 0:
+        raise ValueError("max_bytes must be positive")
+
+    prefix_bytes = len(prefix.encode(encoding))
+    max_bytes -= prefix_bytes
+    if max_bytes <= 0:
+        raise ValueError(f"{max_bytes=} too small for prefix")
+
+    buf = bytearray()
+    first = True
+    messages = iter(messages)
+    while True:
+        message = next(messages, None)
+        if message is not None:
+            buf += message.encode(encoding)
+            if len(buf) <= max_bytes:
+                continue
+        start = 0
+        size = len(buf)
+        while start < size and (message is None or size - start > max_bytes):
+            end = start + max_bytes
+            if end >= size:
+                end = size
+            else:
+                end = _split_end(buf, start, end, encoding)
+                if end == start:
+                    raise ValueError(f"cannot fit chunk in {max_bytes=}")
+            chunk = buf[start:end].decode(encoding)
+            start = end
+            if first:
+                # Keep leading spaces.
+                clean = chunk.rstrip(SPACE)
+                first = False
+            else:
+                clean = chunk.strip(SPACE)
+            if clean:
+                yield clean
+        if message is None:
+            return
+        del buf[:start]
+
+
 class Config(dict):
     """Simple dict wrapper:
 
@@ -340,6 +720,22 @@ def as_list(value):
     return [value]
 
 
+@functools.lru_cache(maxsize=4096)
+def as_mask(value):
+    """Return an :class:`IrcString`. Recently seen values return the same
+    instance so the ``nick!user@host`` split is reused:
+
+    .. code-block:: python
+
+        >>> mask = as_mask('foo!user@host')
+        >>> print(mask.nick, mask.hostname)
+        foo host
+        >>> as_mask('foo!user@host') is mask
+        True
+    """
+    return IrcString(value)
+
+
 def as_channel(value):
     """Always return a channel name:
 
@@ -357,6 +753,165 @@ def as_channel(value):
     return value
 
 
+_missing = object()
+
+
+def casemap_chars(casemapping):
+    upper, lower = string.ascii_uppercase, string.ascii_lowercase
+    if casemapping == 'rfc1459':
+        upper, lower = upper + '[]\\^', lower + '{}|~'
+    elif casemapping == 'strict-rfc1459':
+        upper, lower = upper + '[]\\', lower + '{}|'
+    return upper, lower
+
+
+@functools.lru_cache(maxsize=8)
+def casemap_table(casemapping='rfc1459'):
+    """Return a ``str.translate()`` table which lowers strings using a
+    server's ``CASEMAPPING``. Unknown casemappings are handled like ``ascii``:
+
+    .. code-block:: python
+
+        >>> print('Gawel[]'.translate(casemap_table('rfc1459')))
+        gawel{}
+        >>> print('Gawel[]^'.translate(casemap_table('strict-rfc1459')))
+        gawel{}^
+        >>> print('Gawel[]'.translate(casemap_table('ascii')))
+        gawel[]
+    """
+    return str.maketrans(*casemap_chars(casemapping))
+
+
+@functools.lru_cache(maxsize=8)
+def casemapper(casemapping='rfc1459'):
+    """Return a function which casefold strings like
+    :func:`casemap_table`. ``bytes.translate()`` is used when the string can
+    be encoded to latin-1 (it's faster):
+
+    .. code-block:: python
+
+        >>> fold = casemapper('rfc1459')
+        >>> print(fold('Gawel[]'), fold('Gäwel[]'), fold('Gawel[]€'))
+        gawel{} gäwel{} gawel{}€
+    """
+    table = casemap_table(casemapping)
+    btable = bytes.maketrans(
+        *[chars.encode('ascii') for chars in casemap_chars(casemapping)])
+
+    def fold(value):
+        try:
+            value = value.encode('latin-1')
+        except UnicodeEncodeError:
+            return value.translate(table)
+        return value.translate(btable).decode('latin-1')
+    return fold
+
+
+def casefold(value, casemapping='rfc1459'):
+    """Casefold a nick or a channel name:
+
+    .. code-block:: python
+
+        >>> print(casefold('#Cool[Chan]'))
+        #cool{chan}
+    """
+    return casemapper(casemapping)(value)
+
+
+class IrcDict(dict):
+    """A dict which keys are nicks or channels. Keys are compared casefolded
+    with ``fold`` (default to :func:`casefold`). The last spelling used to
+    set a key is kept. Missing keys are created with ``default_factory`` if
+    any:
+
+    .. code-block:: python
+
+        >>> nicks = IrcDict()
+        >>> nicks['Gawel[]'] = 1
+        >>> nicks['gawel{}'], 'GAWEL[]' in nicks
+        (1, True)
+        >>> nicks['GAWEL{}'] = 2
+        >>> nicks
+        {'GAWEL{}': 2}
+        >>> channels = IrcDict(default_factory=list)
+        >>> channels['#Irc3'].append('gawel')
+        >>> channels['#irc3']
+        ['gawel']
+    """
+
+    def __init__(self, fold=None, default_factory=None):
+        dict.__init__(self)
+        self.fold = fold or casefold
+        self.default_factory = default_factory
+        # casefolded key -> key. Only for keys which are not casefolded
+        self.folded = {}
+
+    def key(self, key):
+        """Return the spelling of key used in the dict"""
+        folded = self.fold(key)
+        return self.folded.get(folded, folded)
+
+    def __getitem__(self, key):
+        value = dict.get(self, self.key(key), _missing)
+        if value is _missing:
+            return self.__missing__(key)
+        return value
+
+    def __missing__(self, key):
+        if self.default_factory is None:
+            raise KeyError(key)
+        value = self[key] = self.default_factory()
+        return value
+
+    def __setitem__(self, key, value):
+        folded = self.fold(key)
+        old = self.folded.pop(folded, folded)
+        if old != key:
+            dict.pop(self, old, None)
+        if folded != key:
+            self.folded[folded] = key
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __contains__(self, key):
+        if not isinstance(key, str):
+            return False
+        folded = self.fold(key)
+        return folded in self.folded or dict.__contains__(self, folded)
+
+    def get(self, key, default=None):
+        return dict.get(self, self.key(key), default)
+
+    def pop(self, key, *default):
+        folded = self.fold(key)
+        value = dict.pop(self, self.folded.pop(folded, folded), _missing)
+        if value is _missing:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        return value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self.folded.pop(self.fold(key), None)
+        return key, value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self.folded.clear()
+
+
 def parse_modes(modes, targets=None, noargs=''):
     """Parse channel modes:
 
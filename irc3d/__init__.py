@@ -6,7 +6,6 @@ from irc3 import base
 from irc3 import utils
 from irc3 import config
 from irc3.compat import asyncio
-from irc3.compat import Queue
 from collections import defaultdict
 from .plugins.command import command
 from .dec import plugin
@@ -14,13 +13,26 @@ from .dec import extend
 from .dec import event
 
 
-class IrcClient(asyncio.Protocol):
+def encode_line(data, encoding):
+    """Encode a line and add the trailing CRLF if needed::
+
+        >>> encode_line('PING :irc.com', 'utf8')
+        b'PING :irc.com\\r\\n'
+    """
+    data = data.encode(encoding)
+    if not data.endswith(b'\r\n'):
+        data = data + b'\r\n'
+    return data
+
+
+class IrcClient(base.BufferedWriter, asyncio.Protocol):
     """asyncio protocol to handle an irc connection"""
 
     def connection_made(self, transport):
         self.closed = False
         self.transport = transport
-        self.queue = Queue()
+        self.init_writer()
+        self.framer = utils.LineFramer()
         self.uuid = self.transport.get_extra_info('peername')
         self.factory.clients[self.uuid] = self
         self.encoding = self.factory.encoding
@@ -51,20 +63,16 @@ class IrcClient(asyncio.Protocol):
     def registered(self):
         return bool('nick' in self.data and 'username' in self.data)
 
-    def decode(self, data):  # pragma: no cover
+    def decode(self, data):
         """Decode data with bot's encoding"""
         encoding = getattr(self, 'encoding', 'ascii')
         return data.decode(encoding, 'ignore')
 
-    def data_received(self, data):  # pragma: no cover
+    def data_received(self, data):
         self.data['data_received'] = time.time()
-        data = self.decode(data)
-        if not self.queue.empty():
-            data = self.queue.get_nowait() + data
-        lines = data.split('\r\n')
-        self.queue.put_nowait(lines.pop(-1))
-        for line in lines:
-            self.factory.dispatch(line, client=self)
+        dispatch = self.factory.dispatch
+        for line in self.framer.feed(data, self.decode):
+            dispatch(line, client=self)
 
     def fwrite(self, messages, **kwargs):
         kwargs['c'] = self
@@ -76,16 +84,14 @@ class IrcClient(asyncio.Protocol):
 
     def write(self, data):
         if data is not None:
-            self.factory.dispatch(data, client=self, iotype='out')
-            data = data.encode(self.encoding)
-            if not data.endswith(b'\r\n'):
-                data = data + b'\r\n'
-            self.transport.write(data)
+            self.factory.dispatch_out(data, client=self)
+            self.buffer_write(encode_line(data, self.encoding))
 
     def connection_lost(self, exc):
         self.factory.log.critical('connection lost (%s): %r',
                                   id(self.transport),
                                   exc)
+        self.stop_writer()
         self.factory.notify('connection_lost', client=self)
         del self.factory.clients[self.uuid]
         if not self.closed:
@@ -97,6 +103,7 @@ class IrcClient(asyncio.Protocol):
             self.factory.log.critical('closing old transport (%r)',
                                       id(self.transport))
             try:
+                self.flush(force=True)
                 self.transport.close()
             finally:
                 self.closed = True
@@ -110,11 +117,32 @@ class IrcClient(asyncio.Protocol):
     __repr__ = __str__
 
 
+class IrcBufferedClient(IrcClient, asyncio.BufferedProtocol):
+    """Same as :class:`IrcClient` but data is read into a preallocated
+    buffer. Use ``connection = irc3d.IrcBufferedClient`` in your config"""
+
+    def connection_made(self, transport):
+        super(IrcBufferedClient, self).connection_made(transport)
+        # smaller than the bot's buffer. a server may have a lot of clients
+        self.framer = utils.BufferedLineFramer(size=16384)
+
+    def get_buffer(self, sizehint):
+        return self.framer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self.data['data_received'] = time.time()
+        dispatch = self.factory.dispatch
+        for line in self.framer.buffer_updated(nbytes, self.decode):
+            dispatch(line, client=self)
+
+
 class IrcServer(base.IrcObject):
     """An irc server"""
 
     nick = None
     server = True
+    # see irc3d.workers
+    bus = None
     plugin_category = '__irc3_plugin__'
 
     _pep8 = [config, extend, plugin, event, command]
@@ -148,11 +176,13 @@ class IrcServer(base.IrcObject):
         connection=IrcClient,
         server_config=server_config,
         servername='localhost',
+        out_events_per_client=False,
     )
 
     def __init__(self, *args, **kwargs):
         self.clients = defaultdict(dict)
         super(IrcServer, self).__init__(*args, **kwargs)
+        self.out_events_per_client = bool(self.config.out_events_per_client)
 
     def connection_made(self, f):  # pragma: no cover
         if getattr(self, 'protocol', None):
@@ -178,6 +208,39 @@ class IrcServer(base.IrcObject):
 
     privmsg = notice
 
+    def write_many(self, clients, data):
+        """Write a line to many clients. The line is encoded once and all
+        clients get the same bytes. The line is dispatched once to the out
+        events with the recipients as ``clients``. With the
+        ``out_events_per_client`` option (set by plugins whose out events
+        need it), the line is dispatched with each recipient as ``client``
+        like :meth:`IrcClient.write` does"""
+        if data is None:
+            return
+        if self.registry.has_events('out'):
+            clients = list(clients)
+            if self.out_events_per_client:
+                for c in clients:
+                    self.dispatch_out(data, client=c)
+            else:
+                self.dispatch_out(data, clients=clients)
+        encoded = {}
+        for c in clients:
+            line = encoded.get(c.encoding)
+            if line is None:
+                line = encoded[c.encoding] = encode_line(data, c.encoding)
+            c.buffer_write(line)
+
+    def run(self, forever=True):
+        """start the server. Start ``workers`` processes if the option is
+        set. See :mod:`irc3d.workers`"""
+        amount = int(self.config.get('workers') or 1)
+        if amount > 1 and self.bus is None:  # pragma: no cover
+            from . import workers
+            workers.run(self.config, amount, factory=type(self))
+        else:
+            super(IrcServer, self).run(forever=forever)
+
     def SIGHUP(self, *args):  # pragma: no cover
         self.loop.stop()
 
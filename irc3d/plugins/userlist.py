@@ -4,6 +4,7 @@ from irc3 import utils
 from irc3 import rfc
 import irc3d
 import string
+import json
 __doc__ = '''
 ============================================================
 :mod:`irc3d.plugins.userlist` Nick and channel related stuff
@@ -20,11 +21,19 @@ API
 '''
 
 
+# client data sent to the other workers
+PUBLIC = ('nick', 'username', 'realname', 'host', 'uuid', 'srv', 'version',
+          'signon')
+
+
 @irc3d.plugin
 class ServerUserlist(userlist.Userlist):
 
     def connection_made(self, client=None):
         self.nicks[client.data['nick']] = client
+        if self.context.bus is not None:
+            self.publish('USER', payload=json.dumps(
+                {k: v for k, v in client.data.items() if k in PUBLIC}))
 
     def connection_lost(self, client=None):
         if client is None:
@@ -34,6 +43,13 @@ class ServerUserlist(userlist.Userlist):
                 self.QUIT(client,
                           {'<:reason>': [':Connection reset by peer']})
 
+    def publish(self, *args, **kwargs):
+        """Send a state change to the other workers. See
+        :mod:`irc3d.workers`"""
+        bus = self.context.bus
+        if bus is not None:
+            bus.publish(*args, **kwargs)
+
     def get_client(self, nick_or_client):
         if isinstance(nick_or_client, irc3d.IrcClient):
             return nick_or_client
@@ -45,8 +61,7 @@ class ServerUserlist(userlist.Userlist):
             clients = self.context.clients.values()
         else:
             clients = [self.get_client(c) for c in clients]
-        for c in clients:
-            c.write(kwargs['broadcast'])
+        self.context.write_many(clients, kwargs['broadcast'])
 
     @irc3d.command
     def ISON(self, client, args=None, **kwargs):
@@ -82,6 +97,7 @@ class ServerUserlist(userlist.Userlist):
                 channel=channel)
             self.join(client.nick, client.mask, client=client, **kwargs)
             client.channels.add(channel)
+            self.publish('JOIN', client.nick, channel)
             self.NAMES(client=client, **kwargs)
 
     @irc3d.command
@@ -106,6 +122,7 @@ class ServerUserlist(userlist.Userlist):
         )
         self.part(client.nick, client.mask, client=client, **kwargs)
         client.channels.remove(args['<channel>'])
+        self.publish('PART', client.nick, args['<channel>'])
 
     @irc3d.command
     def QUIT(self, client, args=None, **kwargs):
@@ -123,6 +140,7 @@ class ServerUserlist(userlist.Userlist):
             broadcast=message.format(mask=client.mask, **args),
         )
         self.quit(client.nick, client.mask, client=client, **kwargs)
+        self.publish('QUIT', client.nick)
         client.close()
 
     @irc3d.command
@@ -148,6 +166,7 @@ class ServerUserlist(userlist.Userlist):
             channel=channel,
         )
         self.part(target, client.mask, client=client, **kwargs)
+        self.publish('PART', target, channel)
 
     @irc3d.command(permission=None)
     def NICK(self, client, args=None, **kwargs):
@@ -163,7 +182,9 @@ class ServerUserlist(userlist.Userlist):
         if new_nick in self.nicks:
             if self.nicks[new_nick] != client:
                 client.fwrite(rfc.ERR_NICKNAMEINUSE, nick=new_nick)
-            return
+                return
+            if new_nick == client.nick:
+                return
 
         self.nicks[new_nick] = client
         if client.registered:
@@ -173,6 +194,7 @@ class ServerUserlist(userlist.Userlist):
             client.nick = new_nick
             super(ServerUserlist, self).new_nick(
                 nick, new_nick, client=client, **kwargs)
+            self.publish('NICK', nick, new_nick)
         else:  # pragma: no cover
             self.context.register(client, nick=new_nick)
 
@@ -244,6 +266,11 @@ class ServerUserlist(userlist.Userlist):
         """
         if target.is_channel:
             super(ServerUserlist, self).mode(target=target, **kw)
+            data = kw.get('data')
+            if data:
+                if isinstance(data, list):
+                    data = ' '.join(data)
+                self.publish('MODE', target, kw['modes'], payload=data)
         elif kw['data'] is None:
             client = kw['client']
             modes = kw['modes']
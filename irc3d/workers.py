@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+from irc3.plugins.userlist import Userlist
+from irc3.compat import asyncio
+from irc3d import IrcClient
+import logging
+import signal
+import socket
+import json
+import os
+__doc__ = '''
+==============================================
+:mod:`irc3d.workers` Many irc3d processes
+==============================================
+
+Run a server in ``workers`` processes. Each worker binds the same address
+with ``SO_REUSEPORT`` and the kernel spreads the clients between workers::
+
+    [server]
+    host = 0.0.0.0
+    port = 6667
+    workers = 4
+    includes =
+        irc3d.plugins.core
+
+Workers are connected to each others with UNIX socket pairs (the bus):
+
+- state changes (registrations, ``JOIN``, ``PART``, ``KICK``, ``QUIT``,
+  ``NICK`` and channel prefixes) are sent to all workers. So each worker
+  knows all nicks and channels. The clients of the other workers are
+  :class:`RemoteClient`
+
+- lines written to a :class:`RemoteClient` are sent to its worker. A line
+  written to many clients of the same worker is sent once
+
+The worker of a client runs its commands. The other workers only update
+their state. The state is propagated asynchronously: a line sent while a
+change is on the bus may miss clients of the other workers (e.g. clients
+joining the same channel at the same time on two workers may not see each
+other's ``JOIN``). User modes and away messages are not shared. A nick taken
+on two workers at the same time is not detected.
+
+When a worker leaves the bus (e.g. it crashed), its clients quit on the other
+workers. Their channel members get a ``QUIT``. Workers are not restarted.
+
+API
+===
+
+.. autoclass:: RemoteClient
+
+.. autoclass:: Bus
+   :members:
+
+.. autofunction:: run
+
+'''
+
+log = logging.getLogger('irc3d.workers')
+
+
+class RemoteClient(IrcClient):
+    """A client connected to another worker"""
+
+    def __init__(self, factory, bus, worker, data):
+        self.factory = factory
+        self.bus = bus
+        self.worker = worker
+        self.encoding = factory.encoding
+        self.closed = False
+        self.data = data
+        self.modes = set()
+        self.channels = set()
+        self.nick = data['nick']
+
+    def buffer_write(self, data):
+        self.bus.deliver(self.worker, self.nick, data)
+
+    def close(self):
+        pass
+
+
+class BusProtocol(asyncio.Protocol):
+    """Read the messages of a worker. A message is a header line (the
+    command, its arguments and the payload's size) followed by the
+    payload"""
+
+    def __init__(self, bus, worker):
+        self.bus = bus
+        self.worker = worker
+        self.buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.bus.connection_made(self.worker, transport)
+
+    def data_received(self, data):
+        buf = self.buffer
+        buf += data
+        pos = 0
+        received = self.bus.received
+        while True:
+            end = buf.find(b'\n', pos)
+            if end == -1:
+                break
+            header, size = bytes(buf[pos:end]).rsplit(b' ', 1)
+            start = end + 1
+            stop = start + int(size)
+            if stop > len(buf):
+                break
+            received(self.worker, header, bytes(buf[start:stop]))
+            pos = stop
+        del buf[:pos]
+
+    def connection_lost(self, exc):
+        self.bus.connection_lost(self.worker, exc)
+
+
+class Bus:
+    """Connect a server to the other workers. ``sockets`` is a dict of
+    worker -> socket"""
+
+    # messages received from the other workers
+    verbs = ('DELIVER', 'USER', 'JOIN', 'PART', 'QUIT', 'NICK', 'MODE')
+
+    def __init__(self, server, worker, sockets):
+        self.server = server
+        self.worker = worker
+        self.sockets = sockets
+        self.transports = {}
+        # worker -> messages to send
+        self.buffers = {w: [] for w in sockets}
+        # worker -> (line, nicks). the last line to deliver
+        self.pending = {}
+        self.flush_scheduled = False
+        self.userlist = server.get_plugin(
+            'irc3d.plugins.userlist.ServerUserlist')
+        self.handlers = {v: getattr(self, 'on_' + v) for v in self.verbs}
+        server.bus = self
+
+    def connect(self):
+        loop = self.server.loop
+        for worker, sock in self.sockets.items():
+            protocol = BusProtocol(self, worker)
+            loop.create_task(loop.connect_accepted_socket(
+                (lambda p=protocol: p), sock))
+
+    def connection_made(self, worker, transport):
+        self.transports[worker] = transport
+        self.schedule_flush()
+
+    def connection_lost(self, worker, exc):
+        """Forget a worker which left the bus and quit its clients"""
+        log.critical('worker %s left the bus (%r)', worker, exc)
+        self.transports.pop(worker, None)
+        self.buffers.pop(worker, None)
+        self.pending.pop(worker, None)
+        clients = [c for c in self.userlist.nicks.values()
+                   if isinstance(c, RemoteClient) and c.worker == worker]
+        for client in clients:
+            self.quit(client)
+
+    def quit(self, client):
+        """Quit a client of a lost worker. Only the local clients are
+        told"""
+        nicks = self.userlist.nicks
+        user = self.userlist.users.get(client.nick)
+        members = set()
+        for channel in user.channels if user is not None else ():
+            members.update(channel)
+        self.userlist.quit(client.nick, client.mask, client=client,
+                           broadcast=None)
+        clients = [c for c in (nicks.get(n) for n in members)
+                   if c is not None and not isinstance(c, RemoteClient)]
+        self.server.write_many(
+            clients, ':%s QUIT :Connection reset by peer' % client.mask)
+
+    def publish(self, *args, payload=''):
+        """Send a state change to all workers"""
+        header = ' '.join(args).encode('utf8')
+        payload = payload.encode('utf8')
+        for worker in self.buffers:
+            self.send(worker, header, payload)
+
+    def send(self, worker, header, payload=b''):
+        self.end_delivery(worker)
+        self.buffers[worker].append(
+            header + b' %d\n' % len(payload) + payload)
+        self.schedule_flush()
+
+    def deliver(self, worker, nick, data):
+        """Write encoded lines to a client of ``worker``. Consecutive calls
+        with the same line are sent as one message"""
+        pending = self.pending.get(worker)
+        if pending is not None and pending[0] is data:
+            pending[1].append(nick)
+        else:
+            self.end_delivery(worker)
+            self.pending[worker] = (data, [nick])
+            self.schedule_flush()
+
+    def end_delivery(self, worker):
+        pending = self.pending.pop(worker, None)
+        if pending is not None:
+            data, nicks = pending
+            header = b'DELIVER ' + ','.join(nicks).encode('utf8')
+            self.buffers[worker].append(
+                header + b' %d\n' % len(data) + data)
+
+    def schedule_flush(self):
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.server.loop.call_soon(self.flush)
+
+    def flush(self):
+        """Write the messages of the current loop iteration"""
+        self.flush_scheduled = False
+        for worker, messages in self.buffers.items():
+            self.end_delivery(worker)
+            transport = self.transports.get(worker)
+            if messages and transport is not None:
+                transport.write(b''.join(messages))
+                messages.clear()
+
+    def received(self, worker, header, payload):
+        args = header.decode('utf8').split(' ')
+        handler = self.handlers.get(args[0])
+        if handler is None:
+            log.error('unknown message from worker %s: %r', worker, header)
+            return
+        handler(worker, payload, *args[1:])
+
+    def on_DELIVER(self, worker, payload, nicks):
+        get = self.userlist.nicks.get
+        for nick in nicks.split(','):
+            client = get(nick)
+            if client is not None and not isinstance(client, RemoteClient):
+                client.buffer_write(payload)
+
+    def on_USER(self, worker, payload):
+        data = json.loads(payload.decode('utf8'))
+        client = RemoteClient(self.server, self, worker, data)
+        self.userlist.nicks[client.nick] = client
+
+    def on_JOIN(self, worker, payload, nick, channel):
+        client = self.userlist.nicks.get(nick)
+        if client is not None:
+            self.userlist.join(nick, client.mask, client=client,
+                               channel=channel, broadcast=None)
+            client.channels.add(channel)
+
+    def on_PART(self, worker, payload, nick, channel):
+        client = self.userlist.nicks.get(nick)
+        if client is not None:
+            self.userlist.part(nick, client.mask, client=client,
+                               channel=channel, broadcast=None)
+            client.channels.discard(channel)
+
+    def on_QUIT(self, worker, payload, nick):
+        client = self.userlist.nicks.get(nick)
+        if client is not None:
+            self.userlist.quit(nick, client.mask, client=client,
+                               broadcast=None)
+
+    def on_NICK(self, worker, payload, nick, new_nick):
+        client = self.userlist.nicks.get(nick)
+        if client is not None:
+            client.nick = new_nick
+            self.userlist.new_nick(nick, new_nick, client=client,
+                                   broadcast=None)
+
+    def on_MODE(self, worker, payload, target, modes):
+        Userlist.mode(self.userlist, target=target, modes=modes,
+                      data=payload.decode('utf8'))
+
+
+def socketpairs(amount):
+    """Return a dict of worker -> {worker: socket} to connect each worker to
+    the others"""
+    sockets = {i: {} for i in range(amount)}
+    for i in range(amount):
+        for j in range(i + 1, amount):
+            sockets[i][j], sockets[j][i] = socket.socketpair()
+    return sockets
+
+
+def worker(config, worker, sockets, factory):  # pragma: no cover
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    config = dict(config, loop=loop, worker=worker, reuse_port=True)
+    server = factory.from_config(config)
+    Bus(server, worker, sockets).connect()
+    server.run()
+
+
+def run(config, amount, factory=None):  # pragma: no cover
+    """Fork ``amount`` workers and wait for them"""
+    if factory is None:
+        from irc3d import IrcServer as factory
+    sockets = socketpairs(amount)
+    pids = []
+    for i in range(amount):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                for j, socks in sockets.items():
+                    if j != i:
+                        for sock in socks.values():
+                            sock.close()
+                worker(config, i, sockets[i], factory)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                log.exception('worker %s failed', i)
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    for socks in sockets.values():
+        for sock in socks.values():
+            sock.close()
+    log.info('Started %s workers (%s)', amount, pids)
+
+    def stop(*args):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGINT)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    for pid in pids:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+            except KeyboardInterrupt:
+                continue
+            except ChildProcessError:
+                pass
+            break
+    return pids
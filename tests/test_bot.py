@@ -95,6 +95,137 @@ class TestBot(BotTestCase):
         self.assertEqual(bot.config['server_config']['STATUSMSG'], '+%@')
         self.assertTrue(bot.config['server_config']['ETRACE'])
 
+    def test_caps(self):
+        bot = self.callFTU()
+        bot.include('irc3.plugins.core')
+        bot.dispatch(':srv CAP * LS * :sasl=PLAIN draft/multiline=max-lines=2')
+        bot.dispatch(':srv CAP * LS :away-notify')
+        bot.dispatch(':srv CAP * ACK :sasl away-notify')
+        self.assertEqual(bot.server_caps, {
+            'sasl': 'PLAIN', 'draft/multiline': 'max-lines=2',
+            'away-notify': None})
+        bot.dispatch(':srv CAP * ACK :-sasl')
+        bot.dispatch(':srv CAP nono DEL :away-notify')
+        self.assertEqual(bot.caps, set())
+        bot.dispatch(':srv CAP nono NEW :echo-message')
+        self.assertIn('echo-message', bot.server_caps)
+        bot.notify('connection_made')
+        self.assertEqual(bot.server_caps, {})
+
+    def test_caps_negotiation(self):
+        bot = self.callFTU(capabilities='draft/multiline echo-message')
+        bot.include('irc3.plugins.core')
+        bot.notify('connection_ready')
+        self.assertSent(['CAP LS 302'])
+        bot.notify('connection_made')
+        bot.dispatch(':srv CAP * LS :sasl draft/multiline=max-lines=2')
+        self.assertSent(['CAP REQ :draft/multiline'])
+        bot.dispatch(':srv CAP * NAK :draft/multiline')
+        self.assertSent(['CAP END'])
+        self.assertEqual(bot.caps, set())
+        # cap-notify
+        bot.dispatch(':srv CAP nono NEW :echo-message away-notify')
+        self.assertSent(['CAP REQ :echo-message'])
+        bot.dispatch(':srv CAP nono ACK :echo-message')
+        self.assertNotIn('CAP END', bot.sent)
+        self.assertEqual(bot.caps, {'echo-message'})
+        bot.loop.time.return_value = 12.5
+        bot.dispatch(':srv 376 nono :End of /MOTD command.')
+        self.assertEqual(bot.registration_delay, 2.5)
+
+    def test_caps_reconnect(self):
+        bot = self.callFTU(capabilities='draft/multiline echo-message')
+        bot.include('irc3.plugins.core')
+        bot.server_caps.update({'draft/multiline': None, 'echo-message': None})
+        bot.notify('connection_ready')
+        self.assertSent(
+            ['CAP LS 302\r\nCAP REQ :draft/multiline echo-message'])
+        bot.notify('connection_made')
+        bot.dispatch(':srv CAP * LS :draft/multiline')
+        self.assertNotIn('CAP END', bot.sent)
+        # the new server does not support echo-message
+        bot.dispatch(':srv CAP * NAK :draft/multiline echo-message')
+        self.assertSent(['CAP REQ :draft/multiline'])
+        bot.dispatch(':srv CAP * NAK :draft/multiline')
+        self.assertSent(['CAP END'])
+
+    def test_no_caps(self):
+        bot = self.callFTU()
+        bot.include('irc3.plugins.core')
+        bot.notify('connection_ready')
+        bot.notify('connection_made')
+        bot.dispatch(':srv CAP * LS :sasl draft/multiline')
+        self.assertEqual([line for line in bot.sent if 'CAP' in line], [])
+
+    def test_multiline(self):
+        bot = self.callFTU(max_length=25)
+        bot.server_caps['draft/multiline'] = 'max-bytes=40,max-lines=3'
+        bot.caps.add('draft/multiline')
+        bot.privmsg('#irc3', 'hello')
+        self.assertSent(['PRIVMSG #irc3 :hello'])
+        bot.notice('#irc3', 'hello\nworld, a long line\nbye\nnow')
+        self.assertSent([
+            '\r\n'.join([
+                'BATCH +irc3_1 draft/multiline #irc3',
+                '@batch=irc3_1 NOTICE #irc3 :hello',
+                '@batch=irc3_1 NOTICE #irc3 :world, a',
+                ('@batch=irc3_1;draft/multiline-concat '
+                 'NOTICE #irc3 : long line'),
+                'BATCH -irc3_1']),
+            '\r\n'.join([
+                'BATCH +irc3_2 draft/multiline #irc3',
+                '@batch=irc3_2 NOTICE #irc3 :bye',
+                '@batch=irc3_2 NOTICE #irc3 :now',
+                'BATCH -irc3_2']),
+        ])
+
+    def test_hostmask(self):
+        bot = self.callFTU()
+        bot.include('irc3.plugins.core')
+        bot.notify('connection_made')
+        bot.dispatch(':srv 001 nono :Welcome to IRC nono')
+        self.assertIsNone(bot.hostmask)
+        bot.dispatch(':srv 001 nono :Welcome to IRC nono!~nono@1.2.3.4')
+        self.assertEqual(bot.hostmask, 'nono!~nono@1.2.3.4')
+        bot.dispatch(':srv 396 nono nono.users.irc :is now your hidden host')
+        self.assertEqual(bot.hostmask, 'nono!~nono@nono.users.irc')
+        bot.dispatch(':nono!~nono@nono.users.irc NICK :nono2')
+        self.assertEqual(bot.hostmask, 'nono2!~nono@nono.users.irc')
+        bot.dispatch(':nono2!~nono@nono.users.irc CHGHOST nono vhost')
+        self.assertEqual(bot.hostmask, 'nono2!nono@vhost')
+        bot.dispatch(':gawel!g@h CHGHOST g host')
+        bot.dispatch(':gawel!g@h JOIN #irc3')
+        self.assertEqual(bot.hostmask, 'nono2!nono@vhost')
+        bot.dispatch(':nono2!u@h JOIN #irc3')
+        self.assertEqual(bot.hostmask, 'nono2!u@h')
+        self.assertEqual(bot.hostmask.host, 'u@h')
+        bot.notify('connection_made')
+        self.assertIsNone(bot.hostmask)
+
+    def test_hostmask_split(self):
+        bot = self.callFTU(max_length=60)
+        bot.include('irc3.plugins.core')
+        bot.privmsg('#irc3', 'Hello world, how are you?')
+        self.assertSent(['PRIVMSG #irc3 :Hello world, how are you?'])
+        # 60 - len(':nono!~nono@localhost \r\n') - len('PRIVMSG #irc3 :')
+        bot.dispatch(':nono!~nono@localhost JOIN #irc3')
+        bot.privmsg('#irc3', 'Hello world, how are you?')
+        self.assertSent(['PRIVMSG #irc3 :Hello world, how are',
+                         'PRIVMSG #irc3 :you?'])
+        bot.ctcp('gawel', 'PING 1 2 3 4 5 6 7 8 9 10 11 12')
+        self.assertSent(['PRIVMSG gawel :\x01PING 1 2 3 4 5 6 7\x01',
+                         'PRIVMSG gawel :\x018 9 10 11 12\x01'])
+
+    def test_send_message(self):
+        bot = self.callFTU(max_length=30)
+        bot.privmsg('#irc3', 'Hello\r\nworld  ')
+        bot.notice('#irc3', 'Hello world, how are you?')
+        bot.ctcp_reply('gawel', 'VERSION irc3\n')
+        self.assertSent(['PRIVMSG #irc3 :Hello  world',
+                         'NOTICE #irc3 :Hello world,',
+                         'NOTICE #irc3 :how are you?',
+                         'NOTICE gawel :\x01VERSION irc3\x01'])
+
     def test_ping(self):
         bot = self.callFTU()
         bot.include('irc3.plugins.core')
@@ -25,3 +25,12 @@ class TestCasefold(BotTestCase):
         self.assertEqual(bot.casefold('#TEsT\\CHaN'), '#test|chan')
 
         self.assertEqual(bot.casefold('#TEsT\\CHaN'), '#test|chan')
+
+    def test_isupport(self):
+        bot = self.callFTU()
+        bot.include('irc3.plugins.core', 'irc3.plugins.userlist')
+        bot.notify('connection_made')
+        bot.dispatch(':srv 005 irc3 CASEMAPPING=ascii :are supported')
+        self.assertEqual(bot.casefold('#tESt[]'), '#test[]')
+        plugin = bot.get_plugin('irc3.plugins.userlist.Userlist')
+        self.assertEqual(plugin.casefold('#tESt[]'), '#test[]')
@@ -224,6 +224,22 @@ class TestCommands(BotTestCase):
         bot.dispatch(':bar!user@host PRIVMSG nono :!ping xx')
         self.assertSent(['PRIVMSG bar :Invalid arguments.'])
 
+    def test_invalid_arguments_usage(self):
+        bot = self.callFTU(nick='nono', **{self.name: {
+            'error_format': '{exc}'.format}})
+        bot.dispatch(':bar!user@host PRIVMSG nono :!ping xx')
+        self.assertSent(['PRIVMSG bar :Usage:     nono ping'])
+
+    def test_parser(self):
+        parser = command.get_parser(command.ping.__doc__)
+        self.assertIs(parser, command.get_parser(command.ping.__doc__))
+        parser = command.Parser('%%cmd [<args>...]')
+        args = parser.parse(['cmd'])
+        args['<args>'].append('x')
+        self.assertEqual(parser.parse(['cmd'])['<args>'], [])
+        self.assertEqual(parser.parse(['cmd', 'x', 'y'])['<args>'],
+                         ['x', 'y'])
+
     def test_invalid_arguments_shlex(self):
         bot = self.callFTU(nick='nono')
         bot.dispatch(':bar!user@host PRIVMSG nono :!ping "xx')
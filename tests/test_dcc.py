@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from irc3.testing import BotTestCase
 from irc3.compat import asyncio
+from irc3.dcc.client import DCCChat
 from irc3.dcc.client import DCCSend
 from irc3.plugins.dcc import dcc_command
 from irc3 import dcc_event
@@ -197,3 +198,17 @@ class TestSendWithLimit(DCCTestCase):
         assert proto.started.result() is proto
         assert proto.closed.done()
         self.assertFileSent()
+
+
+class TestChatLines(BotTestCase):
+
+    def test_trailing_cr(self):
+        bot = self.callFTU()
+        lines = []
+        bot.dispatch = lambda data, **kwargs: lines.append(data)
+        chat = DCCChat(bot=bot, loop=bot.loop, mask="gawel")
+        chat.connection_made(None)
+        chat.data_received(b'hello\r\r\n')
+        chat.data_received(b'world\r')
+        chat.data_received(b'\n')
+        assert lines == ['hello', 'world']
@@ -64,3 +64,168 @@ class TestEvents(BotTestCase):
 
         loop.run_until_complete(future)
         assert future.result() is bot
+
+    def test_event_index(self):
+        bot = self.callFTU()
+        bot.include('irc3.plugins.core', 'irc3.plugins.userlist')
+        buckets, wildcard = bot.registry.get_index('in')
+        self.assertIn('MODE', buckets)
+        self.assertIn('353', buckets)
+        self.assertNotIn('PRIVMSG', buckets)
+        # JOIN_PART_QUIT does not require a space after the command
+        self.assertEqual(len(wildcard), 1)
+        for entries in buckets.values():
+            self.assertTrue(set(wildcard) <= set(entries))
+
+    def test_event_index_order(self):
+        bot = self.callFTU()
+        called = []
+        bot.attach_events(
+            irc3.event(irc3.rfc.PRIVMSG, lambda **kw: called.append(1)),
+            irc3.event(r'^(?P<raw>.*)', lambda **kw: called.append(2)),
+            irc3.event(irc3.rfc.JOIN, lambda **kw: called.append(3)),
+            irc3.event(irc3.rfc.CTCP, lambda **kw: called.append(4)),
+        )
+        bot.dispatch(':g!g@g PRIVMSG nono :\x01VERSION\x01')
+        self.assertEqual(called, [1, 2, 4])
+        called[:] = []
+        bot.dispatch(':g!g@g JOIN #irc3')
+        self.assertEqual(called, [2, 3])
+        called[:] = []
+        bot.dispatch('@a=b :g!g@g NOTICE nono :\x01VERSION\x01')
+        self.assertEqual(called, [1, 2, 4])
+        called[:] = []
+        bot.dispatch('PING :x')
+        self.assertEqual(called, [2])
+
+    def test_event_index_invalidation(self):
+        bot = self.callFTU()
+        called = []
+        e = irc3.event(irc3.rfc.PING, lambda **kw: called.append(1))
+        bot.dispatch('PING :x')
+        bot.attach_events(e, insert=True)
+        bot.dispatch('PING :x')
+        self.assertEqual(called, [1])
+        bot.detach_events(e)
+        bot.dispatch('PING :x')
+        self.assertEqual(called, [1])
+
+    def test_recompile(self):
+        bot = self.callFTU()
+        called = []
+        bot.attach_events(
+            irc3.event(irc3.rfc.CTCP, lambda **kw: called.append(1)))
+        bot.dispatch(':g!g@g PRIVMSG nono :\x01VERSION\x01')
+        bot.config['nick'] = 'foo'
+        bot.recompile()
+        bot.dispatch(':g!g@g PRIVMSG nono :\x01VERSION\x01')
+        bot.dispatch(':g!g@g PRIVMSG foo :\x01VERSION\x01')
+        self.assertEqual(called, [1, 1])
+
+    def test_merged_events(self):
+        bot = self.callFTU(merged_events=True)
+        called = []
+        bot.attach_events(
+            irc3.event(irc3.rfc.PRIVMSG,
+                       lambda **kw: called.append((1, kw['data']))),
+            irc3.event(r'^(?P<raw>.*)',
+                       lambda **kw: called.append((2, kw['raw']))),
+            irc3.event(r'^:(\S)!\1@\1 PRIVMSG ',
+                       lambda **kw: called.append(3)),
+            irc3.event(irc3.rfc.CTCP,
+                       lambda **kw: called.append((4, kw['ctcp']))),
+        )
+        line = ':g!g@g PRIVMSG nono :\x01VERSION\x01'
+        bot.dispatch(line)
+        self.assertEqual(
+            called, [(1, '\x01VERSION\x01'), (2, line), 3, (4, 'VERSION')])
+        reg = bot.registry
+        engines = reg.engines['in']
+        entries = reg.get_index('in')[0]['PRIVMSG']
+        self.assertEqual(reg.get_engine(engines, 'PRIVMSG', entries, 0)[1], 2)
+        # numbered backreferences are not merged
+        self.assertIsNone(reg.get_engine(engines, 'PRIVMSG', entries, 2))
+
+    def test_merged_events_invalidation(self):
+        bot = self.callFTU(merged_events=True)
+        called = []
+        bot.dispatch('PING :x')
+        e = irc3.event(irc3.rfc.PING, lambda **kw: called.append(kw['data']))
+        bot.attach_events(e)
+        bot.dispatch('PING :x')
+        bot.detach_events(e)
+        bot.dispatch('PING :x')
+        self.assertEqual(called, ['x'])
+        bot.attach_events(e)
+        bot.dispatch('PING :y')
+        engine = bot.registry.engines['in'][('PING', 0)]
+        bot.detach_events(e)
+        bot.attach_events(e)
+        bot.dispatch('PING :z')
+        self.assertEqual(called, ['x', 'y', 'z'])
+        # merged regexps are cached by patterns
+        self.assertIs(engine[0], bot.registry.engines['in'][('PING', 0)][0])
+
+    def test_batched_dispatch(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        bot = self.callFTU(loop=loop, dispatch_budget=3)
+        called = []
+
+        def error(**kw):
+            raise ValueError()
+        loop.set_exception_handler(
+            lambda loop, context: called.append(context['exception']))
+        bot.attach_events(
+            irc3.event(irc3.rfc.PING, lambda **kw: called.append(kw['data'])),
+            irc3.event(irc3.rfc.PING, error))
+        for i in range(4):
+            bot.dispatch('PING :%s' % i)
+        self.assertEqual(called, [])
+        self.assertEqual(len(bot.callbacks), 8)
+
+        def run_once():
+            loop.call_soon(loop.stop)
+            loop.run_forever()
+        run_once()
+        self.assertEqual(called[0], '0')
+        self.assertIsInstance(called[1], ValueError)
+        self.assertEqual(called[2], '1')
+        self.assertEqual(len(called), 3)
+        run_once()
+        run_once()
+        self.assertEqual([c for c in called if isinstance(c, str)],
+                         ['0', '1', '2', '3'])
+        self.assertEqual(len(called), 8)
+        self.assertFalse(bot.callbacks_scheduled)
+
+    def test_no_out_events(self):
+        bot = self.callFTU()
+        dispatched = []
+        bot.dispatch = lambda *args, **kwargs: dispatched.append(args)
+        bot.privmsg('#irc3', 'Hi!')
+        self.assertEqual(dispatched, [])
+        self.assertFalse(bot.registry.has_events('out'))
+        bot.include(__name__)
+        self.assertTrue(bot.registry.has_events('out'))
+        bot.privmsg('#irc3', 'Hi!')
+        self.assertEqual(dispatched, [('PRIVMSG #irc3 :Hi!',)])
+
+    def test_deferred_out_events(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        bot = self.callFTU(loop=loop, asynchronous=False,
+                           defer_out_events=True)
+        called = []
+        bot.attach_events(irc3.event(
+            irc3.rfc.PRIVMSG, lambda **kw: called.append(kw['data']),
+            iotype='out'))
+        bot.privmsg('#irc3', 'Hi!')
+        bot.privmsg('#irc3', 'Bye!')
+        self.assertEqual(called, [])
+        self.assertEqual(len(bot.out_lines), 2)
+        self.assertTrue(bot.out_scheduled)
+        # drain_out() then the callbacks
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(called, ['Hi!', 'Bye!'])
+        self.assertFalse(bot.out_scheduled)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from unittest.mock import patch
+from irc3.fleet import Fleet
+from irc3 import testing
+import tempfile
+import irc3
+import sys
+import gc
+
+
+class TestFleet(TestCase):
+
+    def setUp(self):
+        self.fleet = Fleet(dict(
+            includes=['irc3.plugins.core', 'irc3.plugins.userlist'],
+            asynchronous=False), factory=testing.IrcBot)
+
+    def test_isolation(self):
+        bot1 = self.fleet.add('bot1', nick='bot1')
+        bot2 = self.fleet.add('bot2', nick='bot2')
+        self.assertEqual(self.fleet.bots, {'bot1': bot1, 'bot2': bot2})
+        self.assertIs(bot1.loop, bot2.loop)
+        bot1.dispatch(':bot1!u@h JOIN #irc3')
+        self.assertIn('#irc3', bot1.channels)
+        self.assertNotIn('#irc3', bot2.channels)
+        # nick patterns are compiled per bot
+        bot2.dispatch(':gawel!u@h INVITE bot1 #irc3')
+        bot2.dispatch(':bot2!u@h JOIN #irc3')
+        self.assertIn('#irc3', bot2.channels)
+
+    def test_shared(self):
+        bot1 = self.fleet.add('bot1', nick='bot1')
+        # scanned once
+        callbacks = dict(self.fleet.callbacks)
+        self.assertEqual(sorted(k[0] for k in callbacks),
+                         ['irc3.plugins.core', 'irc3.plugins.userlist'])
+        bot2 = self.fleet.add('bot2', nick='bot2')
+        self.assertEqual(callbacks, self.fleet.callbacks)
+        self.assertEqual(len(bot1.registry.events_re['in']),
+                         len(bot2.registry.events_re['in']))
+        # same events share the same lists
+        bot1.dispatch('PING :irc.com')
+        bot2.dispatch('PING :irc.com')
+        buckets1, wildcard1 = bot1.registry.get_index('in')
+        buckets2, wildcard2 = bot2.registry.get_index('in')
+        self.assertIsNot(buckets1, buckets2)
+        self.assertIs(buckets1['PING'], buckets2['PING'])
+        self.assertIs(wildcard1, wildcard2)
+
+    def test_forget(self):
+        bot = self.fleet.add('bot1', nick='bot1')
+        callbacks = dict(self.fleet.callbacks)
+        bot.reload('irc3.plugins.userlist')
+        for key, value in self.fleet.callbacks.items():
+            if key[0] == 'irc3.plugins.userlist':
+                # scanned again
+                self.assertIsNot(value, callbacks[key])
+            else:
+                self.assertIs(value, callbacks[key])
+
+    def test_tables_released(self):
+        bot = self.fleet.add('bot1', nick='bot1')
+        bot.dispatch('PING :irc.com')
+        tables = len(self.fleet.tables)
+        e = irc3.event(r'^:\S+ FOO (?P<data>.*)', lambda **kw: None)
+        bot.attach_events(e)
+        bot.dispatch(':irc.com FOO bar')
+        self.assertGreater(len(self.fleet.tables), tables)
+        bot.detach_events(e)
+        bot.dispatch('PING :irc.com')
+        gc.collect()
+        self.assertEqual(len(self.fleet.tables), tables)
+
+    def test_config_copied(self):
+        self.fleet.config['irc3.plugins.x'] = {'key': 'value'}
+        bot1 = self.fleet.add('bot1', nick='bot1')
+        bot2 = self.fleet.add('bot2', nick='bot2')
+        bot1.config['irc3.plugins.x']['key'] = 'changed'
+        self.assertEqual(bot2.config['irc3.plugins.x']['key'], 'value')
+
+    def test_pythonpath(self):
+        self.fleet.config.update(pythonpath=['/tmp/irc3_fleet'],
+                                 here='/tmp/irc3_here')
+        self.addCleanup(setattr, sys, 'path', list(sys.path))
+        for i in range(3):
+            self.fleet.add('bot%s' % i, nick='bot%s' % i)
+        self.assertEqual(self.fleet.config['pythonpath'], ['/tmp/irc3_fleet'])
+        self.assertEqual(self.fleet.bots['bot2'].config['pythonpath'],
+                         ['/tmp/irc3_fleet'])
+        self.assertEqual(sys.path.count('/tmp/irc3_fleet'), 1)
+        self.assertEqual(sys.path.count('/tmp/irc3_here'), 1)
+
+    def test_from_argv(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ini') as fd:
+            fd.write('[bot]\nnick = bot\nincludes =\n    irc3.plugins.core\n'
+                     '[bot_2]\nnick = bot2\n'
+                     '[irc3.plugins.x]\nkey = value\n')
+            fd.flush()
+            with patch.object(testing.IrcBot, 'create_connection'):
+                fleet = Fleet.from_argv([fd.name], factory=testing.IrcBot)
+        self.assertEqual(sorted(fleet.bots), ['bot', 'bot_2'])
+        bot2 = fleet.bots['bot_2']
+        self.assertEqual(bot2.nick, 'bot2')
+        self.assertNotIn('bot_2', fleet.config)
+        self.assertNotIn('bot_2', bot2.config)
+        bot2.config['irc3.plugins.x']['key'] = 'changed'
+        self.assertEqual(fleet.bots['bot'].config['irc3.plugins.x']['key'],
+                         'value')
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from irc3.testing import BotTestCase
+from irc3.sendq import SendQueue
+from irc3.sendq import TokenBucket
+
+
+class TestFlood(BotTestCase):
+
+    config = dict(nick='nono', includes=['irc3.plugins.flood'])
+
+    def callFTU(self, **config):
+        bot = super(TestFlood, self).callFTU(**config)
+        bot.bucket = TokenBucket(rate=1, burst=4, clock=bot.loop.time)
+        bot.queue = SendQueue(bot.loop)
+        bot.notify('connection_made')
+        return bot
+
+    def connect(self, bot, version='irc.com', tokens='CHANTYPES=#'):
+        bot.dispatch(':srv 004 nono srv %s iow biklmnopstv' % version)
+        bot.dispatch(':srv 005 nono %s :are supported' % tokens)
+        bot.dispatch(':srv 376 nono :End of MOTD')
+
+    def test_core_version(self):
+        bot = self.callFTU()
+        self.connect(bot, 'u2.10.12.14')
+        self.assertEqual(bot.config['server_version'], 'u2.10.12.14')
+        bot.notify('connection_made')
+        self.assertIsNone(bot.config['server_version'])
+
+    def test_presets(self):
+        bot = self.callFTU()
+        self.connect(bot, 'u2.10.12.14')
+        self.assertEqual(bot.flood.family, 'ircu')
+        self.assertEqual(bot.bucket.rate, .5)
+        self.assertEqual(bot.bucket.burst, 5)
+        self.assertEqual(bot.bucket.line_bytes, 240)
+
+        bot.notify('connection_made')
+        self.connect(bot, 'solanum-1.0-dev')
+        self.assertEqual(bot.flood.family, 'hybrid')
+        self.assertEqual(bot.bucket.line_bytes, 0)
+
+        bot.notify('connection_made')
+        self.connect(bot, 'ircd-ratbox-3.0.10')
+        self.assertEqual(bot.flood.family, 'hybrid')
+
+        bot.notify('connection_made')
+        self.connect(bot, tokens='NAMESX UHNAMES')
+        self.assertEqual(bot.flood.family, 'unreal')
+
+        # only the start of the version is matched
+        bot.notify('connection_made')
+        self.connect(bot, 'mu2.1-ngircd')
+        self.assertEqual(bot.flood.family, 'default')
+
+    def test_default_preset(self):
+        bot = self.callFTU(flood_burst=8, flood_rate=2, flood_rate_delay=4)
+        self.connect(bot)
+        self.assertEqual(bot.flood.family, 'default')
+        self.assertEqual(bot.bucket.rate, .5)
+        self.assertEqual(bot.bucket.burst, 8)
+
+    def test_config(self):
+        bot = self.callFTU(**{'irc3.plugins.flood': dict(
+            preset='mynet', mynet='burst=10 rate=2')})
+        self.connect(bot, 'u2.10.12.14')
+        self.assertEqual(bot.flood.family, 'mynet')
+        self.assertEqual(bot.bucket.rate, 2)
+        self.assertEqual(bot.bucket.burst, 10)
+
+    def test_backoff(self):
+        bot = self.callFTU()
+        self.connect(bot, 'hybrid-8.2.24')
+        bot.dispatch(':srv 263 nono WHO :Please wait a while and try again.')
+        self.assertEqual(bot.bucket.rate, .5)
+        self.assertEqual(bot.bucket.burst, 2.5)
+        self.assertEqual(bot.bucket.tokens, 0)
+        bot.dispatch(':srv 439 nono #irc3 :Target change too fast.')
+        bot.dispatch('ERROR :Closing Link: host (Excess Flood)')
+        self.assertEqual(bot.flood.factor, .25)
+        self.assertEqual(bot.bucket.burst, 1.25)
+
+    def test_probe(self):
+        bot = self.callFTU()
+        self.connect(bot, 'hybrid-8.2.24')
+        bot.dispatch(':srv 263 nono WHO :Please wait a while and try again.')
+        flood = bot.flood
+        queue = bot.queue
+        # rate is .5/s: a token takes 2s to refill
+        bot.loop.time.return_value = 40
+        queue.wait_total, queue.sent = 30, 10
+        flood.probe()
+        self.assertEqual(flood.factor, .5)
+        bot.loop.time.return_value = 70
+        queue.wait_total, queue.sent = 60, 20
+        flood.probe()
+        self.assertEqual(flood.factor, .55)
+        # nothing sent
+        flood.probe()
+        self.assertEqual(flood.factor, .55)
+        # lines were sent without waiting for tokens
+        queue.wait_total, queue.sent = 61, 30
+        flood.probe()
+        self.assertEqual(flood.factor, .55)
+        flood.factor = 1.9
+        queue.wait_total, queue.sent = 100, 40
+        flood.probe()
+        self.assertEqual(flood.factor, 2)
+        self.assertEqual(bot.bucket.rate, 2)
+        self.assertEqual(bot.bucket.burst, 5)
@@ -36,6 +36,34 @@ class TestServer(testing.ServerTestCase):
         self.assertSent(
             s.client1, ':irc.com 421 client1 EHLO :Unknown command')
 
+    def test_data_received(self):
+        s = self.callFTU(clients=1)
+        s.client1.reset()
+        s.client1.data_received(b'EH')
+        s.client1.data_received(b'LO\nEHLO')
+        self.assertEqual(
+            s.client1.sent, [':irc.com 421 client1 EHLO :Unknown command'])
+        self.assertEqual(s.client1.framer.buffer, b'EHLO')
+
+    def test_buffer_updated(self):
+        s = self.callFTU(clients=0)
+        client = irc3d.IrcBufferedClient()
+        client.factory = s
+        transport = testing.MagicMock()
+        transport.get_extra_info.return_value = ('127.0.0.1', 1)
+        client.connection_made(transport)
+        called = []
+        s.attach_events(irc3d.event(
+            r'^PING :(?P<data>.*)',
+            lambda data=None, **kw: called.append(data)))
+        buf = client.get_buffer(-1)
+        buf[:12] = b'PING :1\nPING'
+        client.buffer_updated(12)
+        buf = client.get_buffer(-1)
+        buf[:5] = b' :2\r\n'
+        client.buffer_updated(5)
+        self.assertEqual(called, ['1', '2'])
+
     def test_server_notice(self):
         s = self.callFTU(clients=1)
         s.notice(s.client1, 'test')
@@ -45,6 +73,48 @@ class TestServer(testing.ServerTestCase):
         s = self.callFTU(clients=1)
         s.broadcast(s.client1, broadcast='Hi')
 
+    def test_write_many(self):
+        s = self.callFTU(clients=3)
+        called = []
+        s.attach_events(irc3d.event(
+            r'^(?P<raw>.*)',
+            lambda raw=None, client=None, **kw: called.append((raw, client)),
+            iotype='out'))
+        s.client1.flush()
+        s.client2.flush()
+        s.write_many([s.client1, s.client2], 'Hi')
+        # dispatched once
+        self.assertEqual(called, [('Hi', None)])
+        s.client1.flush()
+        s.client2.flush()
+        data = s.client1.transport.write.call_args[0][0]
+        self.assertEqual(data, b'Hi\r\n')
+        self.assertIs(s.client2.transport.write.call_args[0][0], data)
+        self.assertNotIn('Hi', s.client3.sent)
+
+    def test_write_many_clients(self):
+        s = self.callFTU(clients=3)
+        called = []
+        s.attach_events(irc3d.event(
+            r'^(?P<raw>.*)',
+            lambda raw=None, clients=None, **kw: called.append(
+                (raw, clients)),
+            iotype='out'))
+        s.write_many(iter([s.client1, s.client2]), 'Hi')
+        self.assertEqual(called, [('Hi', [s.client1, s.client2])])
+        self.assertIn('Hi', s.client2.sent)
+
+    def test_write_many_per_client(self):
+        s = self.callFTU(clients=3)
+        s.out_events_per_client = True
+        called = []
+        s.attach_events(irc3d.event(
+            r'^(?P<raw>.*)',
+            lambda raw=None, client=None, **kw: called.append((raw, client)),
+            iotype='out'))
+        s.write_many([s.client1, s.client2], 'Hi')
+        self.assertEqual(called, [('Hi', s.client1), ('Hi', s.client2)])
+
     def test_privmsg(self):
         s = self.callFTU(clients=3)
         s.client1.dispatch('JOIN #irc3')
@@ -21,6 +21,19 @@ class TestServerUserList(testing.ServerTestCase):
             ":irc.com 311 client1 client2 uclient2 127.0.0.1 * :I'm client2"
         )
 
+    def test_casefold(self):
+        s = self.callFTU(clients=2)
+        s.client1.dispatch('JOIN #Irc3')
+        s.client2.dispatch('JOIN #IRC3')
+        self.assertEqual(list(s.channels), ['#Irc3'])
+        s.client1.dispatch('PRIVMSG CLIENT2 :Hi')
+        self.assertSent(s.client2, ':{mask} PRIVMSG CLIENT2 :Hi', s.client1)
+        s.client1.dispatch('NICK Client1')
+        self.assertEqual(sorted(s.nicks), ['Client1', 'client2'])
+        plugin = s.get_plugin('irc3d.plugins.userlist.ServerUserlist')
+        self.assertEqual(plugin.users['client1'].nick, 'Client1')
+        self.assertIn('CLIENT1', s.channels['#irc3'])
+
     def test_whois_err(self):
         s = self.callFTU(clients=1)
         s.client1.dispatch('WHOIS client2')
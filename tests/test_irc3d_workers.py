@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from irc3d.workers import RemoteClient
+from irc3d.workers import BusProtocol
+from irc3d.workers import Bus
+from irc3d.workers import socketpairs
+from irc3.compat import asyncio
+from irc3 import testing
+import irc3d
+
+
+class Transport:
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+
+    def write(self, data):
+        # split messages to test the framing
+        for i in range(0, len(data), 7):
+            self.protocol.data_received(data[i:i + 7])
+
+
+def add_client(server, nick, port):
+    client = testing.IrcClient()
+    client.factory = server
+    transport = testing.MagicMock()
+    transport.get_extra_info.return_value = ('127.0.0.1', port)
+    client.connection_made(transport)
+    client.data.update(nick=nick)
+    client.dispatch("USER u{0} 127.0.0.1 127.0.0.1 :I'm {0}".format(nick))
+    setattr(server, nick, client)
+
+
+class TestWorkers(testing.ServerTestCase):
+
+    def callFTU(self, **config):
+        servers = []
+        for i in range(2):
+            server = testing.IrcServer(**dict(self.config, **config))
+            Bus(server, i, {1 - i: None})
+            servers.append(server)
+        s1, s2 = servers
+        s1.bus.connection_made(1, Transport(BusProtocol(s2.bus, 0)))
+        s2.bus.connection_made(0, Transport(BusProtocol(s1.bus, 1)))
+        add_client(s1, 'client1', 1)
+        add_client(s2, 'client2', 2)
+        add_client(s2, 'client3', 3)
+        return s1, s2
+
+    def test_remote_clients(self):
+        s1, s2 = self.callFTU()
+        remote = s1.nicks['client2']
+        self.assertIsInstance(remote, RemoteClient)
+        self.assertEqual(remote.worker, 1)
+        self.assertEqual(remote.mask, 'client2!uclient2@127.0.0.1')
+        self.assertIsInstance(s2.nicks['client1'], RemoteClient)
+        self.assertEqual(len(s1.clients), 1)
+
+        s1.client1.dispatch('PRIVMSG client2 :Hi')
+        self.assertSent(s2.client2, ':{mask} PRIVMSG client2 :Hi', s1.client1)
+        self.assertNotSent(s2.client3, ':{mask} PRIVMSG client2 :Hi',
+                           s1.client1)
+
+        s1.client1.dispatch('WHOIS client2')
+        self.assertSent(
+            s1.client1,
+            ":irc.com 311 client1 client2 uclient2 127.0.0.1 * :I'm client2")
+
+    def test_channels(self):
+        s1, s2 = self.callFTU()
+        for client in (s1.client1, s2.client2, s2.client3):
+            client.dispatch('JOIN #irc3')
+        for s in (s1, s2):
+            self.assertEqual(sorted(s.channels['#irc3']),
+                             ['client1', 'client2', 'client3'])
+        self.assertSent(s1.client1, ':{mask} JOIN #irc3', s2.client2)
+        self.assertEqual(s1.nicks['client2'].channels, {'#irc3'})
+
+        s2.client2.dispatch('PRIVMSG #irc3 :Hello')
+        self.assertSent(s1.client1, ':{mask} PRIVMSG #irc3 :Hello',
+                        s2.client2)
+        self.assertSent(s2.client3, ':{mask} PRIVMSG #irc3 :Hello',
+                        s2.client2)
+
+        s1.client1.dispatch('MODE #irc3 +o client2')
+        self.assertIn('client2', s2.channels['#irc3'].modes['@'])
+
+        s2.client2.dispatch('NICK client4')
+        self.assertIn('client4', s1.channels['#irc3'].modes['@'])
+        self.assertNotIn('client2', s1.nicks)
+        self.assertSent(s1.client1, ':client2!uclient2@127.0.0.1 NICK client4')
+
+        s1.client1.dispatch('KICK #irc3 client4 :Lamer!')
+        self.assertEqual(s2.client2.channels, set())
+        self.assertNotIn('client4', s2.channels['#irc3'])
+        self.assertSent(s2.client2, ':{mask} KICK #irc3 client4 :Lamer!',
+                        s1.client1)
+
+        s2.client3.dispatch('PART #irc3')
+        self.assertEqual(list(s1.channels['#irc3']), ['client1'])
+
+        s1.client1.dispatch('QUIT :bye')
+        self.assertNotIn('client1', s2.nicks)
+        self.assertEqual(len(s2.channels['#irc3']), 0)
+
+    def test_deliver(self):
+        s1, s2 = self.callFTU()
+        sent = []
+        s1.bus.transports[1] = testing.MagicMock(write=sent.append)
+        # flushed at the end of the loop iteration
+        s1.bus.flush_scheduled = True
+        clients = [s1.nicks['client2'], s1.nicks['client3']]
+        s1.write_many(clients, ':srv NOTICE * :Hello')
+        s1.bus.publish('PART', 'client2', '#irc3')
+        s1.bus.flush()
+        self.assertEqual(sent, [
+            b'DELIVER client2,client3 22\n:srv NOTICE * :Hello\r\n'
+            b'PART client2 #irc3 0\n'])
+
+    def test_nick_case(self):
+        s1, s2 = self.callFTU()
+        s2.client2.dispatch('JOIN #irc3')
+        s2.client2.dispatch('NICK Client2')
+        self.assertIs(s1.nicks['client2'], s1.nicks['Client2'])
+        self.assertEqual(s1.nicks['client2'].nick, 'Client2')
+        self.assertEqual(list(s1.channels['#irc3']), ['Client2'])
+
+    def test_unknown_message(self):
+        s1, s2 = self.callFTU()
+        protocol = BusProtocol(s1.bus, 1)
+        protocol.data_received(b'FOO bar 0\nQUIT client2 0\n')
+        self.assertNotIn('client2', s1.nicks)
+
+    def test_worker_lost(self):
+        s1, s2 = self.callFTU()
+        for client in (s1.client1, s2.client2, s2.client3):
+            client.dispatch('JOIN #irc3')
+        s1.client1.reset()
+        BusProtocol(s1.bus, 1).connection_lost(None)
+        self.assertEqual(list(s1.nicks), ['client1'])
+        self.assertEqual(list(s1.channels['#irc3']), ['client1'])
+        self.assertNotIn(1, s1.bus.buffers)
+        self.assertNotIn(1, s1.bus.transports)
+        self.assertSent(
+            s1.client1,
+            ':client2!uclient2@127.0.0.1 QUIT :Connection reset by peer')
+        self.assertSent(
+            s1.client1,
+            ':client3!uclient3@127.0.0.1 QUIT :Connection reset by peer')
+        # nothing is sent to the lost worker
+        s1.client1.dispatch('PART #irc3')
+        self.assertEqual(list(s2.channels['#irc3']),
+                         ['client1', 'client2', 'client3'])
+
+
+class TestBusSockets(testing.ServerTestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def wait_for(self, condition):
+        for i in range(100):
+            if condition():
+                return
+            self.loop.run_until_complete(asyncio.sleep(.01))
+        self.fail('timeout')
+
+    def callFTU(self):
+        sockets = socketpairs(2)
+        servers = []
+        for i in range(2):
+            server = irc3d.IrcServer(loop=self.loop, level=1000,
+                                     **self.config)
+            Bus(server, i, sockets[i]).connect()
+            servers.append(server)
+        s1, s2 = servers
+        self.addCleanup(self.close, s1, s2)
+        self.wait_for(lambda: s1.bus.transports and s2.bus.transports)
+        add_client(s1, 'client1', 1)
+        add_client(s2, 'client2', 2)
+        self.wait_for(lambda: 'client2' in s1.nicks and 'client1' in s2.nicks)
+        return s1, s2
+
+    def close(self, *servers):
+        for server in servers:
+            for transport in server.bus.transports.values():
+                transport.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+    def test_socketpair(self):
+        s1, s2 = self.callFTU()
+        self.assertIsInstance(s1.nicks['client2'], RemoteClient)
+        s1.client1.dispatch('PRIVMSG client2 :Hi')
+        line = ':{mask} PRIVMSG client2 :Hi'.format(**s1.client1.data)
+        self.wait_for(lambda: line in s2.client2.sent)
+
+        s2.client2.dispatch('JOIN #irc3')
+        self.wait_for(lambda: 'client2' in s1.channels['#irc3'])
+        s1.client1.dispatch('JOIN #irc3')
+        self.wait_for(lambda: 'client1' in s2.channels['#irc3'])
+
+        # the peer leaves the bus
+        s2.bus.transports[0].close()
+        self.wait_for(lambda: 'client2' not in s1.nicks)
+        self.assertNotIn(1, s1.bus.transports)
+        self.assertEqual(list(s1.channels['#irc3']), ['client1'])
+        self.assertSent(
+            s1.client1,
+            ':client2!uclient2@127.0.0.1 QUIT :Connection reset by peer')
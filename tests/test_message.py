@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from irc3.testing import BotTestCase
+from irc3.testing import ServerTestCase
+from irc3.message import Message
+from irc3.message import match
+from irc3.compat import asyncio
+import irc3d
+import irc3
+
+
+class TestMessage(BotTestCase):
+
+    def test_parse(self):
+        msg = Message.parse(
+            '@a=b;c :gawel!u@h PRIVMSG #irc3 :Hello :world')
+        self.assertEqual(msg.tagstring, 'a=b;c')
+        self.assertEqual(msg.tags, {'a': 'b', 'c': None})
+        self.assertEqual(msg.prefix, 'gawel!u@h')
+        self.assertEqual(msg.mask.nick, 'gawel')
+        self.assertEqual(msg.command, 'PRIVMSG')
+        self.assertEqual(msg.params, ['#irc3', 'Hello :world'])
+
+    def test_parse_no_trailing(self):
+        msg = Message.parse(':irc.com MODE #irc3 +o  gawel')
+        self.assertEqual(msg.command, 'MODE')
+        self.assertEqual(msg.params, ['#irc3', '+o', 'gawel'])
+        self.assertIsNone(msg.mask.nick)
+
+    def test_parse_empty(self):
+        msg = Message.parse('')
+        self.assertEqual(msg.command, '')
+        self.assertEqual(msg.params, [])
+        self.assertIsNone(msg.mask)
+
+    def test_parse_invalid_tags(self):
+        msg = Message.parse('@a=b;; PING :x')
+        self.assertEqual(msg.tags, {})
+
+    def test_matcher(self):
+        matcher = match('MODE', 'target', 'modes', 'data...').compile()
+        kw = matcher(Message.parse(':srv MODE #irc3 +ov gawel foo'))
+        self.assertEqual(kw['target'], '#irc3')
+        self.assertEqual(kw['data'], 'gawel foo')
+        self.assertEqual(kw['event'], 'MODE')
+        self.assertNotIn('tags', kw)
+        kw = matcher(Message.parse('@a :srv MODE #irc3'))
+        self.assertIsNone(kw['modes'])
+        self.assertEqual(kw['tags'], 'a')
+
+    def test_predicates(self):
+        matcher = match(('PRIVMSG', 'NOTICE'), 'target', 'data',
+                        target='{nick}').compile({'nick': 'nono'})
+        self.assertIsNone(matcher(Message.parse(':a!b@c PRIVMSG foo :x')))
+        self.assertIsNotNone(matcher(Message.parse(':a!b@c NOTICE nono :x')))
+
+    def test_structured_event(self):
+        bot = self.callFTU()
+        called = []
+        e = irc3.event(match('PRIVMSG', 'target', 'data'),
+                       lambda **kw: called.append(kw['data']))
+        bot.attach_events(e)
+        self.assertEqual(len(bot.registry.events_re['in']), 0)
+        bot.dispatch(':g!g@g PRIVMSG #irc3 :hello')
+        bot.dispatch(':g!g@g NOTICE #irc3 :hello')
+        self.assertEqual(called, ['hello'])
+        bot.detach_events(e)
+        self.assertEqual(len(bot.registry.events_msg['in']), 0)
+        bot.dispatch(':g!g@g PRIVMSG #irc3 :hello')
+        self.assertEqual(called, ['hello'])
+
+    def test_structured_event_order(self):
+        bot = self.callFTU()
+        called = []
+        bot.attach_events(
+            irc3.event(match('PING'), lambda **kw: called.append(1)),
+            irc3.event(irc3.rfc.PING, lambda **kw: called.append(2)),
+        )
+        bot.attach_events(
+            irc3.event(match('PING'), lambda **kw: called.append(3)),
+            insert=True)
+        bot.dispatch('PING :x')
+        self.assertEqual(called, [2, 3, 1])
+
+    def test_structured_recompile(self):
+        bot = self.callFTU()
+        called = []
+        bot.attach_events(irc3.event(match('PRIVMSG', 'target',
+                                           target='{nick}'),
+                                     lambda **kw: called.append(1)))
+        bot.dispatch(':g!g@g PRIVMSG foo :x')
+        bot.config['nick'] = 'foo'
+        bot.recompile()
+        bot.dispatch(':g!g@g PRIVMSG foo :x')
+        self.assertEqual(called, [1])
+
+    def test_structured_async_event(self):
+        loop = asyncio.new_event_loop()
+        future = asyncio.Future(loop=loop)
+
+        async def e(message=None, **kwargs):
+            future.set_result(message)
+
+        bot = self.callFTU(loop=loop)
+        bot.attach_events(irc3.event(match('JOIN', 'channel'), e))
+        bot.dispatch(':g!g@g JOIN #irc3')
+        loop.run_until_complete(future)
+        self.assertEqual(future.result().params, ['#irc3'])
+        loop.close()
+
+
+class TestServerMessage(ServerTestCase):
+
+    def test_structured_event(self):
+        s = self.callFTU(clients=1)
+        called = []
+        s.attach_events(irc3d.event(
+            match('LUSERS'),
+            lambda client=None, **kw: called.append(client)))
+        s.client1.dispatch('LUSERS')
+        self.assertEqual(called, [s.client1])
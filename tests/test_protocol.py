@@ -4,39 +4,151 @@ import pytest
 import irc3
 
 
-@pytest.fixture(scope='function')
+@pytest.fixture(scope='function',
+                params=['IrcConnection', 'IrcBufferedConnection'])
 def irc_conn(request):
-    irc_conn = irc3.IrcConnection()
+    irc_conn = getattr(irc3, request.param)()
     irc_conn.encoding = 'utf8'
     irc_conn.factory = MagicMock()
-    irc_conn.connection_made(MagicMock())
+    transport = MagicMock()
+    transport.is_closing.return_value = False
+    irc_conn.connection_made(transport)
     return irc_conn
 
 
+def buffered(irc_conn):
+    framer = irc_conn.framer
+    if isinstance(framer, irc3.utils.BufferedLineFramer):
+        return framer.buffer[framer.start:framer.end]
+    return framer.buffer
+
+
 def test_buffer(irc_conn):
     irc_conn.data_received(b'message')
-    assert irc_conn.queue.popleft() == 'message'
+    assert buffered(irc_conn) == b'message'
 
 
 def test_no_buffer(irc_conn):
     irc_conn.data_received(b'message\r\n')
     irc_conn.factory.dispatch.assert_called_with('message')
-    assert irc_conn.queue.popleft() == ''
+    assert buffered(irc_conn) == b''
 
 
 def test_with_buffer(irc_conn):
     irc_conn.data_received(b'm1 ')
     irc_conn.data_received(b'm2 ')
-    buf = irc_conn.queue.popleft()
-    assert buf == 'm1 m2 '
-    irc_conn.queue.append(buf)
+    assert buffered(irc_conn) == b'm1 m2 '
     irc_conn.data_received(b'm3\r\nm4')
     irc_conn.factory.dispatch.assert_called_with('m1 m2 m3')
-    assert irc_conn.queue.popleft() == 'm4'
+    assert buffered(irc_conn) == b'm4'
+
+
+def test_bare_newline(irc_conn):
+    irc_conn.data_received(b'm1\nm2\r')
+    irc_conn.factory.dispatch.assert_called_with('m1')
+    irc_conn.data_received(b'\n')
+    irc_conn.factory.dispatch.assert_called_with('m2')
+
+
+def test_decode(irc_conn):
+    irc_conn.data_received('é\r\n'.encode('utf8')[:1])
+    irc_conn.data_received('é\r\n'.encode('utf8')[1:])
+    irc_conn.factory.dispatch.assert_called_with('é')
+
+
+def test_max_length(irc_conn):
+    irc_conn.data_received(b'x' * 9000)
+    assert buffered(irc_conn) == b''
+    irc_conn.data_received(b'x' * 10 + b'\r\nm1\r\n')
+    irc_conn.factory.dispatch.assert_called_once_with('m1')
+
+
+def test_max_length_bytes(irc_conn):
+    irc_conn.framer.max_length = 4
+    irc_conn.data_received('é\r\néééé\r\n'.encode('utf8'))
+    irc_conn.factory.dispatch.assert_called_once_with('é')
 
 
 def test_write(irc_conn):
     irc_conn.write('m1')
-    irc_conn.transport.write.assert_called_with(b'm1\r\n')
     irc_conn.write('m2\r\n')
-    irc_conn.transport.write.assert_called_with(b'm2\r\n')
+    assert not irc_conn.transport.write.called
+    irc_conn.factory.loop.call_soon.assert_called_once_with(irc_conn.flush)
+    irc_conn.flush()
+    irc_conn.transport.write.assert_called_once_with(b'm1\r\nm2\r\n')
+
+
+def test_write_encoded(irc_conn):
+    irc_conn.write('m1', b'm1\r\n')
+    irc_conn.flush()
+    irc_conn.transport.write.assert_called_once_with(b'm1\r\n')
+
+
+def test_write_threshold(irc_conn):
+    irc_conn.write_threshold = 10
+    irc_conn.write('m1')
+    irc_conn.write('m2m3m4')
+    irc_conn.transport.write.assert_called_once_with(b'm1\r\nm2m3m4\r\n')
+    assert irc_conn.write_buffer == []
+
+
+def test_pause_writing(irc_conn):
+    irc_conn.pause_writing()
+    irc_conn.write('m1')
+    irc_conn.flush()
+    assert not irc_conn.transport.write.called
+    irc_conn.resume_writing()
+    irc_conn.transport.write.assert_called_once_with(b'm1\r\n')
+
+
+def test_close(irc_conn):
+    irc_conn.pause_writing()
+    irc_conn.write('QUIT')
+    irc_conn.close()
+    irc_conn.transport.write.assert_called_once_with(b'QUIT\r\n')
+    assert irc_conn.transport.close.called
+
+
+def test_write_limit(irc_conn):
+    irc_conn.write_limit = 8
+    irc_conn.pause_writing()
+    irc_conn.write('m1')
+    assert not irc_conn.transport.abort.called
+    irc_conn.write('m2m3m4')
+    assert irc_conn.transport.abort.called
+    assert irc_conn.write_buffer == []
+    assert not irc_conn.transport.write.called
+
+
+def test_connection_lost(irc_conn):
+    irc_conn.write('m1')
+    handle = irc_conn.flush_handle
+    irc_conn.connection_lost(None)
+    assert handle.cancel.called
+    assert irc_conn.write_buffer == []
+    irc_conn.flush()
+    assert not irc_conn.transport.write.called
+
+
+def test_write_closing(irc_conn):
+    irc_conn.write('m1')
+    irc_conn.transport.is_closing.return_value = True
+    irc_conn.flush()
+    assert not irc_conn.transport.write.called
+    assert irc_conn.write_buffer == []
+
+
+def test_buffer_updated():
+    irc_conn = irc3.IrcBufferedConnection()
+    irc_conn.encoding = 'utf8'
+    irc_conn.factory = MagicMock()
+    irc_conn.connection_made(MagicMock())
+    data = b'm1\r\nm2\r\nm'
+    buf = irc_conn.get_buffer(-1)
+    buf[:len(data)] = data
+    irc_conn.buffer_updated(len(data))
+    irc_conn.factory.dispatch.assert_called_with('m2')
+    buf = irc_conn.get_buffer(-1)
+    buf[:3] = b'3\r\n'
+    irc_conn.buffer_updated(3)
+    irc_conn.factory.dispatch.assert_called_with('m3')
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from irc3.testing import BotTestCase
+from irc3.reconnect import Reconnect
+from irc3.reconnect import parse_servers
+
+
+class TestReconnect(TestCase):
+
+    def test_full_jitter(self):
+        values = iter([.5, .25, 0., 1.])
+        reconnect = Reconnect([('irc.com', 6667)], delay=4, max_delay=20,
+                              rand=lambda: next(values))
+        self.assertEqual([reconnect.next_delay() for i in range(4)],
+                         [2., 2., 0., 20.])
+        reconnect.ready()
+        self.assertEqual(reconnect.attempts, 0)
+        reconnect.attempts = 10000
+        reconnect.rand = lambda: 1.
+        self.assertEqual(reconnect.next_delay(), 20.)
+
+    def test_failover(self):
+        reconnect = Reconnect(parse_servers('a b c'))
+        self.assertEqual(reconnect.failed().host, 'b')
+        reconnect.ready()
+        self.assertEqual(reconnect.failed().host, 'c')
+        # same score. first server
+        self.assertEqual(reconnect.failed().host, 'a')
+        self.assertEqual([s.failures for s in reconnect.servers], [1, 1, 1])
+        # same score. lowest lag first
+        reconnect.pong(5)
+        reconnect.servers[1].lag = 1
+        reconnect.servers[2].lag = .5
+        self.assertEqual(reconnect.failed().host, 'c')
+
+    def test_stable(self):
+        now = [0]
+        reconnect = Reconnect(parse_servers('a b'), stable=60,
+                              time=lambda: now[0])
+        reconnect.ready()
+        now[0] = 59
+        # lost soon after the registration
+        self.assertEqual(reconnect.failed().host, 'b')
+        self.assertEqual(reconnect.servers[0].score, .5)
+        reconnect.ready()
+        now[0] = 1000
+        # lost after a healthy session
+        self.assertEqual(reconnect.failed().host, 'b')
+        self.assertEqual(reconnect.failed().host, 'a')
+        self.assertEqual([s.score for s in reconnect.servers], [.5, .5])
+        self.assertEqual([s.failures for s in reconnect.servers], [1, 1])
+
+    def test_schedule(self):
+        calls = []
+
+        class Loop:
+            def call_later(self, delay, callback):
+                calls.append(delay)
+                return self
+
+            def cancel(self):
+                calls.append('cancel')
+
+        reconnect = Reconnect([('irc.com', 6667)], rand=lambda: 1.)
+        reconnect.schedule(Loop(), None)
+        reconnect.schedule(Loop(), None)
+        self.assertEqual(calls, [2., 'cancel', 4.])
+
+
+class TestBotReconnect(BotTestCase):
+
+    def test_servers(self):
+        bot = self.callFTU(servers='irc.com:7000 irc2.com')
+        self.assertEqual((bot.config.host, bot.config.port),
+                         ('irc.com', 7000))
+
+        def create_connection():
+            pass
+
+        bot.create_connection = create_connection
+        bot.schedule_reconnect()
+        self.assertEqual((bot.config.host, bot.config.port),
+                         ('irc2.com', 6667))
+        self.assertIs(bot.reconnection.handle._callback, create_connection)
+
+    def test_core(self):
+        bot = self.callFTU()
+        bot.include('irc3.plugins.core')
+        bot.reconnection.attempts = 3
+        bot.reconnection.server.score = .5
+        bot.notify('connection_made')
+        bot.dispatch(':srv 376 nono :End of /MOTD command.')
+        self.assertEqual(bot.reconnection.attempts, 0)
+        self.assertEqual(bot.reconnection.server.score, 1)
+        # PING is sent at timeout - max_lag
+        bot.loop.time.return_value = 10 + 320 - 60 + 2
+        bot.dispatch(':srv PONG srv :10')
+        self.assertEqual(bot.reconnection.server.lag, 2)
@@ -31,6 +31,20 @@ class TestRun(testing.BotTestCase):
             bot.logging_config['handlers']['console']['formatter'], 'file')
         self.assertTrue(self.Task.called)
 
+    def test_fleet(self):
+        filename = os.path.join(os.path.dirname(self.wd), 'fleet.ini')
+        with open(filename, 'w') as fd:
+            fd.write(open('tests/test.ini').read().replace(
+                '[server]', '[bot_2]\nnick = irc3_2\n\n[server]'))
+        bots = irc3.run([filename])
+        self.assertEqual(sorted(bots), ['bot', 'bot_2'])
+        bot, bot2 = bots['bot'], bots['bot_2']
+        self.assertEqual((bot.nick, bot2.nick), ('irc3', 'irc3_2'))
+        self.assertNotIn('bot_2', bot.config)
+        self.assertIs(bot.fleet, bot2.fleet)
+        self.assertIs(bot2.config.botnet, bots)
+        self.assertEqual(self.Task.call_count, 2)
+
 
 class TestServerRun(testing.ServerTestCase):
 
@@ -4,9 +4,14 @@ from irc3.testing import BotTestCase
 
 class TestSasl(BotTestCase):
 
+    def callFTU(self, **config):
+        bot = super(TestSasl, self).callFTU(**config)
+        bot.notify('connection_ready')
+        bot.notify('connection_made')
+        return bot
+
     def test_sasl_plain(self):
         bot = self.callFTU(sasl_username='foo', sasl_password='bar')
-        bot.notify('connection_ready')
         bot.dispatch(':s CAP * LS :multi-prefix sasl')
         self.assertSent(['CAP REQ :sasl'])
         bot.dispatch(':s CAP foo ACK :sasl')
@@ -16,8 +21,19 @@ class TestSasl(BotTestCase):
         bot.dispatch(':s 903 foo :SASL authentication successful')
         self.assertSent(['CAP END'])
 
+    def test_sasl_failed(self):
+        bot = self.callFTU(sasl_username='foo', sasl_password='bar',
+                           capabilities='draft/multiline')
+        bot.dispatch(':s CAP * LS * :multi-prefix sasl')
+        bot.dispatch(':s CAP * LS :draft/multiline=max-bytes=4096')
+        self.assertSent(['CAP REQ :draft/multiline sasl'])
+        bot.dispatch(':s CAP foo ACK :draft/multiline sasl')
+        self.assertSent(['AUTHENTICATE PLAIN'])
+        bot.dispatch(':s 904 foo :SASL authentication failed')
+        self.assertSent(['CAP END'])
+        self.assertEqual(bot.caps, {'draft/multiline', 'sasl'})
+
     def test_no_sasl(self):
         bot = self.callFTU(sasl_username='foo', sasl_password='bar')
-        bot.notify('connection_ready')
         bot.dispatch(':s CAP * LS :multi-prefix')
         self.assertSent(['CAP END'])
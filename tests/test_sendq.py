@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from irc3.compat import asyncio
+from irc3.compat import _original_sleep
+from irc3.sendq import SendQueue
+import irc3
+
+
+class TestSendQueue(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def callFTU(self, lines=(), **kwargs):
+        queue = SendQueue(self.loop, **kwargs)
+        futures = []
+        for line in lines:
+            futures.append(self.loop.create_future())
+            queue.put(futures[-1], line)
+        return queue, futures
+
+    def lines(self, queue):
+        return [line for f, line in queue.items()]
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, SendQueue, self.loop, policy='x')
+
+    def test_block(self):
+        queue, futures = self.callFTU(['PING :1', 'PING :2'], maxsize=2)
+        self.assertFalse(any(f.done() for f in futures))
+
+        async def producer():
+            await queue.wait_for_room()
+            queue.put(self.loop.create_future(), 'PING :3')
+            return len(queue)
+
+        task = self.loop.create_task(producer())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(task.done())
+        self.loop.run_until_complete(queue.get())
+        self.assertEqual(self.loop.run_until_complete(task), 2)
+        self.assertEqual(self.lines(queue), ['PING :2', 'PING :3'])
+
+    def test_block_full(self):
+        log = MagicMock()
+        queue, futures = self.callFTU(['PING :1', 'PING :2', 'PING :3',
+                                       'PING :4'], maxsize=2, log=log)
+        self.assertEqual(self.lines(queue), ['PING :1', 'PING :2'])
+        self.assertFalse(futures[2].result())
+        self.assertFalse(futures[3].result())
+        self.assertEqual(log.warning.call_count, 1)
+        queue.pop()
+        queue.put(self.loop.create_future(), 'PING :5')
+        queue.put(self.loop.create_future(), 'PING :6')
+        self.assertEqual(log.warning.call_count, 2)
+
+    def test_drop_oldest(self):
+        queue, futures = self.callFTU(['PING :1', 'PING :2', 'PING :3'],
+                                      maxsize=2, policy='drop_oldest')
+        self.assertEqual(self.lines(queue), ['PING :2', 'PING :3'])
+        self.assertFalse(futures[0].result())
+        self.assertEqual(queue.stats()['dropped'], 1)
+
+    def test_drop_newest(self):
+        queue, futures = self.callFTU(['PING :1', 'PING :2', 'PING :3'],
+                                      maxsize=2, policy='drop_newest')
+        self.assertEqual(self.lines(queue), ['PING :1', 'PING :2'])
+        self.assertFalse(futures[2].result())
+
+    def test_drop_oldest_lanes(self):
+        queue, futures = self.callFTU(
+            ['PRIVMSG #a :1', 'PRIVMSG #b :1', 'PRIVMSG #a :2',
+             'PRIVMSG #c :1'],
+            maxsize=3, policy='drop_oldest')
+        self.assertEqual(self.lines(queue),
+                         ['PRIVMSG #b :1', 'PRIVMSG #a :2', 'PRIVMSG #c :1'])
+
+    def test_priority(self):
+        queue, futures = self.callFTU(
+            ['PRIVMSG #a :1', 'PRIVMSG #a :2', 'PONG :1', 'PRIVMSG #b :1'],
+            maxsize=2, policy='drop_newest')
+        self.assertEqual(len(queue), 3)
+        self.assertFalse(futures[3].result())
+        self.assertEqual(queue.peek(), 'PONG :1')
+        self.assertEqual([queue.pop()[1] for i in range(3)],
+                         ['PONG :1', 'PRIVMSG #a :1', 'PRIVMSG #a :2'])
+
+    def test_channel_commands(self):
+        queue, futures = self.callFTU(
+            ['PRIVMSG #a :1', 'JOIN #c', 'MODE #c +o foo', 'PRIVMSG #c :hi',
+             'KICK #c foo', 'PRIVMSG #a :2'])
+        self.assertEqual([queue.pop()[1] for i in range(6)], [
+            'PRIVMSG #a :1', 'JOIN #c', 'PRIVMSG #a :2', 'MODE #c +o foo',
+            'PRIVMSG #c :hi', 'KICK #c foo'])
+
+    def test_no_target(self):
+        queue, futures = self.callFTU(
+            ['WHO #x', 'JOIN #c', 'PRIVMSG #c :hi'])
+        self.assertEqual([queue.pop()[1] for i in range(3)],
+                         ['WHO #x', 'JOIN #c', 'PRIVMSG #c :hi'])
+        queue, futures = self.callFTU(
+            ['NICK a', 'JOIN #a,#b', 'PRIVMSG #a :hi', 'PRIVMSG #b :hi'])
+        self.assertEqual(queue.pop()[1], 'NICK a')
+        self.assertEqual(queue.peek(), 'JOIN #a,#b')
+        self.assertEqual([queue.pop()[1] for i in range(3)],
+                         ['JOIN #a,#b', 'PRIVMSG #a :hi', 'PRIVMSG #b :hi'])
+
+    def test_round_robin(self):
+        queue, futures = self.callFTU(
+            ['PRIVMSG #a :1', 'PRIVMSG #a :2', 'PRIVMSG #a :3',
+             'NOTICE gawel :1', 'PRIVMSG #b :1', 'PRIVMSG #b :2'])
+        self.assertEqual([queue.pop()[1] for i in range(6)], [
+            'PRIVMSG #a :1', 'NOTICE gawel :1', 'PRIVMSG #b :1',
+            'PRIVMSG #a :2', 'PRIVMSG #b :2', 'PRIVMSG #a :3'])
+        self.assertTrue(queue.empty())
+        self.assertEqual(queue.lanes, {})
+
+    def test_coalesce(self):
+        queue, futures = self.callFTU([
+            'PRIVMSG #a :1', 'PRIVMSG #b :1', 'PRIVMSG #a :2',
+            'PRIVMSG #b :2',  # drop #b :1
+            'PRIVMSG #c :1',  # drop #a :1 (#a and #b have 2 lines)
+        ], maxsize=3, policy='coalesce')
+        self.assertEqual(self.lines(queue),
+                         ['PRIVMSG #a :2', 'PRIVMSG #b :2', 'PRIVMSG #c :1'])
+        self.assertFalse(futures[0].result())
+        self.assertFalse(futures[1].result())
+
+    def test_coalesce_no_target(self):
+        queue, futures = self.callFTU(['PING :1', 'PING :2', 'PING :3'],
+                                      maxsize=2, policy='coalesce')
+        self.assertEqual(self.lines(queue), ['PING :1', 'PING :2'])
+        queue.put(self.loop.create_future(), 'NOTICE gawel :hi')
+        self.assertEqual(self.lines(queue), ['PING :1', 'PING :2'])
+
+    def test_merge(self):
+        queue, futures = self.callFTU(merge=True, max_length=29)
+        queue.set_targmax({'MAXTARGETS': '3'})
+        for line in ('PRIVMSG #a :hi', 'PRIVMSG #a :hi', 'PRIVMSG #b :hi',
+                     '@a PRIVMSG #c :hi', 'PRIVMSG #d :hi',
+                     'PRIVMSG #long-channel :hi', 'notice #e :hi'):
+            futures.append(self.loop.create_future())
+            queue.put(futures[-1], line)
+        self.assertEqual(queue.pop()[1], 'PRIVMSG #a,#b,#d :hi')
+        self.assertTrue(futures[2].result())
+        self.assertTrue(futures[4].result())
+        self.assertFalse(futures[1].done())
+        self.assertEqual([queue.pop()[1] for i in range(len(queue))], [
+            '@a PRIVMSG #c :hi', 'PRIVMSG #long-channel :hi',
+            'notice #e :hi', 'PRIVMSG #a :hi'])
+        self.assertEqual(queue.payloads, {})
+        self.assertEqual(queue.stats()['merged'], 2)
+
+    def test_merge_first_lines(self):
+        queue, futures = self.callFTU(merge=True)
+        queue.set_targmax({'MAXTARGETS': '3'})
+        for line in ('PRIVMSG #a :News', 'PRIVMSG #b :first',
+                     'PRIVMSG #b :News', 'NICK irc3', 'PRIVMSG #c :News'):
+            queue.put(self.loop.create_future(), line)
+        self.assertEqual([queue.pop()[1] for i in range(4)], [
+            'PRIVMSG #a :News', 'PRIVMSG #b :first', 'NICK irc3',
+            'PRIVMSG #c,#b :News'])
+        self.assertTrue(queue.empty())
+
+    def test_merge_peek(self):
+        queue, futures = self.callFTU(merge=True)
+        queue.set_targmax({'MAXTARGETS': '3'})
+        queue.put(self.loop.create_future(), 'PRIVMSG #a :hi')
+        queue.put(self.loop.create_future(), 'PRIVMSG #b :hi')
+        self.assertEqual(queue.peek(), 'PRIVMSG #a,#b :hi')
+        queue.put(self.loop.create_future(), 'PRIVMSG #c :hi')
+        self.assertEqual(queue.peek(), 'PRIVMSG #a,#b,#c :hi')
+        self.assertEqual(queue.pop()[1], 'PRIVMSG #a,#b,#c :hi')
+        self.assertIsNone(queue.peek())
+
+    def test_merge_disabled(self):
+        queue, futures = self.callFTU()
+        queue.set_targmax({'MAXTARGETS': '3'})
+        self.assertEqual(queue.targmax, {})
+        queue = SendQueue(self.loop, merge=True)
+        queue.set_targmax({'TARGMAX': 'PRIVMSG:1'})
+        self.assertEqual(queue.targmax, {})
+
+    def test_merge_drop(self):
+        queue, futures = self.callFTU(maxsize=2, policy='drop_oldest',
+                                      merge=True)
+        queue.set_targmax({'TARGMAX': 'PRIVMSG:'})
+        for line in ('PRIVMSG #a :hi', 'PRIVMSG #b :hi', 'PRIVMSG #c :hi'):
+            queue.put(self.loop.create_future(), line)
+        self.assertEqual(queue.pop()[1], 'PRIVMSG #b,#c :hi')
+        self.assertTrue(queue.empty())
+
+    def test_stats(self):
+        self.loop.time = MagicMock(return_value=10)
+        queue, futures = self.callFTU(['PING :1', 'PING :2'])
+        self.loop.time.return_value = 12
+        self.loop.run_until_complete(queue.get())
+        self.loop.time.return_value = 16
+        self.loop.run_until_complete(queue.get())
+        stats = queue.stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['max_depth'], 2)
+        self.assertEqual(stats['sent'], 2)
+        self.assertEqual(stats['wait_last'], 6)
+        self.assertEqual(stats['wait_max'], 6)
+        self.assertEqual(stats['wait_avg'], 4)
+
+    def test_pause(self):
+        queue, futures = self.callFTU(['PING :1'])
+        queue.pause()
+        task = self.loop.create_task(queue.get())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(task.done())
+        queue.put(self.loop.create_future(), 'PING :2')
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(task.done())
+        queue.resume()
+        self.assertEqual(self.loop.run_until_complete(task)[1], 'PING :1')
+
+
+class TestBotSendQueue(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def cancel(self, task):
+        task.cancel()
+        self.loop.run_until_complete(asyncio.wait([task]))
+
+    def test_flood_control(self):
+        now = [0]
+        sent = []
+        sleeps = []
+
+        async def sleep(delay, **kwargs):
+            sleeps.append(delay)
+            now[0] += delay
+            if now[0] == 2:
+                bot.send_line('PONG :irc.com')
+            await _original_sleep(0)
+
+        self.loop.time = lambda: now[0]
+        bot = irc3.IrcBot(loop=self.loop, level=1000, asynchronous=True,
+                          flood_burst=2, flood_rate=1, flood_rate_delay=2)
+        self.addCleanup(self.cancel, bot.awaiting_queue)
+        bot.send = lambda data: sent.append((now[0], data))
+        futures = [bot.send_line(line) for line in (
+            'PRIVMSG #a :1', 'PRIVMSG #a :2', 'PRIVMSG #a :3',
+            'PRIVMSG #b :1')]
+        with patch('irc3.asyncio.sleep', sleep):
+            self.loop.run_until_complete(asyncio.wait(futures))
+        self.assertEqual(sent, [
+            (0, 'PRIVMSG #a :1'), (0, 'PRIVMSG #b :1'),
+            (2, 'PONG :irc.com'), (4, 'PRIVMSG #a :2'),
+            (6, 'PRIVMSG #a :3')])
+        self.assertEqual(sleeps, [2, 2, 2])
+
+    def test_flood_line_bytes(self):
+        now = [0]
+        sent = []
+
+        async def sleep(delay, **kwargs):
+            now[0] += delay
+            await _original_sleep(0)
+
+        self.loop.time = lambda: now[0]
+        # ircu: 2 seconds + 1 second per 120 bytes
+        bot = irc3.IrcBot(loop=self.loop, level=1000, asynchronous=True,
+                          flood_burst=5, flood_rate=1, flood_rate_delay=2,
+                          flood_line_bytes=240)
+        self.addCleanup(self.cancel, bot.awaiting_queue)
+        bot.send = lambda data: sent.append((now[0], len(data) + 2))
+        for i in range(4):
+            f = bot.send_line('PRIVMSG #a :' + 'x' * 226)
+        with patch('irc3.asyncio.sleep', sleep):
+            self.loop.run_until_complete(f)
+        # each line costs 2 tokens
+        self.assertEqual(sent, [(0, 240), (0, 240), (2, 240), (6, 240)])
+
+    def test_flood_merge(self):
+        self.loop.time = lambda: 0
+        bot = irc3.IrcBot(loop=self.loop, level=1000, asynchronous=True,
+                          flood_burst=5, flood_line_bytes=10,
+                          send_queue_merge=True)
+        self.addCleanup(self.cancel, bot.awaiting_queue)
+        bot.queue.set_targmax({'MAXTARGETS': '3'})
+        sent = []
+        bot.send = sent.append
+        bot.privmsg('#a', 'hi')
+        f = bot.privmsg('#b', 'hi')
+        self.loop.run_until_complete(f)
+        self.assertEqual(sent, ['PRIVMSG #a,#b :hi'])
+        # the merged line is charged: 1 + 19 / 10
+        self.assertAlmostEqual(bot.bucket.tokens, 5 - 2.9)
+
+    def test_flood_ping(self):
+        self.loop.time = lambda: 0
+        bot = irc3.IrcBot(loop=self.loop, level=1000, asynchronous=True,
+                          flood_burst=5, includes=['irc3.plugins.core'])
+        self.addCleanup(self.cancel, bot.awaiting_queue)
+        sent = []
+        bot.send = sent.append
+        bot.queue.pause()
+        bot.privmsg('#a', '1')
+        f = bot.privmsg('#a', '2')
+        bot.dispatch('PING :irc.com')
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(sent, [])
+        self.assertEqual(bot.queue.peek(), 'PONG :irc.com')
+        bot.queue.resume()
+        self.loop.run_until_complete(f)
+        # the reply to the server's PING is queued ahead of the chat
+        self.assertEqual(sent, ['PONG :irc.com', 'PRIVMSG #a :1',
+                                'PRIVMSG #a :2'])
+
+    def test_flood_write_encoded(self):
+        self.loop.time = lambda: 0
+        bot = irc3.IrcBot(loop=self.loop, level=1000, asynchronous=True,
+                          flood_burst=5)
+        self.addCleanup(self.cancel, bot.awaiting_queue)
+        bot.protocol = MagicMock()
+        f = bot.privmsg('#a', 'é')
+        self.loop.run_until_complete(f)
+        # the bytes measured by the bucket are written
+        bot.protocol.write.assert_called_once_with(
+            'PRIVMSG #a :é', 'PRIVMSG #a :é\r\n'.encode('utf8'))
+
+    def test_send_queue(self):
+        bot = irc3.IrcBot(loop=self.loop, level=1000, asynchronous=True,
+                          flood_burst=0, send_queue_size=1,
+                          send_queue_policy='drop_newest')
+        self.addCleanup(self.cancel, bot.awaiting_queue)
+        bot.protocol = protocol = irc3.IrcConnection()
+        protocol.factory = bot
+        protocol.encoding = 'utf8'
+        transport = MagicMock()
+        transport.is_closing.return_value = False
+        protocol.connection_made(transport)
+
+        protocol.pause_writing()
+        self.assertTrue(bot.queue.paused)
+        f1 = bot.privmsg('#irc3', 'hello')
+        f2 = bot.privmsg('#irc3', 'world')
+        self.loop.run_until_complete(asyncio.sleep(.01))
+        self.assertFalse(f1.done())
+        self.assertFalse(f2.result())
+
+        protocol.resume_writing()
+        self.assertTrue(self.loop.run_until_complete(f1))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        transport.write.assert_called_once_with(b'PRIVMSG #irc3 :hello\r\n')
+
+    def test_send_queue_block(self):
+        bot = irc3.IrcBot(loop=self.loop, level=1000, asynchronous=True,
+                          flood_burst=0, send_queue_size=2)
+        self.addCleanup(self.cancel, bot.awaiting_queue)
+        bot.queue.pause()
+        futures = [bot.privmsg('#irc3', str(i)) for i in range(5)]
+        self.assertEqual(len(bot.queue), 2)
+        self.assertFalse(any(f.done() for f in futures[:2]))
+        self.assertFalse(any(f.result() for f in futures[2:]))
+        self.assertEqual(bot.queue.stats()['dropped'], 3)
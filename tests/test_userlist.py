@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from irc3.plugins.userlist import Channel
+from irc3.plugins import userlist
 from irc3 import testing
 
 
@@ -72,3 +74,90 @@ class TestUserList(testing.BotTestCase):
 
         bot.dispatch(':foo!u@h QUIT')
         self.assertEqual(len(plugin.nicks), 0)
+
+    def test_casefold(self):
+        bot = self.callFTU(nick='foo')
+        bot.include('irc3.plugins.core',
+                    'irc3.plugins.userlist')
+        plugin = bot.get_plugin('irc3.plugins.userlist.Userlist')
+
+        bot.dispatch(':Bar[]!u@b JOIN #Foo')
+        bot.dispatch(':Bar[]!u@b JOIN #foo{}')
+        bot.dispatch(':gawel!u@h JOIN #FOO[]')
+        self.assertEqual(len(plugin.channels), 2)
+        self.assertIn('bar{}', plugin.nicks)
+        self.assertEqual(plugin.users['BAR{}'].channels,
+                         [plugin.channels['#foo'], plugin.channels['#foo{}']])
+
+        bot.dispatch(':Bar[]!u@b NICK bar{}')
+        self.assertEqual(list(plugin.nicks), ['gawel', 'bar{}'])
+        self.assertIn('bar{}', plugin.channels['#foo'])
+        self.assertEqual(len(plugin.users['bar[]'].channels), 2)
+
+        bot.dispatch(':bar{}!u@b PART #FOO')
+        self.assertEqual(plugin.users['bar{}'].channels,
+                         [plugin.channels['#foo{}']])
+        self.assertIn('bar{}', plugin.nicks)
+
+        # the bot leave the channel. gawel is forgotten
+        bot.dispatch(':foo!u@b PART #Foo[]')
+        self.assertNotIn('gawel', plugin.nicks)
+        self.assertNotIn('gawel', plugin.users)
+
+        bot.dispatch(':BAR{}!u@b QUIT :bye')
+        self.assertEqual(len(plugin.nicks), 0)
+        self.assertEqual(len(plugin.users), 0)
+        self.assertEqual(len(plugin.channels['#foo[]']), 0)
+
+    def test_prefixes(self):
+        bot = self.callFTU(nick='foo')
+        bot.include('irc3.plugins.core', 'irc3.plugins.userlist')
+        other = self.callFTU(nick='bar')
+        other.include('irc3.plugins.core', 'irc3.plugins.userlist')
+        plugin = bot.get_plugin(userlist.Userlist)
+        channel = bot.channels['#chan']
+        channel.add('gawel', modes='@')
+        # lookups do not register prefixes
+        self.assertEqual(len(channel.modes['!']), 0)
+        channel.modes['!'].add('gawel')
+        self.assertNotIn('!', plugin.prefixes)
+        self.assertEqual(list(channel.modes), ['@'])
+        bot.dispatch(':srv 005 irc3 CHANTYPES=# PREFIX=(Yqaohv)!~&@%+ '
+                     ':are supported')
+        self.assertIn('!', plugin.prefixes)
+        channel.modes['!'].add('gawel')
+        self.assertIn('gawel', channel.modes['!'])
+        # other bots and the default map are not changed
+        self.assertNotIn('!', other.get_plugin(userlist.Userlist).prefixes)
+        self.assertNotIn('!', userlist.PREFIXES)
+        # forgotten with the connection
+        plugin.connection_lost()
+        self.assertNotIn('!', plugin.prefixes)
+        self.assertIs(bot.channels['#chan'].prefixes, plugin.prefixes)
+
+    def test_channel(self):
+        channel = Channel()
+        channel.add('gawel', modes='@+')
+        channel.add('bar')
+        channel.modes['+'].add('bar')
+        channel.modes['+'].add('unknown')
+        self.assertEqual(channel, {'gawel', 'bar'})
+        # prefixes are only given to members
+        self.assertNotIn('unknown', channel.modes['+'])
+        self.assertEqual(channel.difference({'gawel'}), {'bar'})
+        self.assertEqual(channel - {'bar'}, {'gawel'})
+        self.assertEqual(list(channel.modes), ['@', '+'])
+        self.assertEqual(dict(channel.modes.items()),
+                         {'@': {'gawel'}, '+': {'gawel', 'bar'}})
+        channel.modes['+'].remove('gawel')
+        self.assertEqual(channel.modes['+'], {'bar'})
+        self.assertRaises(KeyError, channel.modes['@'].remove, 'bar')
+
+        users = channel.users
+        self.assertIs(users['GAWEL'].channels[0], channel)
+        channel.remove('gawel')
+        channel.remove('gawel')
+        self.assertNotIn('gawel', users)
+        channel.clear()
+        self.assertEqual(len(users), 0)
+        self.assertEqual(len(channel.modes), 0)
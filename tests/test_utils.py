@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 from unittest import TestCase
 from irc3.utils import IrcString
+from irc3.utils import IrcMatch
+from irc3.utils import as_mask
 from irc3.utils import maybedotted
 from irc3.utils import split_message
+from irc3.utils import split_stream
 from irc3.utils import parse_config_env
 from irc3.utils import slugify
 from irc3.testing import ini2config
 import irc3.plugins
+import irc3.rfc
+import re
 
 
 def test_hash():
@@ -52,14 +57,44 @@ class TestUtils(TestCase):
         self.assertEqual(s.username, 'user')
         self.assertEqual(s.hostname, 'host')
 
+        self.assertIs(s.nick, s.nick)
+        self.assertIs(s.hostname, s.hostname)
+
+        s = IrcString('nick!user')
+        self.assertEqual(s.host, 'user')
+        self.assertIsNone(s.username)
+        self.assertIsNone(s.hostname)
+
         s = IrcString('#chan')
         self.assertTrue(s.is_channel)
+        self.assertIsNone(s.username)
         s = IrcString('&chan')
         self.assertTrue(s.is_channel)
 
         s = IrcString('*')
         self.assertTrue(s.is_server)
 
+    def test_ircmatch(self):
+        regexp = irc3.rfc.PRIVMSG.re.format(nick='nono')
+        match = re.match(regexp, ':g!g@g PRIVMSG #irc3 :Hi')
+        m = IrcMatch(match, client='client')
+        self.assertNotIn('tags', m)
+        self.assertIsInstance(m['data'], IrcString)
+        self.assertIsNot(m['data'], m['data'])
+        self.assertEqual(m['client'], 'client')
+        self.assertEqual(dict(m), {
+            'mask': 'g!g@g', 'event': 'PRIVMSG', 'target': '#irc3',
+            'data': 'Hi', 'client': 'client'})
+        self.assertEqual(len(m), 5)
+        self.assertRaises(KeyError, m.__getitem__, 'nick')
+
+        match = re.match(regexp, '@a=b :g!g@g PRIVMSG #irc3 :Hi')
+        m = IrcMatch(match, shared=True)
+        self.assertEqual(m['tags'], 'a=b')
+        self.assertIs(m['mask'], as_mask('g!g@g'))
+        self.assertIs(m['data'], m['data'])
+        self.assertNotIn('client', m)
+
     def test_maybedotted(self):
         self.assertTrue(
             maybedotted('irc3.plugins') is irc3.plugins)
@@ -234,6 +269,40 @@ class TestSplit(TestCase):
         ]
         self.assertEqual(result, expected)
 
+    def test_split_message_encodings(self):
+        message = 'déjà vu ' * 3 + '\U0001f600' * 3
+        self.assertEqual(list(split_message(message, 10, 'utf-8')), [
+            'déjà vu', 'déjà vu', 'déjà vu', '\U0001f600\U0001f600',
+            '\U0001f600'])
+        message = message.replace('\U0001f600', 'é')
+        self.assertEqual(list(split_message(message, 10, 'latin-1')), [
+            'déjà vu', 'déjà vu', 'déjà vu', 'ééé'])
+        self.assertEqual(list(split_message(message, 10, 'cp1252')), [
+            'déjà vu', 'déjà vu', 'déjà vu', 'ééé'])
+
+    def test_split_stream(self):
+        message = 'Qwerty uiop asdfghjkl zxcvbnm ' * 10
+        for size in (1, 3, 7, 100):
+            pieces = [message[i:i + size]
+                      for i in range(0, len(message), size)]
+            self.assertEqual(list(split_stream(pieces, 20, 'utf-8')),
+                             list(split_message(message, 20, 'utf-8')))
+        self.assertEqual(list(split_stream(iter(['  a', ' b  ']), 30, 'utf8')),
+                         ['  a b'])
+        self.assertEqual(list(split_stream([], 30, 'utf8')), [])
+        with self.assertRaisesRegex(ValueError, 'max_bytes=2'):
+            list(split_stream(['こんにちは'], 2, 'utf-8'))
+
+    def test_split_message_short(self):
+        # short messages are not encoded
+        for size in (17, 100):
+            self.assertEqual(list(split_message('  allo  ', size, 'utf-8')),
+                             ['  allo'])
+            self.assertEqual(list(split_message('\U0001f600 ' * 3, size,
+                                                'utf-8')),
+                             ['\U0001f600 \U0001f600 \U0001f600'])
+            self.assertEqual(list(split_message('   ', size, 'utf-8')), [])
+
     def test_split_message_byte_max_bytes_too_small(self):
         message = 'こんにちは'
 